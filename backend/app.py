@@ -1,16 +1,32 @@
 # backend/app.py
 # (Versão 3.1: Com correção explícita de CORS para o Vercel)
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS # Importação (sem alteração)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.pool import NullPool
 import logic
 import os
 import googlemaps
 from dotenv import load_dotenv
+import itertools
 import json
-import re
-from solver_algorithm import solve_network_design_problem 
+import math
+import time
+from contextlib import contextmanager
+import numpy as np
+from datetime import datetime
+from solver_algorithm import NEAREST_BY, prepare_network_inputs, solve_prepared_network, solver_input_hash
+from solver_aggregation import AGGREGATION_METHODS
+from solver_heuristic import SOLVER_MODES
+import distance_fetcher
+import bulk_ingest
+import distance_providers
+import matrix_store
+from distance_providers import parse_google_response
+import solver_jobs
+import solver_sweep
+import spatial_index
 
 load_dotenv() 
 
@@ -43,6 +59,32 @@ if DATABASE_URL.startswith("postgres://"):
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Pool de ligações (por processo gunicorn), configurável por deployment:
+#   DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT: ligações mantidas, extra e espera (s);
+#   DB_POOL_RECYCLE: renova ligações com mais de N s (antes de o Supabase/pooler as fechar);
+#   DB_POOL_PRE_PING: testa a ligação antes de a usar (evita erros após quedas);
+#   DB_POOL_CLASS=null: sem pool local, quando já há um pooler externo (pgbouncer/Supavisor);
+#   DB_STATEMENT_TIMEOUT_MS: limite por instrução no PostgreSQL (0 = sem limite).
+def database_engine_options(url):
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if os.environ.get('DB_POOL_CLASS', '').lower() == 'null':
+        options['poolclass'] = NullPool
+    elif not url.startswith('sqlite'):
+        options.update({
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        })
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if statement_timeout and url.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database_engine_options(DATABASE_URL)
+
 db = SQLAlchemy(app)
 
 # --- 2. DEFINIÇÃO DOS MODELOS (Sem alteração) ---
@@ -85,14 +127,49 @@ class CacheMatrixClients(db.Model):
     data = db.Column(db.Text, nullable=False)
 
 class CacheSolverFactories(db.Model):
-    __tablename__ = 'cache_solver_factories'
+    # Matriz numérica do solver em binário (.npz, ver matrix_store); substitui a
+    # antiga tabela JSON 'cache_solver_factories' (apagada por create_tables.py)
+    __tablename__ = 'cache_solver_matrix_factories'
     id = db.Column(db.Integer, primary_key=True)
-    data = db.Column(db.Text, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
 
 class CacheSolverClients(db.Model):
-    __tablename__ = 'cache_solver_clients'
+    __tablename__ = 'cache_solver_matrix_clients'
     id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+class CacheSolverResults(db.Model):
+    # Resultados do solver endereçados pelo hash do input limpo (ver solver_input_hash)
+    __tablename__ = 'cache_solver_results'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    input_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
     data = db.Column(db.Text, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class CacheDistancePairs(db.Model):
+    # Elemento da Distance Matrix por par (origem, destino, modo), com coordenadas arredondadas.
+    # Não é limpo por clear_matrix_cache: ao reconstruir a matriz só se pedem os pares em falta.
+    __tablename__ = 'cache_distance_pairs'
+    __table_args__ = (db.UniqueConstraint('origin_key', 'dest_key', 'mode', name='uq_distance_pair'),)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    origin_key = db.Column(db.String(32), nullable=False)
+    dest_key = db.Column(db.String(32), nullable=False)
+    mode = db.Column(db.String(16), nullable=False, default='driving')
+    element = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Tabelas de pontos pelo nome usado em get_points_from_db
+POINT_TABLES = {'factories': Factory, 'clients': Client, 'distribution_centers': DistributionCenter}
+
+# Índices espaciais em memória (KD-tree) por tabela de pontos, reconstruídos quando a tabela muda
+SPATIAL_INDEXES = spatial_index.IndexCache()
+
+# Limites do cache de resultados (LRU): número de entradas e tamanho total
+SOLVER_RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('SOLVER_RESULT_CACHE_MAX_ENTRIES', 100))
+SOLVER_RESULT_CACHE_MAX_BYTES = int(os.environ.get('SOLVER_RESULT_CACHE_MAX_BYTES', 100 * 1024 * 1024))
 
 # --- 3. INICIALIZAÇÃO DA BASE DE DADOS (Sem alteração) ---
 def init_db():
@@ -103,29 +180,120 @@ def init_db():
     print("✅ Base de dados e tabelas criadas com SQLAlchemy.")
 
 # --- 4. NOVAS FUNÇÕES HELPER (Sem alteração) ---
-def clear_matrix_cache():
+def clear_matrix_cache(commit=True):
+    """ Com commit=False, as remoções ficam na transação atual (confirmadas ou desfeitas com ela). """
+    SPATIAL_INDEXES.invalidate()
     try:
         db.session.query(CacheMatrixFactories).delete()
         db.session.query(CacheMatrixClients).delete()
         db.session.query(CacheSolverFactories).delete()
         db.session.query(CacheSolverClients).delete()
-        db.session.commit()
+        if commit:
+            db.session.commit()
         print("ℹ️ Todos os caches da Matriz de Distâncias foram limpos.")
     except Exception as e:
         db.session.rollback()
         print(f"❌ Erro ao limpar o cache: {e}")
 
+def get_cached_solver_result(input_hash):
+    """ Procura um resultado no cache; num acerto atualiza o LRU e devolve (result, stats). """
+    entry = CacheSolverResults.query.filter_by(input_hash=input_hash).first()
+    if not entry:
+        return None
+    try:
+        entry.hits += 1
+        entry.last_used_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Não foi possível atualizar o LRU do cache do solver: {e}")
+    cached = json.loads(entry.data)
+    return tuple(cached['result']), cached['stats']
+
+def store_solver_result(input_hash, result, stats):
+    """ Guarda um resultado ótimo no cache e aplica a expulsão LRU por número/tamanho. """
+    if result[0] != 'Optimal':
+        return
+    data = json.dumps({'result': list(result), 'stats': stats})
+    try:
+        if CacheSolverResults.query.filter_by(input_hash=input_hash).first():
+            return
+        db.session.add(CacheSolverResults(input_hash=input_hash, data=data, size_bytes=len(data)))
+        db.session.flush()
+        entries = db.session.query(CacheSolverResults.id, CacheSolverResults.size_bytes).order_by(
+            CacheSolverResults.last_used_at.desc(), CacheSolverResults.id.desc()).all()
+        kept_bytes, expired = 0, []
+        for n, (entry_id, size) in enumerate(entries):
+            if n >= SOLVER_RESULT_CACHE_MAX_ENTRIES or kept_bytes + size > SOLVER_RESULT_CACHE_MAX_BYTES:
+                expired.append(entry_id)
+            else:
+                kept_bytes += size
+        if expired:
+            db.session.query(CacheSolverResults).filter(CacheSolverResults.id.in_(expired)).delete(synchronize_session=False)
+            print(f"ℹ️ Cache do solver: {len(expired)} resultado(s) expulsos (LRU).")
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Não foi possível guardar o resultado no cache do solver: {e}")
+
+def fetch_matrix_with_pair_cache(client, origins, destinations, mode="driving", stats=None):
+    """
+    Distance Matrix origens × destinos servida do cache por par; só os pares em falta
+    são pedidos à API (em blocos, ver distance_fetcher.plan_missing_blocks) e
+    guardados. Devolve uma resposta no formato da API, como fetch_distance_matrix.
+    """
+    o_keys = [distance_fetcher.point_key(p) for p in origins]
+    d_keys = [distance_fetcher.point_key(p) for p in destinations]
+    known = {}
+    unique_o, unique_d = sorted(set(o_keys)), sorted(set(d_keys))
+    for start in range(0, len(unique_d), 500):  # limite de parâmetros por query
+        for o_key, d_key, element in db.session.query(
+                CacheDistancePairs.origin_key, CacheDistancePairs.dest_key, CacheDistancePairs.element).filter(
+                CacheDistancePairs.mode == mode,
+                CacheDistancePairs.origin_key.in_(unique_o),
+                CacheDistancePairs.dest_key.in_(unique_d[start:start + 500])):
+            known[(o_key, d_key)] = element
+
+    missing = [[(o, d) not in known for d in d_keys] for o in o_keys]
+    rows = [[json.loads(known[(o, d)]) if (o, d) in known else None for d in d_keys] for o in o_keys]
+    fetched, new_pairs = 0, {}
+    for o_idx, d_idx in distance_fetcher.plan_missing_blocks(missing):
+        block = distance_fetcher.fetch_distance_matrix(client, [origins[i] for i in o_idx],
+                                                       [destinations[j] for j in d_idx], mode=mode)
+        fetched += len(o_idx) * len(d_idx)
+        for bi, i in enumerate(o_idx):
+            for bj, j in enumerate(d_idx):
+                element = block['rows'][bi]['elements'][bj]
+                rows[i][j] = element
+                if element.get('status') == 'OK':  # erros não ficam em cache
+                    new_pairs[(o_keys[i], d_keys[j])] = element
+
+    if new_pairs:
+        try:
+            db.session.bulk_insert_mappings(CacheDistancePairs, [
+                {'origin_key': o, 'dest_key': d, 'mode': mode, 'element': json.dumps(e)}
+                for (o, d), e in new_pairs.items()])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Não foi possível guardar os pares de distâncias no cache: {e}")
+    total = len(o_keys) * len(d_keys)
+    print(f"ℹ️ Cache de pares: {total - fetched}/{total} elementos do cache, {fetched} pedidos à API.")
+    if stats is not None:
+        stats.update({'elements': total, 'cached': total - fetched, 'fetched': fetched})
+    return {'status': 'OK', 'rows': [{'elements': row} for row in rows]}
+
 def get_points_from_db(table_name):
     points, names, capacities, fixed_costs = [], [], [], []
-    
-    if table_name == 'factories':
-        all_rows = Factory.query.all()
-    elif table_name == 'clients':
-        all_rows = Client.query.all()
-    elif table_name == 'distribution_centers':
-        all_rows = DistributionCenter.query.all()
-    else:
+    model = POINT_TABLES.get(table_name)
+    if model is None:
         return [], [], [], []
+    # Só as colunas usadas, como tuplos (sem objetos ORM), por ordem de inserção (id):
+    # sem ORDER BY o PostgreSQL pode mudar a ordem depois de UPDATEs
+    columns = [model.lat, model.lng, model.w, model.address]
+    if table_name == 'distribution_centers':
+        columns.append(model.custo_fixo)
+    all_rows = db.session.execute(db.select(*columns).order_by(model.id)).all()
     if not all_rows:
         return [], [], [], [] 
     for row in all_rows:
@@ -142,6 +310,35 @@ def get_points_from_db(table_name):
             fixed_costs.append(row.custo_fixo if row.custo_fixo is not None else 0)
     return points, names, capacities, fixed_costs
 
+@contextmanager
+def read_only_transaction():
+    """
+    Transação só de leitura para rotas GET: READ ONLY no PostgreSQL e a ligação
+    volta ao pool logo no fim da leitura, sem esperar pelo teardown do pedido.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('SET TRANSACTION READ ONLY'))
+    try:
+        yield
+    finally:
+        db.session.rollback()
+
+def table_fingerprint(model):
+    """ Impressão digital barata de uma tabela de pontos: muda com inserções, remoções e edições de coordenadas. """
+    row = db.session.execute(db.select(db.func.count(model.id), db.func.max(model.id),
+                                       db.func.sum(model.lat), db.func.sum(model.lng))).one()
+    return tuple(row)
+
+def get_spatial_index(table_name):
+    """ PointIndex da tabela (ver spatial_index), reconstruído só se a tabela mudou desde a última consulta. """
+    model = POINT_TABLES[table_name]
+
+    def load():
+        rows = db.session.execute(db.select(model.id, model.lat, model.lng, model.w, model.address).order_by(model.id)).all()
+        return [{'id': r.id, 'lat': r.lat, 'lng': r.lng, 'w': r.w, 'address': r.address} for r in rows]
+
+    return SPATIAL_INDEXES.get(table_name, table_fingerprint(model), load)
+
 # --- GOOGLE MAPS (Sem alteração) ---
 try:
     gmaps_key = os.getenv("GOOGLE_MAPS_API_KEY")
@@ -155,279 +352,384 @@ except Exception as e:
     print(f"❌ Erro ao inicializar o cliente Google Maps: {e}")
     gmaps = None
 
+# Fornecedor da matriz de distâncias: 'google' ou 'haversine' (local, sem quota).
+# Por omissão usa a Google se houver chave e o Haversine caso contrário.
+DISTANCE_PROVIDER = os.environ.get('DISTANCE_PROVIDER', '').lower()
+DISTANCE_DETOUR_FACTOR = float(os.environ.get('DISTANCE_DETOUR_FACTOR', distance_providers.DEFAULT_DETOUR_FACTOR))
+DISTANCE_CALIBRATION_SAMPLES = int(os.environ.get('DISTANCE_CALIBRATION_SAMPLES', 5000))
+
+def calibrated_detour_factor(mode="driving"):
+    """ Fator de desvio calibrado com os pares já pedidos à Google (cache por par), ou None. """
+    samples = []
+    for o_key, d_key, element in db.session.query(
+            CacheDistancePairs.origin_key, CacheDistancePairs.dest_key, CacheDistancePairs.element).filter(
+            CacheDistancePairs.mode == mode).limit(DISTANCE_CALIBRATION_SAMPLES):
+        try:
+            (o_lat, o_lng), (d_lat, d_lng) = (map(float, k.split(',')) for k in (o_key, d_key))
+            km = json.loads(element)['distance']['value'] / 1000
+        except (KeyError, TypeError, ValueError):
+            continue
+        samples.append(({'lat': o_lat, 'lng': o_lng}, {'lat': d_lat, 'lng': d_lng}, km))
+    return distance_providers.calibrate_detour_factor(samples)
+
+def get_distance_provider(name=None, detour_factor=None, calibrate=False):
+    """
+    Fornecedor da matriz de distâncias pelo nome (ou DISTANCE_PROVIDER).
+    Lança ValueError para um nome inválido e RuntimeError para 'google' sem cliente inicializado.
+    """
+    name = (name or DISTANCE_PROVIDER or ('google' if gmaps else 'haversine')).lower()
+    if name == 'google':
+        if not gmaps:
+            raise RuntimeError('Serviço do Google Maps não inicializado no backend.')
+        return distance_providers.GoogleDistanceProvider(gmaps, fetch=fetch_matrix_with_pair_cache)
+    if name == 'haversine':
+        factor = detour_factor
+        if factor is None and calibrate:
+            factor = calibrated_detour_factor()
+            if factor is None:
+                print("⚠️ Sem pares da Google para calibrar o fator de desvio; a usar o valor por omissão.")
+        return distance_providers.HaversineDistanceProvider(factor or DISTANCE_DETOUR_FACTOR)
+    raise ValueError(f"Fornecedor de distâncias inválido: '{name}'. Opções: ['google', 'haversine']")
+
 # --- ROTAS (Sem alteração) ---
+def save_points(model, points, data, message):
+    """
+    Caminho comum das rotas save-*: escrita em massa dos pontos (ver bulk_ingest).
+    Modo {"mode": "replace"} (por omissão: apaga e reinsere) ou "upsert" (só as
+    diferenças); no upsert o cache de distâncias só é limpo se algo mudou.
+    """
+    mode = data.get('mode') or request.args.get('mode', 'replace')
+    counts = bulk_ingest.ingest_points(db.session, model, points, mode)
+    if mode == 'replace' or counts['inserted'] or counts['updated'] or counts['deleted']:
+        clear_matrix_cache()
+    return jsonify({'message': message, 'mode': mode, **counts})
+
 @app.route('/save-factories', methods=['POST'])
 def save_factories():
-    with app.app_context():
-        clear_matrix_cache()
-        data = request.json
-        factories = data.get('points', []) 
-        if not factories: return jsonify({'error': 'Nenhum ponto de fábrica recebido'}), 400
-        try:
-            db.session.query(Factory).delete() 
-            for factory in factories:
-                new_factory = Factory(
-                    lat=factory.get('lat'),
-                    lng=factory.get('lng'),
-                    w=factory.get('w', 1),
-                    address=factory.get('address', ''),
-                    country=factory.get('country', '')
-                )
-                db.session.add(new_factory)
-            db.session.commit()
-            return jsonify({'message': f'{len(factories)} fábricas guardadas com sucesso!'})
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': str(e)}), 500
+    data = request.json
+    factories = data.get('points', [])
+    if not factories: return jsonify({'error': 'Nenhum ponto de fábrica recebido'}), 400
+    try:
+        return save_points(Factory, factories, data, f'{len(factories)} fábricas guardadas com sucesso!')
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/save-clients', methods=['POST'])
 def save_clients():
-    with app.app_context():
-        clear_matrix_cache()
-        data = request.json
-        clients = data.get('points', [])
-        if not clients: return jsonify({'error': 'Nenhum ponto de cliente recebido'}), 400
-        try:
-            db.session.query(Client).delete()
-            for client in clients:
-                new_client = Client(
-                    lat=client.get('lat'),
-                    lng=client.get('lng'),
-                    w=client.get('w', 1),
-                    address=client.get('address', ''),
-                    country=client.get('country', '')
-                )
-                db.session.add(new_client)
-            db.session.commit()
-            return jsonify({'message': f'{len(clients)} clientes guardados com sucesso!'})
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': str(e)}), 500
+    data = request.json
+    clients = data.get('points', [])
+    if not clients: return jsonify({'error': 'Nenhum ponto de cliente recebido'}), 400
+    try:
+        return save_points(Client, clients, data, f'{len(clients)} clientes guardados com sucesso!')
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/save-distribution-centers', methods=['POST'])
 def save_distribution_centers():
-    with app.app_context():
-        clear_matrix_cache()
-        data = request.json
-        centers = data.get('points', [])
-        if not centers: return jsonify({'error': 'Nenhum ponto de CD recebido'}), 400
-        try:
-            db.session.query(DistributionCenter).delete()
-            for center in centers:
-                new_center = DistributionCenter(
-                    lat=center.get('lat'),
-                    lng=center.get('lng'),
-                    w=center.get('w', 1),
-                    address=center.get('address', ''),
-                    country=center.get('country', ''),
-                    custo_fixo=center.get('custo_fixo', 0)
-                )
-                db.session.add(new_center)
-            db.session.commit()
-            return jsonify({'message': f'{len(centers)} CDs guardados com sucesso!'})
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': str(e)}), 500
+    data = request.json
+    centers = data.get('points', [])
+    if not centers: return jsonify({'error': 'Nenhum ponto de CD recebido'}), 400
+    try:
+        return save_points(DistributionCenter, centers, data, f'{len(centers)} CDs guardados com sucesso!')
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/add-distribution-centers', methods=['POST'])
 def add_distribution_centers():
-    with app.app_context():
-        clear_matrix_cache()
-        data = request.json
-        centers = data.get('points', []) 
-        if not centers: return jsonify({'error': 'Nenhum ponto de CD recebido'}), 400
+    clear_matrix_cache()
+    data = request.json
+    centers = data.get('points', []) 
+    if not centers: return jsonify({'error': 'Nenhum ponto de CD recebido'}), 400
+    try:
+        bulk_ingest.insert_rows(db.session, DistributionCenter, bulk_ingest.point_rows(DistributionCenter, centers))
+        db.session.commit()
+        return jsonify({'message': f'{len(centers)} novo(s) CD(s) adicionado(s) com sucesso!'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+# Tabelas que aceitam importação em streaming (ver /import-points)
+IMPORT_MODELS = {'factories': Factory, 'clients': Client, 'distribution-centers': DistributionCenter}
+
+@app.route('/import-points/<string:kind>', methods=['POST'])
+def import_points(kind):
+    """
+    Importação em streaming de pontos (CSV com cabeçalho ou NDJSON, uma linha por ponto)
+    lida diretamente do corpo do pedido, sem o carregar todo em memória.
+    ?format=csv|ndjson (ou pelo Content-Type), ?mode=append|replace, ?progress=1 devolve
+    NDJSON com um evento de progresso por bloco escrito e o resumo no fim.
+    """
+    model = IMPORT_MODELS.get(kind)
+    if model is None:
+        return jsonify({'error': f"Tabela inválida: '{kind}'. Opções: {list(IMPORT_MODELS)}"}), 404
+    content_type = (request.content_type or '').lower()
+    fmt = request.args.get('format') or ('csv' if 'csv' in content_type else
+                                         'ndjson' if 'ndjson' in content_type or 'jsonl' in content_type else None)
+    if fmt not in bulk_ingest.IMPORT_FORMATS:
+        return jsonify({'error': f"Formato inválido ou em falta: use ?format= com {list(bulk_ingest.IMPORT_FORMATS)}."}), 400
+    mode = request.args.get('mode', 'append')
+    if mode not in bulk_ingest.IMPORT_MODES:
+        return jsonify({'error': f"Modo de importação inválido: '{mode}'. Opções: {list(bulk_ingest.IMPORT_MODES)}"}), 400
+
+    def run():
+        if mode == 'replace':
+            # Na transação do replace: se a importação falhar, o rollback repõe a tabela e o cache
+            clear_matrix_cache(commit=False)
+        written = 0
         try:
-            for center in centers:
-                new_center = DistributionCenter(
-                    lat=center.get('lat'),
-                    lng=center.get('lng'),
-                    w=center.get('w', 1),
-                    address=center.get('address', ''),
-                    country=center.get('country', ''),
-                    custo_fixo=center.get('custo_fixo', 0)
-                )
-                db.session.add(new_center)
-            db.session.commit()
-            return jsonify({'message': f'{len(centers)} novo(s) CD(s) adicionado(s) com sucesso!'})
+            records = bulk_ingest.iter_records(request.stream, fmt)
+            for event in bulk_ingest.stream_import(db.session, model, records, mode):
+                written = event['written']
+                yield event
         except Exception as e:
             db.session.rollback()
-            return jsonify({'error': str(e)}), 500
+            print(f"❌ Erro na importação de {kind}: {e}")
+            yield {'event': 'failed', 'written': written, 'error': str(e)}
+        finally:
+            if mode == 'append' and written:
+                clear_matrix_cache()
+
+    if request.args.get('progress', '').lower() in ('1', 'true', 'yes'):
+        return Response(stream_with_context(json.dumps(event) + '\n' for event in run()),
+                        mimetype='application/x-ndjson')
+    last = None
+    for last in run():
+        pass
+    if last is None or last['event'] == 'failed':
+        return jsonify({'error': f"Erro na importação: {last['error'] if last else 'sem dados'}"}), 500
+    last['message'] = f"{last['written']} de {last['rows']} linhas importadas ({last['errors']} com erros)."
+    return jsonify(last)
+
+# Colunas de Client pelas quais se pode agrupar o cálculo de gravidade
+GRAVITY_GROUP_COLUMNS = [c.name for c in Client.__table__.columns if c.name not in ('id', 'lat', 'lng')]
 
 @app.route('/calculate-gravity-by-country', methods=['POST'])
 def calculate_by_country():
-    with app.app_context():
-        results_by_country = {}
-        try:
-            distinct_countries = db.session.query(Client.country).distinct().all()
-            countries = [row[0] for row in distinct_countries if row[0]]
-            if not countries: return jsonify({'error': 'Não foram encontrados clientes com dados de país.'}), 404
-            for country in countries:
-                clients_in_country = Client.query.filter_by(country=country).all()
-                points = [{'lat': row.lat, 'lng': row.lng, 'w': row.w} for row in clients_in_country]
-                final_point, cost, _ = logic.calculate_from_geo_as_cartesian(points) 
-                results_by_country[country] = { 'final_point': final_point, 'total_cost': cost, 'client_count': len(points) }
-            return jsonify({ 'message': 'Cálculo por país concluído!', 'results': results_by_country })
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
-
-# --- PARSE GOOGLE (Sem alteração) ---
-def parse_google_response(response, origin_names, dest_names):
-    temp_matrix_full = []
-    temp_matrix_solver = []
-    km_regex = re.compile(r"([\d\.,]+)")
-    google_rows = response.get('rows', [])
-    for i in range(len(google_rows)):
-        new_row_full = []
-        new_row_solver = []
-        elements = google_rows[i].get('elements', [])
-        for j in range(len(elements)):
-            try:
-                element = elements[j]
-                if element['status'] == 'OK':
-                    distance_text = element['distance']['text']
-                    duration_text = element['duration']['text']
-                    new_row_full.append(f"{distance_text} ({duration_text})")
-                    match = km_regex.search(distance_text.replace(',', ''))
-                    if match:
-                        km_value = float(match.group(1))
-                        new_row_solver.append(km_value)
-                    else:
-                        new_row_solver.append(0.0) 
-                else:
-                    new_row_full.append(f"Erro: {element['status']}")
-                    new_row_solver.append(0.0)
-            except (KeyError, TypeError):
-                new_row_full.append("Erro Parse")
-                new_row_solver.append(0.0)
-        temp_matrix_full.append(new_row_full)
-        temp_matrix_solver.append(new_row_solver)
-    def transpose_matrix(matrix, row_headers, col_headers):
-        if not matrix or not matrix[0]:
-            if col_headers:
-                return [['Destino'] + col_headers]
-            return []
-        final_table = [['Destino'] + col_headers]
-        for j in range(len(row_headers)):
-            new_row = [row_headers[j]]
-            for i in range(len(col_headers)):
-                try:
-                    new_row.append(matrix[i][j])
-                except IndexError:
-                    new_row.append("Erro Transp.")
-            final_table.append(new_row)
-        return final_table
-    table_full = transpose_matrix(temp_matrix_full, dest_names, origin_names)
-    table_solver = transpose_matrix(temp_matrix_solver, dest_names, origin_names)
-    return table_full, table_solver
-
-# --- ROTA DE DISTÂNCIAS (Sem alteração) ---
+    # Agrupamento opcional: {"group_by": "<coluna>"} no corpo ou ?group_by=; por omissão 'country'
+    body = request.get_json(silent=True) or {}
+    group_by = body.get('group_by') or request.args.get('group_by', 'country')
+    if group_by not in GRAVITY_GROUP_COLUMNS:
+        return jsonify({'error': f"Coluna de agrupamento inválida: '{group_by}'. Opções: {GRAVITY_GROUP_COLUMNS}"}), 400
+    try:
+        # Uma única query; a partição por grupo é feita em memória
+        group_column = getattr(Client, group_by)
+        rows = db.session.query(group_column, Client.lat, Client.lng, Client.w).order_by(Client.id).all()
+        # Arranque a quente opcional: {"warm_start": {grupo: {"lat", "lng"}}} (p. ex. os 'results' anteriores)
+        warm_start = {k: v.get('final_point', v) for k, v in (body.get('warm_start') or {}).items()}
+        results_by_country = logic.calculate_gravity_by_group(rows, warm_start)
+        if not results_by_country: return jsonify({'error': f'Não foram encontrados clientes com dados de {group_by}.'}), 404
+        return jsonify({ 'message': 'Cálculo por país concluído!' if group_by == 'country' else f'Cálculo por {group_by} concluído!', 'group_by': group_by, 'results': results_by_country })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/calculate-cooper', methods=['POST'])
+def calculate_cooper():
+    """
+    Localização-afetação de Cooper: {"p": n.º de centros, "restarts", "seed", "max_iter"}.
+    Os centros vêm também em 'points', no formato de /add-distribution-centers:
+    capacidade "capacity" (por omissão, a procura afetada ao centro) e "custo_fixo"
+    (por omissão o de bulk_ingest); {"append": true} adiciona-os logo como CDs.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        p = int(body.get('p', 0))
+        restarts = int(body.get('restarts', logic.COOPER_RESTARTS))
+        max_iter = int(body.get('max_iter', logic.COOPER_MAX_ITER))
+        seed = int(body.get('seed', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': "'p', 'restarts', 'max_iter' e 'seed' têm de ser inteiros."}), 400
+    if p < 1:
+        return jsonify({'error': "Indique o número de centros 'p' (pelo menos 1)."}), 400
+    try:
+        rows = db.session.query(Client.lat, Client.lng, Client.w).order_by(Client.id).all()
+        if not rows: return jsonify({'error': 'Não foram encontrados clientes.'}), 404
+        result = logic.solve_cooper_haversine([{'lat': r.lat, 'lng': r.lng, 'w': r.w} for r in rows],
+                                              p, restarts, seed, max_iter)
+        result['points'] = []
+        for k, c in enumerate(result['centers']):
+            point = {'lat': c['lat'], 'lng': c['lng'], 'address': f'Candidato Cooper {k + 1}',
+                     'w': body['capacity'] if body.get('capacity') is not None else math.ceil(c['weight'])}
+            if body.get('custo_fixo') is not None:
+                point['custo_fixo'] = body['custo_fixo']
+            result['points'].append(point)
+        message = f"{len(result['centers'])} centros calculados (custo {result['cost']:,.2f})."
+        if body.get('append'):
+            clear_matrix_cache()
+            bulk_ingest.insert_rows(db.session, DistributionCenter,
+                                    bulk_ingest.point_rows(DistributionCenter, result['points']))
+            db.session.commit()
+            message += f" {len(result['points'])} novo(s) CD(s) adicionado(s)."
+        return jsonify({'message': message, **result})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+# --- ROTAS DO ÍNDICE ESPACIAL ---
+# Tabelas consultáveis pelo nome usado nas rotas (o mesmo de /import-points)
+SPATIAL_KINDS = {'factories': 'factories', 'clients': 'clients', 'distribution-centers': 'distribution_centers'}
+
+def spatial_query_results(index, km, idx):
+    """ Posições devolvidas pelo índice -> pontos da tabela com a distância em km. """
+    return [{**index.points[i], 'distance_km': round(float(d), 3)} for d, i in zip(km, idx)]
+
+@app.route('/nearest/<string:kind>', methods=['GET'])
+def nearest_points(kind):
+    """ Os k pontos da tabela mais próximos de ?lat=&lng= (?k=5 por omissão), com a distância Haversine. """
+    if kind not in SPATIAL_KINDS:
+        return jsonify({'error': f"Tabela inválida: '{kind}'. Opções: {list(SPATIAL_KINDS)}"}), 404
+    lat, lng = request.args.get('lat', type=float), request.args.get('lng', type=float)
+    k = request.args.get('k', 5, type=int)
+    if lat is None or lng is None or k is None or k < 1:
+        return jsonify({'error': "Indique ?lat= e ?lng= (graus) e, opcionalmente, ?k= (inteiro >= 1)."}), 400
+    try:
+        with read_only_transaction():
+            index = get_spatial_index(SPATIAL_KINDS[kind])
+        km, idx = index.nearest(lat, lng, k)
+        results = spatial_query_results(index, km[0], idx[0])
+        return jsonify({'count': len(results), 'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/within-radius/<string:kind>', methods=['GET'])
+def points_within_radius(kind):
+    """ Pontos da tabela a menos de ?radius_km= de ?lat=&lng=, do mais próximo para o mais afastado (?limit= opcional). """
+    if kind not in SPATIAL_KINDS:
+        return jsonify({'error': f"Tabela inválida: '{kind}'. Opções: {list(SPATIAL_KINDS)}"}), 404
+    lat, lng = request.args.get('lat', type=float), request.args.get('lng', type=float)
+    radius_km = request.args.get('radius_km', type=float)
+    limit = request.args.get('limit', type=int)
+    if lat is None or lng is None or radius_km is None or radius_km < 0:
+        return jsonify({'error': "Indique ?lat=, ?lng= (graus) e ?radius_km= (km >= 0)."}), 400
+    try:
+        with read_only_transaction():
+            index = get_spatial_index(SPATIAL_KINDS[kind])
+        km, idx = index.within_radius(lat, lng, radius_km)
+        results = spatial_query_results(index, km[:limit], idx[:limit])
+        return jsonify({'count': len(km), 'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# --- ROTA DE DISTÂNCIAS ---
 @app.route('/get-distance-matrix', methods=['GET'])
 def get_distance_matrix():
-    if not gmaps:
-        return jsonify({'error': 'Serviço do Google Maps não inicializado no backend.'}), 500
-    with app.app_context():
-        try:
-            cached_factories = CacheMatrixFactories.query.get(1)
-            cached_clients = CacheMatrixClients.query.get(1)
-            if cached_factories and cached_clients:
-                print("ℹ️ A servir matriz de distâncias (full) do cache SQLAlchemy.")
-                return jsonify({
-                    'cd_to_factories': json.loads(cached_factories.data),
-                    'cd_to_clients': json.loads(cached_clients.data),
-                    'source': 'cache'
-                })
-            print("ℹ️ Cache SQLAlchemy 'full' vazio. A contactar a API Google...")
-            origins, origin_names, _, _ = get_points_from_db('distribution_centers') 
-            dest_factories, dest_factories_names, _, _ = get_points_from_db('factories') 
-            dest_clients, dest_clients_names, _, _ = get_points_from_db('clients')
-            if not origins:
-                return jsonify({'error': 'Não há Centros de Distribuição (origens) definidos.'}), 404
-            table_factories_full, table_factories_solver = [], []
-            if dest_factories:
-                if (len(origins) * len(dest_factories) > 100):
-                     return jsonify({'error': f'Pedido Fábrica excede 100 elementos ({len(origins)} CDs x {len(dest_factories)} Fábricas). Batching para fábricas não implementado.'}), 400
-                matrix_factories = gmaps.distance_matrix(origins, dest_factories, mode="driving")
-                table_factories_full, table_factories_solver = parse_google_response(matrix_factories, origin_names, dest_factories_names)
-            table_clients_full = []
-            table_clients_solver = []
-            if dest_clients:
-                max_dest_per_batch = min(25, 100 // len(origins))
-                if max_dest_per_batch == 0:
-                    raise Exception("Não é possível fazer batching, número de Origens (CDs) excede 100.")
-                print(f"ℹ️ A iniciar processamento em lotes para {len(dest_clients)} clientes.")
-                print(f"ℹ️ {len(origins)} CDs (Origens). Tamanho máximo do lote: {max_dest_per_batch} clientes (Destinos).")
-                for i in range(0, len(dest_clients), max_dest_per_batch):
-                    dest_clients_batch = dest_clients[i:i + max_dest_per_batch]
-                    dest_clients_names_batch = dest_clients_names[i:i + max_dest_per_batch]
-                    print(f"--- Processando Lote {i // max_dest_per_batch + 1}: {len(dest_clients_batch)} clientes ---")
-                    matrix_clients_batch = gmaps.distance_matrix(origins, dest_clients_batch, mode="driving")
-                    batch_full, batch_solver = parse_google_response(matrix_clients_batch, origin_names, dest_clients_names_batch)
-                    if not table_clients_full:
-                        table_clients_full.append(batch_full[0])
-                        table_clients_solver.append(batch_solver[0])
-                    table_clients_full.extend(batch_full[1:])
-                    table_clients_solver.extend(batch_solver[1:])
-                    print(f"--- Lote {i // max_dest_per_batch + 1} concluído ---")
-            def upsert_cache(model, data):
-                cache_entry = model.query.get(1)
-                if cache_entry:
-                    cache_entry.data = data
-                else:
-                    cache_entry = model(id=1, data=data)
-                    db.session.add(cache_entry)
-            upsert_cache(CacheMatrixFactories, json.dumps(table_factories_full))
-            upsert_cache(CacheMatrixClients, json.dumps(table_clients_full))
-            upsert_cache(CacheSolverFactories, json.dumps(table_factories_solver))
-            upsert_cache(CacheSolverClients, json.dumps(table_clients_solver))
-            db.session.commit()
-            print("✅ Matrizes (Full e Solver) calculadas e guardadas no cache SQLAlchemy.")
+    # ?provider=google|haversine força o fornecedor (e recalcula, ignorando o cache);
+    # ?detour_factor=1.25 ou ?calibrate=1 ajustam o fator de desvio do Haversine
+    provider_name = request.args.get('provider')
+    try:
+        detour_factor = request.args.get('detour_factor', type=float)
+        provider = get_distance_provider(provider_name, detour_factor,
+                                         request.args.get('calibrate', '').lower() in ('1', 'true', 'yes'))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 500
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        cached_factories = db.session.get(CacheMatrixFactories, 1)
+        cached_clients = db.session.get(CacheMatrixClients, 1)
+        if cached_factories and cached_clients and not provider_name:
+            print("ℹ️ A servir matriz de distâncias (full) do cache SQLAlchemy.")
+            return jsonify({
+                'cd_to_factories': json.loads(cached_factories.data),
+                'cd_to_clients': json.loads(cached_clients.data),
+                'source': 'cache'
+            })
+        print(f"ℹ️ Cache SQLAlchemy 'full' vazio ou ignorado. A calcular com o fornecedor '{provider.name}'...")
+        origins, origin_names, _, _ = get_points_from_db('distribution_centers') 
+        dest_factories, dest_factories_names, _, _ = get_points_from_db('factories') 
+        dest_clients, dest_clients_names, _, _ = get_points_from_db('clients')
+        if not origins:
+            return jsonify({'error': 'Não há Centros de Distribuição (origens) definidos.'}), 404
+        # Uma única matriz CDs × (fábricas + clientes), repartida pelas duas tabelas
+        # (na Google: pares já conhecidos vêm do cache por par, os restantes em blocos 2-D paralelos)
+        fetch_stats = {}
+        (table_factories_full, table_factories_solver), (table_clients_full, table_clients_solver) = \
+            provider.build_tables(origins, origin_names, [(dest_factories, dest_factories_names),
+                                                          (dest_clients, dest_clients_names)], stats=fetch_stats)
+        def upsert_cache(model, data):
+            cache_entry = db.session.get(model, 1)
+            if cache_entry:
+                cache_entry.data = data
+            else:
+                cache_entry = model(id=1, data=data)
+                db.session.add(cache_entry)
+        upsert_cache(CacheMatrixFactories, json.dumps(table_factories_full))
+        upsert_cache(CacheMatrixClients, json.dumps(table_clients_full))
+        upsert_cache(CacheSolverFactories, matrix_store.pack_table(table_factories_solver))
+        upsert_cache(CacheSolverClients, matrix_store.pack_table(table_clients_solver))
+        db.session.commit()
+        print("✅ Matrizes (Full e Solver) calculadas e guardadas no cache SQLAlchemy.")
+        if provider.name == 'haversine':
             return jsonify({
                 'cd_to_factories': table_factories_full,
                 'cd_to_clients': table_clients_full,
-                'source': 'api'
+                'source': 'haversine',
+                'detour_factor': fetch_stats['detour_factor']
             })
-        except googlemaps.exceptions.ApiError as e:
-            print(f"❌ Erro da API Google: {e}")
-            return jsonify({'error': f'Erro da API Google: {e.message}'}), 500
-        except Exception as e:
-            db.session.rollback()
-            print(f"❌ Erro na API Google Distance Matrix ou processamento: {e}")
-            return jsonify({'error': f'Erro no processamento do backend: {e}'}), 500
+        return jsonify({
+            'cd_to_factories': table_factories_full,
+            'cd_to_clients': table_clients_full,
+            'source': 'api' if fetch_stats['fetched'] else 'pair-cache',
+            'elements_fetched': fetch_stats['fetched'],
+            'elements_cached': fetch_stats['cached']
+        })
+    except googlemaps.exceptions.ApiError as e:
+        print(f"❌ Erro da API Google: {e}")
+        return jsonify({'error': f'Erro da API Google: {e.message}'}), 500
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erro na API Google Distance Matrix ou processamento: {e}")
+        return jsonify({'error': f'Erro no processamento do backend: {e}'}), 500
 
 # --- ROTA PARA O SOLVER (Sem alteração) ---
 @app.route('/get-solver-data', methods=['GET'])
 def get_solver_data():
-    with app.app_context():
-        try:
-            cached_factories = CacheSolverFactories.query.get(1)
-            cached_clients = CacheSolverClients.query.get(1)
+    try:
+        with read_only_transaction():
+            cached_factories = db.session.get(CacheSolverFactories, 1)
+            cached_clients = db.session.get(CacheSolverClients, 1)
             if not cached_factories or not cached_clients:
                 return jsonify({'error': 'Dados do Solver não encontrados. Por favor, visite a página "Consultar Distâncias" primeiro para calcular as rotas.'}), 404
-            distances_factories = json.loads(cached_factories.data)
-            distances_clients = json.loads(cached_clients.data)
+            factories_blob, clients_blob = cached_factories.data, cached_clients.data
             _, factory_names, factory_capacities, _ = get_points_from_db('factories')
             _, client_names, client_demands, _ = get_points_from_db('clients')
             _, dc_names, dc_capacities, dc_fixed_costs = get_points_from_db('distribution_centers')
-            return jsonify({
-                'factory_distances': distances_factories,
-                'client_distances': distances_clients,
-                'dc_fixed_costs': dc_fixed_costs, 
-                'factory_solver': {
-                    'row_headers': factory_names,
-                    'row_capacities': factory_capacities,
-                    'col_headers': dc_names,
-                    'col_capacities': dc_capacities
-                },
-                'client_solver': {
-                    'row_headers': client_names,
-                    'row_capacities': client_demands, 
-                    'col_headers': dc_names,
-                    'col_capacities': dc_capacities
-                }
-            })
-        except Exception as e:
-            print(f"❌ Erro ao buscar dados do Solver: {e}")
-            return jsonify({'error': f'Erro no processamento do backend: {e}'}), 500
+        distances_factories = matrix_store.arrays_to_table(*matrix_store.unpack_matrix(factories_blob))
+        distances_clients = matrix_store.arrays_to_table(*matrix_store.unpack_matrix(clients_blob))
+        return jsonify({
+            'factory_distances': distances_factories,
+            'client_distances': distances_clients,
+            'dc_fixed_costs': dc_fixed_costs, 
+            'factory_solver': {
+                'row_headers': factory_names,
+                'row_capacities': factory_capacities,
+                'col_headers': dc_names,
+                'col_capacities': dc_capacities
+            },
+            'client_solver': {
+                'row_headers': client_names,
+                'row_capacities': client_demands, 
+                'col_headers': dc_names,
+                'col_capacities': dc_capacities
+            }
+        })
+    except Exception as e:
+        print(f"❌ Erro ao buscar dados do Solver: {e}")
+        return jsonify({'error': f'Erro no processamento do backend: {e}'}), 500
 
 # --- ROTA DE CARREGAR PRÉ-DEFINIÇÃO (Sem alteração) ---
 @app.route('/load-preset/<string:preset_name>', methods=['POST'])
@@ -438,127 +740,393 @@ def load_preset(preset_name):
     if not os.path.exists(file_path):
         print(f"❌ Erro: Ficheiro {preset_name}.json não encontrado.")
         return jsonify({'error': 'Ficheiro de pré-definição não encontrado.'}), 404
-    with app.app_context():
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            factories = data.get('factories', [])
-            clients = data.get('clients', [])
-            centers = data.get('distribution_centers', [])
-            clear_matrix_cache() 
-            db.session.query(Factory).delete()
-            db.session.query(Client).delete()
-            db.session.query(DistributionCenter).delete()
-            for factory in factories:
-                db.session.add(Factory(lat=factory.get('lat'), lng=factory.get('lng'), w=factory.get('w', 1), address=factory.get('address', ''), country=factory.get('country', '')))
-            for client in clients:
-                db.session.add(Client(lat=client.get('lat'), lng=client.get('lng'), w=client.get('w', 1), address=client.get('address', ''), country=client.get('country', '')))
-            for center in centers:
-                db.session.add(DistributionCenter(lat=center.get('lat'), lng=center.get('lng'), w=center.get('w', 1), address=center.get('address', ''), country=center.get('country', ''), custo_fixo=center.get('custo_fixo', 0)))
-            db.session.commit()
-            return jsonify({
-                'message': f'Cenário "{preset_name}" carregado com sucesso!',
-                'factories': factories,
-                'clients': clients,
-                'dcs': centers
-            })
-        except Exception as e:
-            db.session.rollback()
-            print(f"❌ Erro ao carregar pré-definição: {e}")
-            return jsonify({'error': f'Erro no servidor ao carregar pré-definição: {str(e)}'}), 500
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        factories = data.get('factories', [])
+        clients = data.get('clients', [])
+        centers = data.get('distribution_centers', [])
+        clear_matrix_cache() 
+        # As três tabelas numa só transação, com inserção em massa
+        for model, points in ((Factory, factories), (Client, clients), (DistributionCenter, centers)):
+            db.session.query(model).delete()
+            bulk_ingest.insert_rows(db.session, model, bulk_ingest.point_rows(model, points))
+        db.session.commit()
+        return jsonify({
+            'message': f'Cenário "{preset_name}" carregado com sucesso!',
+            'factories': factories,
+            'clients': clients,
+            'dcs': centers
+        })
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erro ao carregar pré-definição: {e}")
+        return jsonify({'error': f'Erro no servidor ao carregar pré-definição: {str(e)}'}), 500
+
+# --- HELPERS DO SOLVER ---
+def build_solver_input_from_cache():
+    """
+    Monta o input do solver a partir do cache de distâncias e das tabelas.
+    Devolve (solver_input_data, None) ou (None, (resposta_erro, código)).
+    """
+    cached_factories = db.session.get(CacheSolverFactories, 1)
+    cached_clients = db.session.get(CacheSolverClients, 1)
+    if not cached_factories or not cached_clients:
+        return None, (jsonify({'error': 'Dados do Solver não encontrados. Calcule as distâncias primeiro.'}), 404)
+    # Arrays NumPy lidos do cache binário: o solver usa-os diretamente, sem texto
+    distances_factories, _, _ = matrix_store.unpack_matrix(cached_factories.data)
+    distances_clients, _, _ = matrix_store.unpack_matrix(cached_clients.data)
+    _, factory_names, factory_capacities, _ = get_points_from_db('factories')
+    client_points, _, client_demands, _ = get_points_from_db('clients')
+    dc_points, dc_names, dc_capacities, dc_fixed_costs = get_points_from_db('distribution_centers')
+    if distances_factories.size == 0:
+        return None, (jsonify({'error': 'Matriz de custos Fábrica-CD está vazia.'}), 400)
+    if distances_clients.size == 0:
+        return None, (jsonify({'error': 'Matriz de custos CD-Cliente está vazia.'}), 400)
+    if not factory_capacities or not client_demands or not dc_capacities:
+        return None, (jsonify({'error': 'Dados de capacidade ou procura em falta.'}), 400)
+    return {
+        "costs_factory_dc": distances_factories,
+        "costs_dc_client": distances_clients,
+        "supply_factory": factory_capacities,
+        "demand_client": client_demands,
+        "capacity_dc": dc_capacities,
+        "dc_fixed_cost_list": dc_fixed_costs,
+        "transport_cost_per_km": 0.13,
+        "factory_names": factory_names, 
+        "dc_names": dc_names,
+        "dc_force_map": {},
+        "factory_min_util_map": {},
+        # Coordenadas dos clientes e CDs (pela ordem das linhas/colunas da matriz), para a
+        # agregação 'grid'/'kmeans' e para os K CDs mais próximos com "nearest_by": "location"
+        "client_points": client_points,
+        "dc_points": dc_points
+    }, None
+
+def solver_result_body(result, solver_stats, success_message):
+    """
+    Converte o tuplo do solver no JSON das rotas /run-solver e /run-scenario.
+    Devolve (corpo, código HTTP); usado tanto na resposta síncrona como nos trabalhos assíncronos.
+    """
+    (status, total_cost, alloc_ij, alloc_kj, dc_decisions) = result
+    if status not in ('Optimal', 'Feasible'):
+        return {'error': f'O solver não encontrou uma solução ótima. Status: {status}'}, 500
+    solver_stats = solver_stats or {}
+    message = f'{success_message} Custo Total: €{total_cost:,.2f}'
+    if status == 'Feasible':
+        # Limite de tempo atingido, modo heurístico ou clientes agregados: solução inteira com o gap ao limite inferior
+        gap = solver_stats.get('mip_gap')
+        if solver_stats.get('aggregation'):
+            origem = 'Solução com clientes agregados'
+        elif solver_stats.get('solver_mode') == 'heuristic':
+            origem = 'Solução heurística'
+        else:
+            origem = 'Limite do solver atingido; melhor solução encontrada'
+        message = (f'{origem}. Custo Total: €{total_cost:,.2f}'
+                   + (f' (gap {gap:.2%})' if gap is not None else ''))
+    return {
+        'message': message,
+        'status': status,
+        'total_cost_full': total_cost,
+        'objective_bound': solver_stats.get('objective_bound'),
+        'mip_gap': solver_stats.get('mip_gap'),
+        'dc_decisions': dc_decisions,
+        'factory_allocation': {
+            'status': status,
+            'matrix': alloc_ij
+        },
+        'client_allocation': {
+            'status': status,
+            'matrix': alloc_kj
+        },
+        'solver_stats': solver_stats
+    }, 200
+
+# Mensagem de sucesso por tipo de trabalho
+SOLVER_MESSAGES = {
+    'run-solver': 'Solução ótima encontrada!',
+    'run-scenario': 'Cenário calculado com sucesso!'
+}
+
+# Formato das matrizes de alocação nas respostas do solver: 'dense' (listas aninhadas,
+# por omissão) ou 'sparse' (só os fluxos não nulos, em triplos [linha, CD, quantidade])
+RESPONSE_FORMATS = ('dense', 'sparse')
+ALLOCATION_KEYS = ('factory_allocation', 'client_allocation')
+ALLOCATION_STREAM_CHUNK = int(os.environ.get('ALLOCATION_STREAM_CHUNK', 5000))  # linhas/triplos por bloco
 
-# --- ROTA PARA EXECUTAR O SOLVER (Sem alteração) ---
+def response_options(body=None):
+    """
+    (formato, streaming) pedidos com ?response_format=sparse&stream=1 ou
+    {"response_format": "sparse", "stream": true} no corpo. Lança ValueError.
+    """
+    body = body or {}
+    fmt = (request.args.get('response_format') or body.get('response_format') or 'dense').lower()
+    if fmt not in RESPONSE_FORMATS:
+        raise ValueError(f"Formato de resposta inválido: '{fmt}'. Opções: {list(RESPONSE_FORMATS)}")
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes') or bool(body.get('stream'))
+    return fmt, stream
+
+def check_solver_options(body):
+    """
+    Valida {"solver_mode": "exact"|"heuristic"|"heuristic_start"} e
+    {"client_aggregation": "threshold"|"grid"|"kmeans"} e {"nearest_by": "cost"|"location"}
+    no corpo. Lança ValueError.
+    """
+    mode = body.get('solver_mode') or 'exact'
+    if mode not in SOLVER_MODES:
+        raise ValueError(f"Modo do solver inválido: '{mode}'. Opções: {list(SOLVER_MODES)}")
+    aggregation = body.get('client_aggregation')
+    if aggregation and aggregation not in AGGREGATION_METHODS:
+        raise ValueError(f"Agregação de clientes inválida: '{aggregation}'. Opções: {list(AGGREGATION_METHODS)}")
+    nearest_by = body.get('nearest_by') or 'cost'
+    if nearest_by not in NEAREST_BY:
+        raise ValueError(f"Critério dos K CDs inválido: '{nearest_by}'. Opções: {list(NEAREST_BY)}")
+
+def allocation_shape(matrix):
+    return [len(matrix), len(matrix[0]) if len(matrix) else 0]
+
+def iter_sparse_entries(matrix, block=ALLOCATION_STREAM_CHUNK):
+    """ Triplos (linha, CD, quantidade) das células não nulas, gerados bloco de linhas a bloco de linhas. """
+    n_cols = allocation_shape(matrix)[1]
+    for start in range(0, len(matrix), block):
+        a = np.asarray(matrix[start:start + block], dtype=np.float64).reshape(-1, n_cols)
+        rows, cols = np.nonzero(a)
+        yield from zip((rows + start).tolist(), cols.tolist(), a[rows, cols].tolist())
+
+def sparse_allocation(matrix):
+    """ Matriz densa -> {'format': 'sparse', 'shape': [linhas, CDs], 'entries': [[linha, CD, quantidade], ...]}. """
+    return {'format': 'sparse', 'shape': allocation_shape(matrix), 'entries': list(iter_sparse_entries(matrix))}
+
+def format_allocations(body, fmt):
+    """ Converte as alocações do corpo de solver_result_body para o formato pedido. """
+    if fmt == 'sparse':
+        for key in ALLOCATION_KEYS:
+            if key in body:
+                body[key] = {'status': body[key]['status'], **sparse_allocation(body[key]['matrix'])}
+    return body
+
+def solver_response(body, code, fmt='dense', stream=False):
+    """
+    Resposta das rotas do solver. Com 'stream' o corpo segue em NDJSON por blocos: um
+    evento 'result' com tudo menos as matrizes, eventos 'allocation' com até
+    ALLOCATION_STREAM_CHUNK linhas (denso) ou triplos (esparso) e um evento 'end'.
+    Em stream, os triplos esparsos são gerados à medida que os blocos são enviados.
+    """
+    if not stream or code != 200:
+        return jsonify(format_allocations(body, fmt)), code
+    field = 'entries' if fmt == 'sparse' else 'matrix'
+
+    def blocks(matrix):
+        """ (início, bloco) das linhas (denso) ou dos triplos (esparso), sem montar a lista inteira. """
+        items = iter_sparse_entries(matrix) if fmt == 'sparse' else iter(matrix)
+        start = 0
+        while True:
+            block = list(itertools.islice(items, ALLOCATION_STREAM_CHUNK))
+            if not block:
+                return
+            yield start, block
+            start += len(block)
+
+    def chunks():
+        head = {k: v for k, v in body.items() if k not in ALLOCATION_KEYS}
+        for key in ALLOCATION_KEYS:
+            head[key] = {'status': body[key]['status']}
+            if fmt == 'sparse':
+                head[key].update(format='sparse', shape=allocation_shape(body[key]['matrix']))
+        yield json.dumps({'event': 'result', **head}) + '\n'
+        for key in ALLOCATION_KEYS:
+            for start, block in blocks(body[key]['matrix']):
+                yield json.dumps({'event': 'allocation', 'allocation': key, 'start': start, field: block}) + '\n'
+        yield json.dumps({'event': 'end'}) + '\n'
+
+    return Response(chunks(), mimetype='application/x-ndjson'), code
+
+def wants_async(body=None):
+    """ Modo assíncrono pedido com ?async=1 ou {"async": true} no corpo. """
+    flag = request.args.get('async', '')
+    return flag.lower() in ('1', 'true', 'yes') or bool((body or {}).get('async'))
+
+def solve_or_submit(kind, solver_input_data, run_async, fmt='dense', stream=False):
+    """
+    Caminho comum de /run-solver e /run-scenario: serve do cache de resultados se o
+    input (limpo) já foi resolvido; senão resolve já ou submete um trabalho assíncrono.
+    'fmt'/'stream' escolhem o formato da resposta síncrona (ver solver_response).
+    Os dados são limpos uma única vez: a mesma limpeza serve o hash e a resolução.
+    """
+    try:
+        inp = prepare_network_inputs(solver_input_data)
+    except Exception as e:
+        # Mesmo caminho que solve_network_design_problem: 'Erro de Dados', sem cache nem trabalho
+        print(f"❌ Erro na limpeza ou extração de dados: {e}")
+        body, code = solver_result_body(("Erro de Dados", 0.0, [[]], [[]], {}), {}, SOLVER_MESSAGES[kind])
+        return solver_response(body, code, fmt, stream)
+    input_hash = solver_input_hash(solver_input_data, inp)
+    cached = get_cached_solver_result(input_hash)
+    if cached:
+        print(f"ℹ️ A servir resultado do solver do cache ({input_hash[:12]}...).")
+        body, code = solver_result_body(cached[0], cached[1], SOLVER_MESSAGES[kind])
+        body.update({'source': 'cache', 'input_hash': input_hash})
+        return solver_response(body, code, fmt, stream)
+    if run_async:
+        return submit_solver_job(kind, solver_input_data, input_hash)
+    solver_stats = {}
+    print(f"ℹ️ A iniciar o solver ({solver_input_data.get('solver_backend', 'pulp')}) (Modelo de Network Design)...")
+    result = solve_prepared_network(inp, solver_input_data, solver_stats)
+    store_solver_result(input_hash, result, solver_stats)
+    body, code = solver_result_body(result, solver_stats, SOLVER_MESSAGES[kind])
+    body.update({'source': 'solver', 'input_hash': input_hash})
+    return solver_response(body, code, fmt, stream)
+
+def submit_solver_job(kind, solver_input_data, input_hash=None):
+    """ Submete ao pool de processos e responde logo 202 com o job_id. """
+    try:
+        job_id, deduplicated = solver_jobs.submit_job(kind, solver_input_data, input_hash)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify({
+        'message': 'Trabalho do solver submetido.' if not deduplicated else 'Cenário idêntico já em execução; a reutilizar o trabalho.',
+        'job_id': job_id,
+        'deduplicated': deduplicated,
+        'status_url': f'/solver-jobs/{job_id}'
+    }), 202
+
+# --- ROTA PARA EXECUTAR O SOLVER ---
 @app.route('/run-solver', methods=['POST'])
 def run_solver():
     print("ℹ️ Rota /run-solver foi chamada (Modelo Unificado).")
-    with app.app_context():
+    try:
+        solver_input_data, error = build_solver_input_from_cache()
+        if error:
+            return error
+        # Opções do solver (opcionais): {"presolve": true, "k_nearest_dcs": K, "nearest_by": "cost"|"location",
+        # "solver_backend": "pulp"|"matrix",
+        # "solver_mode": "exact"|"heuristic"|"heuristic_start", "warm_start": <resposta anterior>, "reuse_model": true,
+        # "client_aggregation": "threshold"|"grid"|"kmeans", "aggregation_km": km, "aggregation_clusters": n,
+        # "time_limit_s": s, "mip_gap": 0.01, "mip_gap_abs": €, "threads": n}
+        # e da resposta: {"response_format": "dense"|"sparse", "stream": true}
+        options = request.get_json(silent=True) or {}
         try:
-            cached_factories = CacheSolverFactories.query.get(1)
-            cached_clients = CacheSolverClients.query.get(1)
-            if not cached_factories or not cached_clients:
-                return jsonify({'error': 'Dados do Solver não encontrados. Calcule as distâncias primeiro.'}), 404
-            distances_factories = json.loads(cached_factories.data)
-            distances_clients = json.loads(cached_clients.data)
-            _, factory_names, factory_capacities, _ = get_points_from_db('factories')
-            _, _, client_demands, _ = get_points_from_db('clients')
-            _, dc_names, dc_capacities, dc_fixed_costs = get_points_from_db('distribution_centers')
-            if not distances_factories or len(distances_factories) <= 1:
-                return jsonify({'error': 'Matriz de custos Fábrica-CD está vazia.'}), 400
-            if not distances_clients or len(distances_clients) <= 1:
-                return jsonify({'error': 'Matriz de custos CD-Cliente está vazia.'}), 400
-            if not factory_capacities or not client_demands or not dc_capacities:
-                 return jsonify({'error': 'Dados de capacidade ou procura em falta.'}), 400
-            solver_input_data = {
-                "costs_factory_dc": distances_factories,
-                "costs_dc_client": distances_clients,
-                "supply_factory": factory_capacities,
-                "demand_client": client_demands,
-                "capacity_dc": dc_capacities,
-                "dc_fixed_cost_list": dc_fixed_costs,
-                "transport_cost_per_km": 0.13,
-                "factory_names": factory_names, 
-                "dc_names": dc_names,
-                "dc_force_map": {},
-                "factory_min_util_map": {}
-            }
-            (status, total_cost, alloc_ij, alloc_kj, dc_decisions) = solve_network_design_problem(
-                solver_input_data
-            )
-            if status != 'Optimal':
-                 return jsonify({
-                    'error': f'O solver não encontrou uma solução ótima. Status: {status}',
-                }), 500
-            return jsonify({
-                'message': f'Solução ótima encontrada! Custo Total: €{total_cost:,.2f}',
-                'total_cost_full': total_cost,
-                'dc_decisions': dc_decisions,
-                'factory_allocation': {
-                    'status': status,
-                    'matrix': alloc_ij
-                },
-                'client_allocation': {
-                    'status': status,
-                    'matrix': alloc_kj
-                }
-            })
-        except Exception as e:
-            db.session.rollback()
-            print(f"❌ Erro crítico na rota /run-solver: {e}")
-            return jsonify({'error': f'Erro no backend ao executar o solver: {str(e)}'}), 500
+            fmt, stream = response_options(options)
+            check_solver_options(options)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        for key in ('presolve', 'k_nearest_dcs', 'nearest_by', 'solver_backend', 'solver_mode', 'warm_start', 'reuse_model',
+                    'client_aggregation', 'aggregation_km', 'aggregation_clusters', 'aggregation_seed',
+                    'time_limit_s', 'mip_gap', 'mip_gap_abs', 'threads'):
+            if key in options:
+                solver_input_data[key] = options[key]
+        return solve_or_submit('run-solver', solver_input_data, wants_async(options), fmt, stream)
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erro crítico na rota /run-solver: {e}")
+        return jsonify({'error': f'Erro no backend ao executar o solver: {str(e)}'}), 500
 
-# --- ROTA PARA CENÁRIOS (Sem alteração) ---
+# --- ROTA PARA CENÁRIOS ---
 @app.route('/run-scenario', methods=['POST'])
 def run_scenario():
     print("ℹ️ Rota /run-scenario foi chamada.")
-    with app.app_context():
+    try:
+        data = request.json
+        if not data:
+            return jsonify({'error': 'Nenhum dado de cenário recebido.'}), 400
         try:
-            data = request.json
-            if not data:
-                return jsonify({'error': 'Nenhum dado de cenário recebido.'}), 400
-            (status, total_cost, alloc_ij, alloc_kj, dc_decisions) = solve_network_design_problem(
-                data
-            )
-            if status != 'Optimal':
-                 return jsonify({
-                    'error': f'O solver não encontrou uma solução ótima. Status: {status}',
-                }), 500
-            return jsonify({
-                'message': f'Cenário calculado com sucesso! Custo Total: €{total_cost:,.2f}',
-                'total_cost_full': total_cost,
-                'dc_decisions': dc_decisions,
-                'factory_allocation': {
-                    'status': status,
-                    'matrix': alloc_ij
-                },
-                'client_allocation': {
-                    'status': status,
-                    'matrix': alloc_kj
-                }
-            })
-        except Exception as e:
-            db.session.rollback()
-            print(f"❌ Erro crítico na rota /run-scenario: {e}")
-            return jsonify({'error': f'Erro no backend ao executar o solver: {str(e)}'}), 500
+            fmt, stream = response_options(data)
+            check_solver_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        solver_input_data = {k: v for k, v in data.items() if k not in ('async', 'response_format', 'stream')}
+        return solve_or_submit('run-scenario', solver_input_data, wants_async(data), fmt, stream)
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erro crítico na rota /run-scenario: {e}")
+        return jsonify({'error': f'Erro no backend ao executar o solver: {str(e)}'}), 500
+
+@app.route('/run-scenario-sweep', methods=['POST'])
+def run_scenario_sweep():
+    """
+    Varrimento de cenários: {'base': {...} (opcional, por omissão os dados do cache),
+    'overrides': [{...}, ...] e/ou 'grid': {parâmetro: [valores]}, 'max_workers': n (1 a SWEEP_WORKERS)}.
+    """
+    print("ℹ️ Rota /run-scenario-sweep foi chamada.")
+    try:
+        data = request.json or {}
+        base = data.get('base')
+        if not base:
+            base, error = build_solver_input_from_cache()
+            if error:
+                return error
+        variants = solver_sweep.expand_variants(data.get('overrides'), data.get('grid'))
+        t0 = time.perf_counter()
+        try:
+            rows = solver_sweep.run_sweep(base, variants, data.get('max_workers'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        solved = [row for row in rows if row['total_cost'] is not None]
+        optimal = sum(1 for row in solved if row['status'] == 'Optimal')
+        best = min(solved, key=lambda row: row['total_cost'])['variant'] if solved else None
+        return jsonify({
+            'message': f'{len(rows)} cenários calculados ({optimal} com solução ótima).',
+            'variants': len(rows),
+            'best_variant': best,
+            'elapsed_s': round(time.perf_counter() - t0, 3),
+            'results': rows
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erro crítico na rota /run-scenario-sweep: {e}")
+        return jsonify({'error': f'Erro no backend ao executar o varrimento: {str(e)}'}), 500
+
+# --- ROTAS DOS TRABALHOS ASSÍNCRONOS DO SOLVER ---
+@app.route('/solver-jobs/<string:job_id>', methods=['GET'])
+def get_solver_job(job_id):
+    job = solver_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': f'Trabalho {job_id} não encontrado.'}), 404
+    response = {k: job[k] for k in ('job_id', 'kind', 'status', 'progress', 'elapsed_s', 'incumbents')}
+    if job['status'] == 'done':
+        if job['input_hash']:
+            store_solver_result(job['input_hash'], job['result'], job['stats'])
+        body, code = solver_result_body(job['result'], job['stats'], SOLVER_MESSAGES[job['kind']])
+        body.update({'source': 'solver', 'input_hash': job['input_hash']})
+        try:
+            fmt, _ = response_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response['result'] = format_allocations(body, fmt)
+        response['result_status_code'] = code
+    elif job['status'] == 'failed':
+        response['error'] = f"Erro no backend ao executar o solver: {job['error']}"
+    return jsonify(response)
+
+@app.route('/solver-jobs/<string:job_id>/events', methods=['GET'])
+def stream_solver_job(job_id):
+    """
+    Server-Sent Events do trabalho: um evento 'incumbent' por melhoria da solução
+    ou do limite ({time_s, objective, bound, gap}) e um evento final 'done'/'failed'.
+    """
+    if solver_jobs.get_job(job_id) is None:
+        return jsonify({'error': f'Trabalho {job_id} não encontrado.'}), 404
+
+    def events():
+        sent = 0
+        while True:
+            job = solver_jobs.get_job(job_id)
+            if job is None:
+                return
+            for event in job['incumbents'][sent:]:
+                yield f"event: incumbent\ndata: {json.dumps(event)}\n\n"
+            sent = len(job['incumbents'])
+            if job['status'] in ('done', 'failed'):
+                final = {'job_id': job_id, 'status': job['status'], 'error': job['error']}
+                yield f"event: {job['status']}\ndata: {json.dumps(final)}\n\n"
+                return
+            time.sleep(0.5)
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/solver-jobs', methods=['GET'])
+def list_solver_jobs():
+    return jsonify({'jobs': solver_jobs.list_jobs()})
 
 
 # --- ROTA DE INICIALIZAÇÃO DA BD (Sem alteração) ---
@@ -0,0 +1,767 @@
+# backend/benchmarks.py
+# Benchmarks de desempenho do backend (executar à mão, não faz parte da API).
+#
+# Uso:
+#   python benchmarks.py weiszfeld --sizes 1000 10000 100000
+#   python benchmarks.py weiszfeld-warm --sizes 1000 10000
+#   python benchmarks.py presolve --factories 5 --dcs 20 --clients 150 --k 4
+#   python benchmarks.py model-build --factories 10 --dcs 200 --clients 2000
+#   python benchmarks.py sweep --factories 5 --dcs 20 --clients 300 --scenarios 20
+#   python benchmarks.py distance-fetch --dcs 120 --destinations 400 --latency 0.1
+#   python benchmarks.py distance-providers --dcs 200 --destinations 5000
+#   python benchmarks.py matrix-store --dcs 200 --clients 5000
+#   python benchmarks.py bulk-ingest --rows 50000 [--database-url postgresql://...]
+#   python benchmarks.py clean-number --clients 2000 --dcs 200
+#   python benchmarks.py allocation-response --clients 5000 --dcs 200
+#   python benchmarks.py heuristic --factories 5 --dcs 40 --clients 600 [--time-limit 600]
+#   python benchmarks.py aggregation --clients 3000 --cities 60 --dcs 20 [--mode heuristic]
+#   python benchmarks.py cooper --sizes 1000 10000 --p 10 --restarts 1 8 32
+#   python benchmarks.py spatial-index --points 100000 --queries 1000 --k 5 --radius-km 50
+#   python benchmarks.py suite --sizes small medium [10x200x20000] --seed 1 --report report.json [--baseline old.json]
+#   python benchmarks.py load-test --clients 500 --requests 200 --concurrency 8 [--database-url ...]
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import threading
+import os
+import tempfile
+import time
+
+import numpy as np
+import pulp
+
+import distance_fetcher
+import distance_providers
+import logic
+import matrix_store
+import solver_matrix
+import solver_sweep
+import spatial_index
+import synthetic_network
+from solver_algorithm import build_pulp_model, clean_number, cost_matrix, dense_network, prepare_network_inputs, presolve_network, solve_network_design_problem, solve_prepared_network, solver_input_hash
+
+
+def random_points(n, seed=42):
+    """ Gera n clientes aleatórios à volta da Península Ibérica (formato da API). """
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(36.0, 43.5, n)
+    lngs = rng.uniform(-9.5, 3.0, n)
+    ws = rng.integers(1, 1000, n)
+    return [{'lat': float(lats[i]), 'lng': float(lngs[i]), 'w': int(ws[i])} for i in range(n)]
+
+
+def random_network(n_factories, n_dcs, n_clients, seed=42, road_factor=distance_providers.DEFAULT_DETOUR_FACTOR, n_cities=None):
+    """
+    Input do solver de uma rede sintética (synthetic_network, o mesmo gerador da suite):
+    tabelas de custos com cabeçalhos, capacidades, procuras, custos fixos e as
+    coordenadas dos clientes e dos CDs. As distâncias são Haversine × road_factor.
+    Os clientes concentram-se à volta de n_cities cidades (por omissão, uma por 50 clientes).
+    """
+    scenario = synthetic_network.generate_scenario(n_factories, n_dcs, n_clients, seed, n_cities)
+    return synthetic_network.solver_input(scenario, synthetic_network.cost_matrices(scenario, road_factor))
+
+
+def timed(fn, *args, repeat=1):
+    """ Executa fn(*args) 'repeat' vezes e devolve (melhor tempo em s, resultado). """
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench_weiszfeld(sizes, repeat=1):
+    """ Compara o Weiszfeld Haversine em ciclo Python com o motor NumPy. """
+    print(f"{'pontos':>8} | {'ciclo (s)':>10} | {'numpy (s)':>10} | {'speedup':>8} | {'desvio (m)':>10} | {'Δcusto':>8}")
+    print("-" * 70)
+    for n in sizes:
+        points = random_points(n)
+        t_loop, (p_loop, c_loop, _) = timed(logic.calculate_weiszfeld_haversine, points, repeat=repeat)
+        t_np, (p_np, c_np, _) = timed(logic.calculate_weiszfeld_haversine_np, points, repeat=repeat)
+        desvio_m = logic.haversine_distance(p_loop, p_np) * 1000
+        print(f"{n:>8} | {t_loop:>10.4f} | {t_np:>10.4f} | {t_loop / t_np:>7.1f}x | {desvio_m:>10.4f} | {abs(c_loop - c_np):>8.2f}")
+
+
+def bench_weiszfeld_warm(sizes, edit_fraction=0.01):
+    """
+    Iterações do Weiszfeld simples vs acelerado (a frio e a quente) depois de
+    editar ligeiramente uma fração dos clientes e recalcular o centróide.
+    """
+    print(f"{'pontos':>8} | {'simples':>8} | {'acel. frio':>10} | {'acel. quente':>12} | {'Δcusto quente':>13}")
+    print("-" * 64)
+    rng = np.random.default_rng(7)
+    for n in sizes:
+        points = random_points(n)
+        anterior = logic.solve_weiszfeld_haversine(points, log_mode=logic.LOG_OFF)
+
+        editados = [dict(p) for p in points]
+        for i in rng.choice(n, max(1, int(n * edit_fraction)), replace=False):
+            editados[i]['w'] = editados[i]['w'] * rng.uniform(0.5, 2.0)
+            editados[i]['lat'] += rng.normal(0, 0.05)
+
+        _, c_simples, trace = logic.calculate_weiszfeld_haversine_np(editados, logic.LOG_TRACE)
+        it_simples = len(trace)
+        frio = logic.solve_weiszfeld_haversine(editados, log_mode=logic.LOG_OFF)
+        quente = logic.solve_weiszfeld_haversine(editados, start=anterior['point'], log_mode=logic.LOG_OFF)
+        print(f"{n:>8} | {it_simples:>8} | {frio['iterations']:>10} | {quente['iterations']:>12} | {quente['cost'] - c_simples:>13.2f}")
+
+
+def bench_presolve(n_factories, n_dcs, n_clients, k_nearest, closed_fraction=0.1):
+    """ Construção e resolução do MILP: modelo denso vs presolve (exato e com K mais próximos). """
+    base = random_network(n_factories, n_dcs, n_clients)
+    base['dc_force_map'] = {name: 0 for name in base['dc_names'][:int(n_dcs * closed_fraction)]}
+    variantes = [
+        ("denso", {'presolve': False}),
+        ("presolve", {'presolve': True}),
+        (f"presolve K={k_nearest}", {'presolve': True, 'k_nearest_dcs': k_nearest}),
+    ]
+    print(f"{'modelo':>14} | {'variáveis':>9} | {'restrições':>10} | {'build (s)':>9} | {'solve (s)':>9} | {'custo':>14}")
+    print("-" * 80)
+    for nome, opcoes in variantes:
+        stats = {}
+        status, custo, _, _, _ = solve_network_design_problem({**base, **opcoes}, stats)
+        p = stats['presolve']
+        print(f"{nome:>14} | {p['variables']:>9} | {p['constraints']:>10} | {stats['build_time_s']:>9.3f} | "
+              f"{stats['solve_time_s']:>9.3f} | {custo:>14,.2f} {'' if status == 'Optimal' else status}")
+
+
+def bench_model_build(n_factories, n_dcs, n_clients):
+    """
+    Tempo de construção do modelo (sem resolver): PuLP termo a termo + writeMPS
+    (o que prob.solve() faz antes de chamar o CBC) vs backend matricial + write_mps.
+    """
+    base = random_network(n_factories, n_dcs, n_clients)
+    inp = prepare_network_inputs(base)
+    pre = dense_network(n_factories, n_dcs, n_clients, inp['dc_names'], {})
+    print(f"ℹ️ {n_factories} fábricas × {n_dcs} CDs × {n_clients} clientes: "
+          f"{len(pre['lanes_ij']) + len(pre['lanes_kj']) + n_dcs} variáveis")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.mps")
+
+        def pulp_build():
+            prob, _, _, _ = build_pulp_model(inp, pre)
+            prob.writeMPS(path)
+
+        def matrix_build():
+            solver_matrix.write_mps(path, solver_matrix.build_network_matrices(inp, pre))
+
+        t_pulp, _ = timed(pulp_build)
+        t_matrix, _ = timed(matrix_build)
+    print(f"{'backend':>8} | {'build (s)':>9}")
+    print("-" * 22)
+    print(f"{'pulp':>8} | {t_pulp:>9.3f}")
+    print(f"{'matrix':>8} | {t_matrix:>9.3f}   ({t_pulp / t_matrix:.1f}x)")
+
+
+def bench_sweep(n_factories, n_dcs, n_clients, n_scenarios, workers=None):
+    """ N cenários: chamadas /run-scenario sequenciais (limpeza repetida) vs varrimento em paralelo. """
+    base = random_network(n_factories, n_dcs, n_clients)
+    variants = [{'transport_cost_per_km': round(0.08 + 0.01 * n, 2)} for n in range(n_scenarios)]
+
+    def sequencial():
+        return [solve_network_design_problem({**base, **v})[1] for v in variants]
+
+    t_seq, custos_seq = timed(sequencial)
+    t_sweep, rows = timed(solver_sweep.run_sweep, base, variants, workers)
+    desvio = max(abs(a - row['total_cost']) for a, row in zip(custos_seq, rows))
+    print(f"{'modo':>11} | {'tempo (s)':>9}")
+    print("-" * 24)
+    print(f"{'sequencial':>11} | {t_seq:>9.3f}")
+    print(f"{'varrimento':>11} | {t_sweep:>9.3f}   ({t_seq / t_sweep:.1f}x, Δcusto máx. {desvio:.2e})")
+
+
+def bench_distance_fetch(n_dcs, n_destinations, latency_s, failure_rate, workers, elements_per_second):
+    """
+    Distance Matrix com o cliente local (sem rede): pedidos em série vs blocos 2-D
+    em paralelo. Com latência fixa por pedido, o tempo passa a depender da quota.
+    """
+    origins = [{'lat': p['lat'], 'lng': p['lng']} for p in random_points(n_dcs, seed=1)]
+    destinations = [{'lat': p['lat'], 'lng': p['lng']} for p in random_points(n_destinations, seed=2)]
+    print(f"{'workers':>8} | {'blocos':>6} | {'pedidos':>7} | {'tempo (s)':>9}")
+    print("-" * 42)
+    resultados = []
+    for n in (1, workers):
+        client = distance_fetcher.StubDistanceClient(latency_s=latency_s, failure_rate=failure_rate)
+        stats = {}
+        resposta = distance_fetcher.fetch_distance_matrix(client, origins, destinations, workers=n,
+                                                          elements_per_second=elements_per_second,
+                                                          backoff_s=0.01, stats=stats)
+        resultados.append(resposta)
+        print(f"{n:>8} | {stats['tiles']:>6} | {client.requests:>7} | {stats['time_s']:>9.3f}")
+    iguais = resultados[0]['rows'] == resultados[1]['rows']
+    print(f"ℹ️ Matrizes idênticas: {iguais}")
+
+
+def bench_distance_providers(n_dcs, n_destinations, latency_s):
+    """
+    Matriz CDs × destinos: Google (cliente local com latência, blocos paralelos)
+    vs Haversine × fator de desvio calibrado com os pares da Google.
+    """
+    origins = [{'lat': p['lat'], 'lng': p['lng']} for p in random_points(n_dcs, seed=1)]
+    destinations = [{'lat': p['lat'], 'lng': p['lng']} for p in random_points(n_destinations, seed=2)]
+    names_o = [f"CD {i}" for i in range(n_dcs)]
+    groups = [(destinations, [f"Cliente {j}" for j in range(n_destinations)])]
+    google = distance_providers.GoogleDistanceProvider(distance_fetcher.StubDistanceClient(latency_s=latency_s))
+    t_google, [(_, solver_google)] = timed(google.build_tables, origins, names_o, groups)
+    matrix = np.array([row[1:] for row in solver_google[1:]]).T
+    samples = [(o, d, matrix[i, j]) for i, o in enumerate(origins[:10]) for j, d in enumerate(destinations[:100])]
+    haversine = distance_providers.HaversineDistanceProvider(distance_providers.calibrate_detour_factor(samples))
+    t_haversine, [(_, solver_haversine)] = timed(haversine.build_tables, origins, names_o, groups)
+    erro = np.abs(np.array([row[1:] for row in solver_haversine[1:]]).T - matrix)
+    print(f"{'fornecedor':>10} | {'tempo (s)':>9}")
+    print("-" * 24)
+    print(f"{'google':>10} | {t_google:>9.3f}")
+    print(f"{'haversine':>10} | {t_haversine:>9.3f}")
+    print(f"ℹ️ Fator calibrado: {haversine.detour_factor:.4f}; erro máximo {erro.max():.2f} km, "
+          f"speedup {t_google / t_haversine:.0f}x")
+
+
+def bench_matrix_store(n_dcs, n_clients, repeat=3):
+    """
+    Leitura da matriz do solver guardada no cache: texto JSON + clean_number por
+    célula (formato antigo) vs blob .npz lido diretamente para NumPy.
+    """
+    rng = np.random.default_rng(0)
+    table = [['Destino'] + [f"CD {j}" for j in range(n_dcs)]] + \
+            [[f"Cliente {k}"] + np.round(rng.uniform(1, 2000, n_dcs), 1).tolist() for k in range(n_clients)]
+    texto = json.dumps(table)
+    print(f"{'formato':>12} | {'tamanho (MB)':>12} | {'leitura (s)':>11}")
+    print("-" * 42)
+    t, ref = timed(lambda: cost_matrix(json.loads(texto)), repeat=repeat)
+    print(f"{'json':>12} | {len(texto) / 1e6:>12.2f} | {t:>11.4f}")
+    for nome, dtype, compress in (('npz', 'float64', False), ('npz+zip', 'float64', True), ('npz f32+zip', 'float32', True)):
+        blob = matrix_store.pack_table(table, dtype=dtype, compress=compress)
+        t, (values, _, _) = timed(matrix_store.unpack_matrix, blob, repeat=repeat)
+        print(f"{nome:>12} | {len(blob) / 1e6:>12.2f} | {t:>11.4f}  (erro máx. {np.abs(values - ref).max():.1e})")
+
+
+def bench_bulk_ingest(n_rows, database_url=None, changed_fraction=0.01):
+    """
+    Escrita de clientes: ORM (session.add por ponto) vs bulk_ingest (replace e
+    upsert sem/com alterações), em linhas por segundo. Usa a BD de 'database_url'
+    (p. ex. PostgreSQL) ou um SQLite temporário. ATENÇÃO: apaga a tabela de clientes.
+    """
+    if database_url is None:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    import app as backend  # a configuração da BD é lida no import
+    import bulk_ingest
+    pontos = [{'lat': p['lat'], 'lng': p['lng'], 'w': p['w'], 'address': f"Cliente {n}, PT", 'country': 'PT'}
+              for n, p in enumerate(random_points(n_rows, seed=3))]
+    alterados = [dict(p, w=p['w'] + 1) if n % max(1, int(1 / changed_fraction)) == 0 else p
+                 for n, p in enumerate(pontos)]
+    with backend.app.app_context():
+        backend.db.create_all()
+        session = backend.db.session
+
+        def orm():
+            session.query(backend.Client).delete()
+            for p in pontos:
+                session.add(backend.Client(**p))
+            session.commit()
+
+        casos = [('orm', orm),
+                 ('replace', lambda: bulk_ingest.ingest_points(session, backend.Client, pontos, 'replace')),
+                 ('upsert (igual)', lambda: bulk_ingest.ingest_points(session, backend.Client, pontos, 'upsert')),
+                 (f'upsert ({changed_fraction:.0%})', lambda: bulk_ingest.ingest_points(session, backend.Client, alterados, 'upsert'))]
+        print(f"ℹ️ {session.get_bind().dialect.name}, {n_rows} linhas")
+        print(f"{'modo':>14} | {'tempo (s)':>9} | {'linhas/s':>10} | escritas")
+        print("-" * 60)
+        for nome, fn in casos:
+            t, counts = timed(fn)
+            escritas = '' if counts is None else {k: v for k, v in counts.items() if v}
+            print(f"{nome:>14} | {t:>9.3f} | {n_rows / t:>10,.0f} | {escritas}")
+        session.query(backend.Client).delete()
+        session.commit()
+
+
+def bench_clean_number(n_clients, n_dcs, repeat=3):
+    """
+    Limpeza da matriz de custos: clean_number célula a célula vs clean_number_array,
+    para uma matriz numérica (JSON) e uma em texto ('1.234,5'). A equivalência bit a bit
+    com valores aleatórios e casos-limite está em tests/test_clean_number.py.
+    """
+    rng = np.random.default_rng(0)
+    km = np.round(rng.uniform(1, 5000, (n_clients, n_dcs)), 1)
+    numerica = [['Destino'] + [f"CD {j}" for j in range(n_dcs)]] + \
+               [[f"Cliente {k}"] + row for k, row in enumerate(km.tolist())]
+    texto = [numerica[0]] + [[row[0]] + [f"{v:,.1f}".replace(',', ' ').replace('.', ',').replace(' ', '.') for v in row[1:]]
+                             for row in numerica[1:]]
+
+    def escalar(table):
+        return np.array([[clean_number(c) for c in row[1:]] for row in table[1:]], dtype=np.float64)
+
+    print(f"{'matriz':>8} | {'escalar (s)':>11} | {'vetorizado (s)':>14} | iguais")
+    print("-" * 52)
+    for nome, table in (('números', numerica), ('texto', texto)):
+        t_esc, ref = timed(escalar, table, repeat=repeat)
+        t_vec, res = timed(cost_matrix, table, repeat=repeat)
+        print(f"{nome:>8} | {t_esc:>11.4f} | {t_vec:>14.4f} | {np.array_equal(ref, res)}")
+
+
+def bench_allocation_response(n_clients, n_dcs, repeat=3):
+    """
+    Resposta do solver com a matriz Cliente×CD (cada cliente servido por um ou dois CDs):
+    JSON denso vs esparso (tamanho, serialização e parse como proxy do browser) e
+    tempo até ao primeiro bloco no modo stream.
+    """
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    import app as backend
+    rng = np.random.default_rng(0)
+    alloc = np.zeros((n_clients, n_dcs))
+    alloc[np.arange(n_clients), rng.integers(0, n_dcs, n_clients)] = rng.integers(1, 5000, n_clients)
+    split = rng.random(n_clients) < 0.1
+    alloc[np.flatnonzero(split), rng.integers(0, n_dcs, split.sum())] += 100
+    body = {'message': 'ok', 'status': 'Optimal', 'total_cost_full': 1.0,
+            'factory_allocation': {'status': 'Optimal', 'matrix': np.ones((5, n_dcs)).tolist()},
+            'client_allocation': {'status': 'Optimal', 'matrix': alloc.tolist()}}
+    print(f"{'formato':>8} | {'tamanho (MB)':>12} | {'serializar (s)':>14} | {'parse (s)':>9} | {'1.º bloco (s)':>13}")
+    print("-" * 70)
+    with backend.app.test_request_context():
+        for fmt in backend.RESPONSE_FORMATS:
+            def serializar():
+                return json.dumps(backend.format_allocations(dict(body), fmt))
+            t_ser, texto = timed(serializar, repeat=repeat)
+            t_parse, _ = timed(json.loads, texto, repeat=repeat)
+
+            def primeiro_bloco():
+                response, _ = backend.solver_response(dict(body), 200, fmt, stream=True)
+                return next(iter(response.response))
+            t_first, _ = timed(primeiro_bloco, repeat=repeat)
+            print(f"{fmt:>8} | {len(texto) / 1e6:>12.2f} | {t_ser:>14.4f} | {t_parse:>9.4f} | {t_first:>13.4f}")
+
+
+def bench_heuristic(n_factories, n_dcs, n_clients, time_limit_s=None):
+    """
+    Modos do solver no mesmo problema: heurística, exato (CBC) e heurística como MIP start.
+    Mostra o tempo, o custo, o gap reportado (ao limite inferior) e o desvio ao ótimo do exato.
+    """
+    base = random_network(n_factories, n_dcs, n_clients)
+    opcoes = {'solver_backend': 'matrix', 'time_limit_s': time_limit_s}
+    linhas = []
+    for modo in ('heuristic', 'exact', 'heuristic_start'):
+        stats = {}
+        t, (status, custo, _, _, decisoes) = timed(solve_network_design_problem, {**base, **opcoes, 'solver_mode': modo}, stats)
+        linhas.append((modo, status, t, custo, stats.get('mip_gap'), sum(d == "Aberto" for d in decisoes.values())))
+    exato = linhas[1][3] if linhas[1][1] == 'Optimal' else None
+    print(f"ℹ️ {n_factories} fábricas × {n_dcs} CDs × {n_clients} clientes")
+    print(f"{'modo':>15} | {'status':>8} | {'tempo (s)':>9} | {'custo':>14} | {'gap rep.':>8} | {'vs ótimo':>8} | {'CDs':>4}")
+    print("-" * 86)
+    for modo, status, t, custo, gap, abertos in linhas:
+        desvio = f"{(custo - exato) / exato:>8.2%}" if exato else f"{'-':>8}"
+        gap_txt = f"{gap:>8.2%}" if gap is not None else f"{'-':>8}"
+        print(f"{modo:>15} | {status:>8} | {t:>9.2f} | {custo:>14,.2f} | {gap_txt} | {desvio} | {abertos:>4}")
+
+
+def bench_aggregation(n_factories, n_dcs, n_clients, n_cities, mode='exact', km=5.0):
+    """
+    Agregação de clientes: modelo completo vs agregado (threshold, grid e k-means) com
+    clientes concentrados em cidades. Mostra grupos, tempo, speedup, custo real, o erro E
+    e o gap garantido ao ótimo do modelo completo.
+    """
+    base = random_network(n_factories, n_dcs, n_clients, n_cities=n_cities)
+    opcoes = {'solver_backend': 'matrix', 'solver_mode': mode, 'mip_gap': 1e-4}
+    variantes = [
+        ("completo", {}),
+        (f"threshold {km:g} km", {'client_aggregation': 'threshold', 'aggregation_km': km}),
+        (f"grid {2 * km:g} km", {'client_aggregation': 'grid', 'aggregation_km': 2 * km}),
+        (f"kmeans {n_cities * 2}", {'client_aggregation': 'kmeans', 'aggregation_clusters': n_cities * 2}),
+    ]
+    linhas = []
+    for nome, extra in variantes:
+        stats = {}
+        t, (status, custo, _, _, _) = timed(solve_network_design_problem, {**base, **opcoes, **extra}, stats)
+        linhas.append((nome, status, t, custo, stats.get('aggregation', {}), stats.get('mip_gap')))
+    _, _, t_completo, custo_completo, _, _ = linhas[0]
+    print(f"ℹ️ {n_factories} fábricas × {n_dcs} CDs × {n_clients} clientes em {n_cities} cidades, modo {mode}")
+    print(f"{'variante':>16} | {'grupos':>6} | {'tempo (s)':>9} | {'speedup':>7} | {'custo real':>14} | {'vs completo':>11} | "
+          f"{'erro E':>12} | {'gap garantido':>13}")
+    print("-" * 112)
+    for nome, status, t, custo, agg, gap in linhas:
+        print(f"{nome:>16} | {agg.get('groups', n_clients):>6} | {t:>9.2f} | {t_completo / t:>6.1f}x | {custo:>14,.2f} | "
+              f"{(custo - custo_completo) / custo_completo:>11.3%} | {agg.get('error_bound', 0.0):>12,.2f} | "
+              + (f"{gap:>13.3%}" if gap is not None else f"{'-':>13}") + ('' if status in ('Optimal', 'Feasible') else f" {status}"))
+
+
+def bench_cooper(sizes, p, restarts_list):
+    """ Cooper com p centros: custo e tempo por número de arranques (em lote), vs um só centro. """
+    linhas = []
+    for n in sizes:
+        points = random_points(n)
+        um = logic.solve_weiszfeld_haversine(points, log_mode=logic.LOG_OFF)['cost']
+        for restarts in restarts_list:
+            t, r = timed(logic.solve_cooper_haversine, points, p, restarts)
+            linhas.append((n, restarts, t, r, um))
+    print(f"{'pontos':>8} | {'arranques':>9} | {'tempo (s)':>9} | {'iterações':>9} | {'custo':>16} | {'pior arranque':>16} | {'vs 1 centro':>11}")
+    print("-" * 96)
+    for n, restarts, t, r, um in linhas:
+        print(f"{n:>8} | {restarts:>9} | {t:>9.3f} | {r['iterations']:>9} | {r['cost']:>16,.2f} | "
+              f"{max(r['restart_costs']):>16,.2f} | {r['cost'] / um:>10.1%}")
+
+
+def bench_spatial_index(n_points, n_queries, k, radius_km, n_dcs=200, n_clients=20000):
+    """
+    Consultas k-mais-próximos e por raio: varrimento completo (Haversine contra todos)
+    vs KD-tree (spatial_index); depois o presolve dos K CDs por custo vs por localização.
+    """
+    points = random_points(n_points)
+    lat, lng, _ = logic.points_to_arrays(points)
+    queries = random_points(n_queries, seed=7)
+
+    def scan():
+        out = []
+        for q in queries:
+            d = logic.haversine_distance_np(q, lat, lng)
+            out.append((np.argsort(d, kind='stable')[:k], np.flatnonzero(d <= radius_km)))
+        return out
+
+    def tree(index):
+        return [(index.nearest(q['lat'], q['lng'], k)[1][0], index.within_radius(q['lat'], q['lng'], radius_km)[1])
+                for q in queries]
+
+    t_build, index = timed(spatial_index.PointIndex, points)
+    t_scan, r_scan = timed(scan)
+    t_tree, r_tree = timed(tree, index)
+    iguais = sum(np.array_equal(a[0], b[0]) and np.array_equal(np.sort(a[1]), np.sort(b[1])) for a, b in zip(r_scan, r_tree))
+
+    base = random_network(3, n_dcs, n_clients)
+    inp = prepare_network_inputs(base)
+    args = (inp['costs_dc_client'], inp['supply_factory'], inp['demand_client'], inp['capacity_dc'],
+            inp['dc_names'], {}, k)
+    t_cost, pre_cost = timed(lambda: presolve_network(*args))
+    t_loc, pre_loc = timed(lambda: presolve_network(*args, client_points=base['client_points'], dc_points=base['dc_points']))
+    comuns = len(set(pre_cost['lanes_kj']) & set(pre_loc['lanes_kj'])) / max(1, len(pre_cost['lanes_kj']))
+
+    print(f"{n_points} pontos, {n_queries} consultas (k={k}, raio {radius_km} km); KD-tree construída em {t_build:.3f}s")
+    print(f"{'método':>18} | {'tempo (s)':>9} | {'por consulta (ms)':>17} | {'iguais':>7}")
+    print("-" * 62)
+    print(f"{'varrimento':>18} | {t_scan:>9.3f} | {1000 * t_scan / n_queries:>17.3f} | {'-':>7}")
+    print(f"{'KD-tree':>18} | {t_tree:>9.3f} | {1000 * t_tree / n_queries:>17.3f} | {iguais:>3}/{n_queries}")
+    print(f"\nPresolve K={k} ({n_clients} clientes × {n_dcs} CDs): por custo {t_cost:.3f}s, "
+          f"por localização {t_loc:.3f}s ({t_cost / t_loc:.1f}x); rotas em comum {comuns:.1%}")
+
+
+# Tamanhos da suite: nome -> (fábricas, CDs, clientes)
+SUITE_SIZES = {'small': (3, 20, 500), 'medium': (4, 30, 1000), 'large': (10, 200, 20000)}
+SUITE_STAGES = ('clean_number', 'presolve', 'model_build', 'cbc_solve', 'extract', 'weiszfeld', 'json_serialize')
+
+
+def suite_case(name, n_factories, n_dcs, n_clients, seed, backend='pulp', time_limit_s=None, mip_gap=None):
+    """ Uma rede sintética (synthetic_network) resolvida de ponta a ponta, com o tempo (s) de cada etapa. """
+    t0 = time.perf_counter()
+    scenario = synthetic_network.generate_scenario(n_factories, n_dcs, n_clients, seed)
+    body = synthetic_network.solver_input(scenario, synthetic_network.cost_matrices(scenario))
+    body = json.loads(json.dumps(body))  # como chega a /run-scenario
+    generate_time = time.perf_counter() - t0
+
+    t_clean, inp = timed(prepare_network_inputs, body)
+    stats = {}
+    options = {'solver_backend': backend, 'time_limit_s': time_limit_s, 'mip_gap': mip_gap}
+    t_total, (status, cost, alloc_ij, alloc_kj, dc_decisions) = timed(solve_prepared_network, inp, options, stats)
+    t_weiszfeld, _ = timed(logic.solve_weiszfeld_haversine, scenario['clients'], None, 1.8, 0.01, 100, logic.LOG_OFF)
+    resposta = {'status': status, 'total_cost': cost, 'dc_decisions': dc_decisions,
+                'factory_allocation': alloc_ij, 'client_allocation': alloc_kj}
+    t_json, payload = timed(json.dumps, resposta)
+    return {
+        'name': name, 'seed': seed, 'factories': n_factories, 'dcs': n_dcs, 'clients': n_clients,
+        'backend': backend, 'input_hash': solver_input_hash(body, inp),
+        'status': status, 'cost': cost, 'mip_gap': stats.get('mip_gap'),
+        'variables': stats['presolve']['variables'], 'response_bytes': len(payload),
+        'generate_s': generate_time, 'total_solve_s': t_total,
+        'stages': {'clean_number': t_clean, 'presolve': stats['presolve']['time_s'],
+                   'model_build': stats.get('build_time_s'), 'cbc_solve': stats.get('solve_time_s'),
+                   'extract': stats.get('extract_time_s'), 'weiszfeld': t_weiszfeld, 'json_serialize': t_json},
+    }
+
+
+def suite_environment():
+    """ Versões e máquina do relatório, para comparar só o que é comparável. """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'git_commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'pulp': pulp.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def compare_reports(report, baseline, tolerance, min_delta_s=0.05):
+    """
+    Compara as etapas com um relatório anterior (mesmo caso e mesmo input_hash).
+    Regressão: mais de 'tolerance' (relativo) e mais de min_delta_s mais lento. O CBC só é
+    comparado quando as duas resoluções terminaram (status 'Optimal', não parado no limite).
+    Devolve a lista de regressões.
+    """
+    anteriores = {(c['name'], c['input_hash'], c['backend']): c for c in baseline.get('cases', [])}
+    regressoes = []
+    print(f"\n{'caso':>8} | {'etapa':>14} | {'antes (s)':>9} | {'agora (s)':>9} | {'razão':>6}")
+    print("-" * 58)
+    for case in report['cases']:
+        antes = anteriores.get((case['name'], case['input_hash'], case['backend']))
+        if antes is None:
+            print(f"{case['name']:>8} | {'(sem par no relatório anterior: outro input ou backend)':>14}")
+            continue
+        for stage in SUITE_STAGES:
+            a, b = antes['stages'].get(stage), case['stages'].get(stage)
+            if a is None or b is None:
+                continue
+            if stage == 'cbc_solve' and not antes['status'] == case['status'] == 'Optimal':
+                continue
+            pior = b > a * (1 + tolerance) and b - a > min_delta_s
+            if pior:
+                regressoes.append({'case': case['name'], 'stage': stage, 'before_s': a, 'after_s': b})
+            print(f"{case['name']:>8} | {stage:>14} | {a:>9.3f} | {b:>9.3f} | {b / a if a else float('inf'):>5.2f}x"
+                  + (" ⚠️" if pior else ""))
+    return regressoes
+
+
+def bench_suite(sizes, seed, backend, time_limit_s, mip_gap, report_path=None, baseline_path=None, tolerance=0.25):
+    """
+    Suite reprodutível: redes sintéticas com semente, tempo por etapa (limpeza dos números,
+    presolve, construção, CBC, extração, Weiszfeld, JSON) e um relatório JSON. Com um
+    relatório anterior, lista as etapas mais lentas e devolve 1 se houver regressões.
+    """
+    cases = []
+    for size in sizes:
+        if size in SUITE_SIZES:
+            n_factories, n_dcs, n_clients = SUITE_SIZES[size]
+        else:
+            n_factories, n_dcs, n_clients = (int(v) for v in size.lower().split('x'))
+        cases.append(suite_case(size, n_factories, n_dcs, n_clients, seed, backend, time_limit_s, mip_gap))
+    report = {'schema': 1, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'environment': suite_environment(),
+              'options': {'seed': seed, 'backend': backend, 'time_limit_s': time_limit_s, 'mip_gap': mip_gap},
+              'cases': cases}
+
+    print(f"\n{'caso':>8} | {'rede':>16} | " + " | ".join(f"{s:>14}" for s in SUITE_STAGES) + f" | {'status':>8} | {'custo':>16}")
+    print("-" * (48 + 17 * len(SUITE_STAGES) + 20))
+    for c in cases:
+        rede = f"{c['factories']}x{c['dcs']}x{c['clients']}"
+        print(f"{c['name']:>8} | {rede:>16} | " + " | ".join(
+            f"{c['stages'][s]:>14.3f}" if c['stages'][s] is not None else f"{'-':>14}" for s in SUITE_STAGES)
+              + f" | {c['status']:>8} | {c['cost']:>16,.2f}")
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Relatório escrito em {report_path}")
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            regressoes = compare_reports(report, json.load(f), tolerance)
+        if regressoes:
+            print(f"\n❌ {len(regressoes)} etapa(s) mais lentas do que o relatório anterior (tolerância {tolerance:.0%}).")
+            return 1
+        print("\n✅ Sem regressões face ao relatório anterior.")
+    return 0
+
+
+def bench_load_test(n_clients, n_dcs, n_requests, concurrency, database_url=None):
+    """
+    Teste de carga: o backend num servidor HTTP local (com threads) e 'concurrency'
+    clientes em paralelo; latência p50/p99 por rota. Usa a BD de 'database_url'
+    (p. ex. um PostgreSQL local) ou um SQLite temporário. ATENÇÃO: substitui os dados.
+    """
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import make_server
+
+    if database_url is None:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    import app as backend
+    with backend.app.app_context():
+        backend.db.create_all()
+        dialeto = backend.db.engine.dialect.name
+
+    def pontos(n, seed, w):
+        return [{'lat': p['lat'], 'lng': p['lng'], 'w': w, 'address': f"P{seed}-{i}, PT", 'country': 'PT', 'custo_fixo': 50000}
+                for i, p in enumerate(random_points(n, seed=seed))]
+
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        procura = 10
+        for rota, pts in (('/save-factories', pontos(5, 1, n_clients * procura)),
+                          ('/save-distribution-centers', pontos(n_dcs, 2, n_clients * procura)),
+                          ('/save-clients', pontos(n_clients, 3, procura))):
+            requests.post(base + rota, json={'points': pts}).raise_for_status()
+        requests.get(base + '/get-distance-matrix?provider=haversine').raise_for_status()
+        requests.post(base + '/run-solver', json={'mip_gap': 0.01}).raise_for_status()  # aquece o cache de resultados
+
+        rotas = [('GET /get-solver-data', 'get', '/get-solver-data', None),
+                 ('GET /get-distance-matrix', 'get', '/get-distance-matrix', None),
+                 ('POST /run-solver (cache)', 'post', '/run-solver', {'mip_gap': 0.01}),
+                 ('POST /calculate-gravity', 'post', '/calculate-gravity-by-country', {}),
+                 ('GET /solver-jobs', 'get', '/solver-jobs', None)]
+        print(f"ℹ️ {dialeto}, {n_clients} clientes × {n_dcs} CDs, "
+              f"{n_requests} pedidos por rota, {concurrency} em paralelo")
+        print(f"{'rota':>26} | {'p50 (ms)':>8} | {'p99 (ms)':>8} | {'máx (ms)':>8} | {'pedidos/s':>9} | erros")
+        print("-" * 82)
+        with requests.Session() as http, ThreadPoolExecutor(max_workers=concurrency) as pool:
+            http.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+            for nome, metodo, rota, corpo in rotas:
+                def pedido(_):
+                    t0 = time.perf_counter()
+                    r = http.request(metodo, base + rota, json=corpo)
+                    return time.perf_counter() - t0, r.status_code
+                t0 = time.perf_counter()
+                resultados = list(pool.map(pedido, range(n_requests)))
+                total = time.perf_counter() - t0
+                lat = np.array([t for t, _ in resultados]) * 1000
+                erros = sum(1 for _, code in resultados if code >= 400)
+                print(f"{nome:>26} | {np.percentile(lat, 50):>8.1f} | {np.percentile(lat, 99):>8.1f} | "
+                      f"{lat.max():>8.1f} | {n_requests / total:>9.1f} | {erros}")
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do backend BrewSEP")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p_w = sub.add_parser('weiszfeld', help="Weiszfeld Haversine: ciclo Python vs NumPy")
+    p_w.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    p_w.add_argument('--repeat', type=int, default=1)
+
+    p_ww = sub.add_parser('weiszfeld-warm', help="Iterações: simples vs acelerado (frio/quente) após editar clientes")
+    p_ww.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    p_ww.add_argument('--edit-fraction', type=float, default=0.01)
+
+    p_p = sub.add_parser('presolve', help="MILP: modelo denso vs presolve")
+    p_p.add_argument('--factories', type=int, default=5)
+    p_p.add_argument('--dcs', type=int, default=20)
+    p_p.add_argument('--clients', type=int, default=150)
+    p_p.add_argument('--k', type=int, default=4)
+
+    p_m = sub.add_parser('model-build', help="Construção do MILP: PuLP vs backend matricial")
+    p_m.add_argument('--factories', type=int, default=10)
+    p_m.add_argument('--dcs', type=int, default=200)
+    p_m.add_argument('--clients', type=int, default=2000)
+
+    p_s = sub.add_parser('sweep', help="Cenários: /run-scenario sequencial vs varrimento paralelo")
+    p_s.add_argument('--factories', type=int, default=5)
+    p_s.add_argument('--dcs', type=int, default=20)
+    p_s.add_argument('--clients', type=int, default=300)
+    p_s.add_argument('--scenarios', type=int, default=20)
+    p_s.add_argument('--workers', type=int, default=None)
+
+    p_d = sub.add_parser('distance-fetch', help="Distance Matrix (cliente local): série vs blocos paralelos")
+    p_d.add_argument('--dcs', type=int, default=120)
+    p_d.add_argument('--destinations', type=int, default=400)
+    p_d.add_argument('--latency', type=float, default=0.1)
+    p_d.add_argument('--failure-rate', type=float, default=0.02)
+    p_d.add_argument('--workers', type=int, default=16)
+    p_d.add_argument('--elements-per-second', type=float, default=5000)
+
+    p_dp = sub.add_parser('distance-providers', help="Matriz de distâncias: Google (cliente local) vs Haversine")
+    p_dp.add_argument('--dcs', type=int, default=200)
+    p_dp.add_argument('--destinations', type=int, default=5000)
+    p_dp.add_argument('--latency', type=float, default=0.05)
+
+    p_ms = sub.add_parser('matrix-store', help="Cache da matriz do solver: JSON vs binário (.npz)")
+    p_ms.add_argument('--dcs', type=int, default=200)
+    p_ms.add_argument('--clients', type=int, default=5000)
+
+    p_bi = sub.add_parser('bulk-ingest', help="Escrita de pontos: ORM vs bulk (replace/upsert), linhas/s")
+    p_bi.add_argument('--rows', type=int, default=50000)
+    p_bi.add_argument('--database-url', default=None)
+    p_bi.add_argument('--changed-fraction', type=float, default=0.01)
+
+    p_cn = sub.add_parser('clean-number', help="Limpeza de números: escalar vs vetorizado")
+    p_cn.add_argument('--clients', type=int, default=2000)
+    p_cn.add_argument('--dcs', type=int, default=200)
+
+    p_ar = sub.add_parser('allocation-response', help="Resposta do solver: alocações densas vs esparsas")
+    p_ar.add_argument('--clients', type=int, default=5000)
+    p_ar.add_argument('--dcs', type=int, default=200)
+
+    p_h = sub.add_parser('heuristic', help="Solver: heurística vs exato vs heurística como MIP start")
+    p_h.add_argument('--factories', type=int, default=5)
+    p_h.add_argument('--dcs', type=int, default=40)
+    p_h.add_argument('--clients', type=int, default=600)
+    p_h.add_argument('--time-limit', type=float, default=None)
+
+    p_ag = sub.add_parser('aggregation', help="Solver: modelo completo vs clientes agregados (erro e speedup)")
+    p_ag.add_argument('--factories', type=int, default=3)
+    p_ag.add_argument('--dcs', type=int, default=20)
+    p_ag.add_argument('--clients', type=int, default=3000)
+    p_ag.add_argument('--cities', type=int, default=60)
+    p_ag.add_argument('--mode', default='exact', choices=['exact', 'heuristic', 'heuristic_start'])
+    p_ag.add_argument('--km', type=float, default=5.0)
+
+    p_co = sub.add_parser('cooper', help="Localização-afetação de Cooper: custo e tempo por número de arranques")
+    p_co.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    p_co.add_argument('--p', type=int, default=10)
+    p_co.add_argument('--restarts', type=int, nargs='+', default=[1, 8, 32])
+
+    p_si = sub.add_parser('spatial-index', help="k-mais-próximos/raio: varrimento vs KD-tree, e presolve por localização")
+    p_si.add_argument('--points', type=int, default=100000)
+    p_si.add_argument('--queries', type=int, default=1000)
+    p_si.add_argument('--k', type=int, default=5)
+    p_si.add_argument('--radius-km', type=float, default=50.0)
+    p_si.add_argument('--dcs', type=int, default=200)
+    p_si.add_argument('--clients', type=int, default=20000)
+
+    p_su = sub.add_parser('suite', help="Suite reprodutível: tempo por etapa em redes sintéticas, relatório JSON")
+    p_su.add_argument('--sizes', nargs='+', default=['small', 'medium'],
+                      help=f"{list(SUITE_SIZES)} ou FxDxC (p. ex. 10x200x20000)")
+    p_su.add_argument('--seed', type=int, default=1)
+    p_su.add_argument('--backend', default='pulp', choices=['pulp', 'matrix'])
+    p_su.add_argument('--time-limit', type=float, default=60)
+    p_su.add_argument('--mip-gap', type=float, default=0.01)
+    p_su.add_argument('--report', default=None)
+    p_su.add_argument('--baseline', default=None)
+    p_su.add_argument('--tolerance', type=float, default=0.25)
+
+    p_lt = sub.add_parser('load-test', help="Carga HTTP local: latência p50/p99 por rota")
+    p_lt.add_argument('--clients', type=int, default=500)
+    p_lt.add_argument('--dcs', type=int, default=20)
+    p_lt.add_argument('--requests', type=int, default=200)
+    p_lt.add_argument('--concurrency', type=int, default=8)
+    p_lt.add_argument('--database-url', default=None)
+
+    args = parser.parse_args()
+    if args.bench == 'weiszfeld':
+        bench_weiszfeld(args.sizes, args.repeat)
+    elif args.bench == 'weiszfeld-warm':
+        bench_weiszfeld_warm(args.sizes, args.edit_fraction)
+    elif args.bench == 'presolve':
+        bench_presolve(args.factories, args.dcs, args.clients, args.k)
+    elif args.bench == 'model-build':
+        bench_model_build(args.factories, args.dcs, args.clients)
+    elif args.bench == 'sweep':
+        bench_sweep(args.factories, args.dcs, args.clients, args.scenarios, args.workers)
+    elif args.bench == 'distance-fetch':
+        bench_distance_fetch(args.dcs, args.destinations, args.latency, args.failure_rate,
+                             args.workers, args.elements_per_second)
+    elif args.bench == 'distance-providers':
+        bench_distance_providers(args.dcs, args.destinations, args.latency)
+    elif args.bench == 'matrix-store':
+        bench_matrix_store(args.dcs, args.clients)
+    elif args.bench == 'bulk-ingest':
+        bench_bulk_ingest(args.rows, args.database_url, args.changed_fraction)
+    elif args.bench == 'clean-number':
+        bench_clean_number(args.clients, args.dcs)
+    elif args.bench == 'allocation-response':
+        bench_allocation_response(args.clients, args.dcs)
+    elif args.bench == 'heuristic':
+        bench_heuristic(args.factories, args.dcs, args.clients, args.time_limit)
+    elif args.bench == 'aggregation':
+        bench_aggregation(args.factories, args.dcs, args.clients, args.cities, args.mode, args.km)
+    elif args.bench == 'cooper':
+        bench_cooper(args.sizes, args.p, args.restarts)
+    elif args.bench == 'spatial-index':
+        bench_spatial_index(args.points, args.queries, args.k, args.radius_km, args.dcs, args.clients)
+    elif args.bench == 'suite':
+        sys.exit(bench_suite(args.sizes, args.seed, args.backend, args.time_limit, args.mip_gap,
+                             args.report, args.baseline, args.tolerance))
+    elif args.bench == 'load-test':
+        bench_load_test(args.clients, args.dcs, args.requests, args.concurrency, args.database_url)
+
+
+if __name__ == '__main__':
+    main()
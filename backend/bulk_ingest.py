@@ -0,0 +1,264 @@
+# backend/bulk_ingest.py
+# Escrita em massa dos pontos (fábricas, clientes, CDs).
+#
+# Em vez de um objeto ORM + session.add por ponto:
+#   - 'replace': apaga a tabela e insere em blocos (executemany de insert(); COPY
+#     no PostgreSQL), tudo na mesma transação, para nunca expor uma tabela a meio;
+#   - 'upsert': compara com o que já está na BD (chave = coordenadas arredondadas,
+#     ver distance_fetcher.point_key) e só escreve as linhas novas, alteradas ou
+#     removidas, com commit por bloco. Sem diferenças não escreve nada.
+#
+# A importação em streaming (CSV ou NDJSON) lê o corpo do pedido linha a linha,
+# limpa e valida cada registo e escreve em blocos de BULK_CHUNK_SIZE: a memória
+# fica limitada a um bloco, independentemente do tamanho do ficheiro.
+
+import csv
+import io
+import json
+import math
+import os
+from collections import defaultdict
+
+from sqlalchemy import bindparam
+
+from distance_fetcher import point_key
+from solver_algorithm import clean_number
+
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 5000))
+BULK_USE_COPY = os.environ.get('BULK_USE_COPY', '1').lower() in ('1', 'true', 'yes')
+INGEST_MODES = ('replace', 'upsert')
+IMPORT_MODES = ('replace', 'append')
+IMPORT_FORMATS = ('csv', 'ndjson')
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 1000))  # erros por linha devolvidos (os restantes só contam)
+
+# Valores por omissão de cada coluna quando o ponto não a traz (os mesmos das rotas save-*)
+COLUMN_DEFAULTS = {'w': 1, 'address': '', 'country': '', 'custo_fixo': 0}
+NUMERIC_COLUMNS = ('lat', 'lng', 'w', 'custo_fixo')
+
+
+def _as_float(value):
+    """ Números em texto ('120000' nos presets) passam a float; o resto fica como veio. """
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def point_rows(model, points):
+    """ Pontos do pedido -> dicionários com as colunas do modelo (sem 'id'). """
+    columns = [c.name for c in model.__table__.columns if c.name != 'id']
+    rows = []
+    for point in points:
+        row = {c: point.get(c, COLUMN_DEFAULTS.get(c)) for c in columns}
+        for c in NUMERIC_COLUMNS:
+            if c in row:
+                row[c] = _as_float(row[c])
+        rows.append(row)
+    return rows
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _copy_rows(session, table, rows):
+    """ COPY ... FROM STDIN (PostgreSQL/psycopg2) na ligação da sessão, dentro da mesma transação. """
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    # QUOTE_NONNUMERIC: texto entre aspas ('' fica "" e não NULL), None sem aspas (NULL)
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        writer.writerow([row[c] for c in columns])
+    buffer.seek(0)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+
+def insert_rows(session, model, rows, chunk_size=None, use_copy=None):
+    """ Insere 'rows' em blocos: COPY no PostgreSQL (se possível), senão executemany de insert(). """
+    if not rows:
+        return
+    table = model.__table__
+    use_copy = BULK_USE_COPY if use_copy is None else use_copy
+    if use_copy and session.get_bind().dialect.name == 'postgresql':
+        try:
+            for chunk in _chunks(rows, chunk_size or BULK_CHUNK_SIZE):
+                _copy_rows(session, table, chunk)
+            return
+        except AttributeError:
+            pass  # driver sem copy_expert (não é psycopg2): segue para o executemany
+    for chunk in _chunks(rows, chunk_size or BULK_CHUNK_SIZE):
+        session.execute(table.insert(), chunk)
+
+
+def replace_points(session, model, rows, chunk_size=None):
+    """ Apaga todos os pontos e insere 'rows' (uma só transação). Devolve as contagens. """
+    deleted = session.query(model).delete()
+    insert_rows(session, model, rows, chunk_size)
+    session.commit()
+    return {'inserted': len(rows), 'updated': 0, 'deleted': deleted, 'unchanged': 0}
+
+
+def upsert_points(session, model, rows, chunk_size=None):
+    """
+    Sincroniza a tabela com 'rows' escrevendo só as diferenças: linhas com as mesmas
+    coordenadas são atualizadas (se algum campo mudou), as novas inseridas e as que
+    deixaram de existir apagadas. Pontos repetidos emparelham pela ordem.
+    Devolve as contagens {'inserted', 'updated', 'deleted', 'unchanged'}.
+    """
+    table = model.__table__
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    columns = [c.name for c in table.columns if c.name != 'id']
+    existing = defaultdict(list)
+    for record in session.execute(table.select().order_by(table.c.id)).mappings():
+        existing[point_key(record)].append(dict(record))
+
+    to_insert, to_update, unchanged = [], [], 0
+    for row in rows:
+        matches = existing.get(point_key(row))
+        if not matches:
+            to_insert.append(row)
+            continue
+        current = matches.pop(0)
+        if all(current[c] == row[c] for c in columns):
+            unchanged += 1
+        else:
+            to_update.append({'_id': current['id'], **row})
+    to_delete = [record['id'] for matches in existing.values() for record in matches]
+
+    if to_update:
+        # executemany: o SET vem das chaves de cada dicionário, o WHERE do '_id'
+        statement = table.update().where(table.c.id == bindparam('_id'))
+        for chunk in _chunks(to_update, chunk_size):
+            session.execute(statement, chunk)
+            session.commit()
+    for chunk in _chunks(to_delete, chunk_size):
+        session.execute(table.delete().where(table.c.id.in_(chunk)))
+        session.commit()
+    for chunk in _chunks(to_insert, chunk_size):
+        insert_rows(session, model, chunk, chunk_size)
+        session.commit()
+    return {'inserted': len(to_insert), 'updated': len(to_update), 'deleted': len(to_delete), 'unchanged': unchanged}
+
+
+def ingest_points(session, model, points, mode='replace', chunk_size=None):
+    """ Ponto de entrada das rotas: 'replace' ou 'upsert'. Lança ValueError para um modo inválido. """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Modo de escrita inválido: '{mode}'. Opções: {list(INGEST_MODES)}")
+    rows = point_rows(model, points)
+    if mode == 'upsert':
+        return upsert_points(session, model, rows, chunk_size)
+    return replace_points(session, model, rows, chunk_size)
+
+
+# Nomes alternativos aceites nos cabeçalhos CSV / chaves NDJSON
+FIELD_ALIASES = {'latitude': 'lat', 'longitude': 'lng', 'lon': 'lng', 'weight': 'w', 'peso': 'w',
+                 'morada': 'address', 'pais': 'country', 'país': 'country'}
+
+
+def iter_records(stream, fmt):
+    """
+    Lê o corpo (stream binário) registo a registo: devolve (nº da linha, dicionário)
+    ou (nº da linha, ValueError) para uma linha ilegível. Nunca carrega o ficheiro inteiro.
+    """
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        if reader.fieldnames is None:
+            return
+        reader.fieldnames = [FIELD_ALIASES.get(f.strip().lower(), f.strip().lower()) for f in reader.fieldnames]
+        for record in reader:
+            if None in record:
+                yield reader.line_num, ValueError('colunas a mais na linha')
+            else:
+                yield reader.line_num, record
+        return
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_num, ValueError(f'JSON inválido ({e.msg})')
+            continue
+        if not isinstance(record, dict):
+            yield line_num, ValueError('cada linha tem de ser um objeto JSON')
+            continue
+        yield line_num, {FIELD_ALIASES.get(k.strip().lower(), k.strip().lower()): v for k, v in record.items()}
+
+
+def _coordinate(value, name, limit):
+    """ Coordenada em graus: aceita número ou texto com ponto ou vírgula decimal. """
+    if isinstance(value, str):
+        value = value.strip().replace(',', '.')
+    if value in (None, ''):
+        raise ValueError(f"'{name}' em falta")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' não é um número: {value!r}")
+    if not math.isfinite(number) or abs(number) > limit:
+        raise ValueError(f"'{name}' fora do intervalo [-{limit}, {limit}]: {number}")
+    return number
+
+
+def clean_point_record(model, record):
+    """
+    Registo importado -> linha do modelo. lat/lng são validadas; pesos e custos fixos
+    seguem as regras de clean_number ('1.000,50' -> 1000.5). Lança ValueError.
+    """
+    columns = [c.name for c in model.__table__.columns if c.name != 'id']
+    row = {'lat': _coordinate(record.get('lat'), 'lat', 90), 'lng': _coordinate(record.get('lng'), 'lng', 180)}
+    for c in columns:
+        if c in row:
+            continue
+        value = record.get(c)
+        if value in (None, ''):
+            value = COLUMN_DEFAULTS.get(c)
+        row[c] = clean_number(value) if c in NUMERIC_COLUMNS else ('' if value is None else str(value))
+    return row
+
+
+def stream_import(session, model, records, mode='append', chunk_size=None):
+    """
+    Gerador: importa os registos de iter_records em blocos e emite um evento de
+    progresso por bloco escrito ({'event': 'progress', 'rows', 'written', 'errors'}) e
+    um resumo final ({'event': 'done', ..., 'error_details': [{'line', 'error'}]}).
+    'replace' apaga a tabela e escreve tudo na mesma transação; 'append' faz commit por bloco.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Modo de importação inválido: '{mode}'. Opções: {list(IMPORT_MODES)}")
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    if mode == 'replace':
+        session.query(model).delete()
+    chunk, errors, n_rows, n_written, n_errors = [], [], 0, 0, 0
+    for line_num, record in records:
+        n_rows += 1
+        try:
+            if isinstance(record, Exception):
+                raise record
+            chunk.append(clean_point_record(model, record))
+        except ValueError as e:
+            n_errors += 1
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append({'line': line_num, 'error': str(e)})
+            continue
+        if len(chunk) >= chunk_size:
+            insert_rows(session, model, chunk, chunk_size)
+            if mode == 'append':
+                session.commit()
+            n_written += len(chunk)
+            chunk = []
+            yield {'event': 'progress', 'rows': n_rows, 'written': n_written, 'errors': n_errors}
+    if chunk:
+        insert_rows(session, model, chunk, chunk_size)
+        n_written += len(chunk)
+    session.commit()
+    yield {'event': 'done', 'mode': mode, 'rows': n_rows, 'written': n_written, 'errors': n_errors,
+           'error_details': errors, 'error_details_truncated': n_errors > len(errors)}
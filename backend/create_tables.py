@@ -16,7 +16,9 @@ try:
         CacheMatrixFactories, 
         CacheMatrixClients, 
         CacheSolverFactories, 
-        CacheSolverClients
+        CacheSolverClients,
+        CacheSolverResults,
+        CacheDistancePairs
     )
     print("Modelos (Factory, Client, etc.) importados com sucesso.")
 
@@ -25,6 +27,17 @@ except ImportError as e:
     print("Verifique se o ficheiro 'app.py' está na mesma pasta.")
     exit()
 
+# =================================================================
+# --- TABELAS ANTIGAS ---
+#
+# A matriz do solver passou a ser guardada em binário (.npz) nas tabelas
+# 'cache_solver_matrix_factories' / 'cache_solver_matrix_clients'. As antigas
+# tabelas JSON só tinham uma cópia em cache das matrizes (volta a ser gerada
+# ao calcular a matriz de distâncias) e são apagadas aqui, se existirem.
+# =================================================================
+
+LEGACY_TABLES = ('cache_solver_factories', 'cache_solver_clients')
+
 # =================================================================
 # O código abaixo vai ligar-se à base de dados no seu .env
 # e criar as tabelas. Não precisa de mexer.
@@ -52,6 +65,14 @@ try:
         # O comando que cria as tabelas
         print("A tentar criar tabelas (db.create_all())...")
         db.create_all() 
+
+        # Migração: remover as tabelas de cache substituídas
+        inspector = db.inspect(db.engine)
+        for table_name in LEGACY_TABLES:
+            if inspector.has_table(table_name):
+                db.session.execute(db.text(f'DROP TABLE {table_name}'))
+                print(f"Tabela antiga '{table_name}' removida (substituída pela versão binária).")
+        db.session.commit()
         
         print("\n-------------------------------------------------")
         print("✅ Tabelas criadas com sucesso na base de dados!")
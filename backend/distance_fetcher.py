@@ -0,0 +1,218 @@
+# backend/distance_fetcher.py
+# Busca da Distance Matrix da Google em blocos, em paralelo e com limite de taxa.
+#
+# A API aceita no máximo 25 origens, 25 destinos e 100 elementos por pedido.
+# O fetcher divide origens E destinos em blocos que cumprem esses limites,
+# envia os blocos em paralelo (threads: o trabalho é I/O) sob um token bucket
+# de elementos por segundo, repete com backoff os erros transitórios e monta a
+# resposta completa no formato da API, pronta para parse_google_response.
+
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import googlemaps
+import numpy as np
+
+import logic
+
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+DISTANCE_WORKERS = int(os.environ.get('DISTANCE_WORKERS', 8))
+# Quota de elementos por segundo (a Google limita elementos, não pedidos)
+DISTANCE_ELEMENTS_PER_SECOND = float(os.environ.get('DISTANCE_ELEMENTS_PER_SECOND', 1000))
+DISTANCE_MAX_RETRIES = int(os.environ.get('DISTANCE_MAX_RETRIES', 5))
+# Casas decimais das coordenadas na chave do cache por par (5 casas ≈ 1 m)
+PAIR_KEY_DECIMALS = 5
+
+# Estados da API que valem a pena repetir
+RETRIABLE_API_STATUSES = ('OVER_QUERY_LIMIT', 'UNKNOWN_ERROR')
+
+
+class TokenBucket:
+    """ Token bucket thread-safe: 'rate' fichas por segundo, no máximo 'capacity' acumuladas. """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, MAX_ELEMENTS))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1):
+        """ Bloqueia até haver 'n' fichas e consome-as. """
+        n = min(n, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def plan_tiles(n_origins, n_destinations, max_origins=MAX_ORIGINS,
+               max_destinations=MAX_DESTINATIONS, max_elements=MAX_ELEMENTS):
+    """
+    Divide a matriz n_origins × n_destinations em blocos (o0, o1, d0, d1) que
+    cumprem os limites da API, escolhendo o formato de bloco com menos pedidos.
+    """
+    if n_origins == 0 or n_destinations == 0:
+        return []
+    best = None
+    for a in range(1, min(max_origins, n_origins) + 1):
+        b = min(max_destinations, n_destinations, max_elements // a)
+        if b == 0:
+            break
+        n_tiles = math.ceil(n_origins / a) * math.ceil(n_destinations / b)
+        if best is None or n_tiles < best[0]:
+            best = (n_tiles, a, b)
+    _, a, b = best
+    return [(o, min(o + a, n_origins), d, min(d + b, n_destinations))
+            for o in range(0, n_origins, a) for d in range(0, n_destinations, b)]
+
+
+def format_distance_text(km):
+    return f"{km:,.1f} km"
+
+
+def format_duration_text(minutes):
+    minutes = int(round(minutes))
+    return f"{minutes // 60} h {minutes % 60} min" if minutes >= 60 else f"{minutes} min"
+
+
+def point_key(point):
+    """ Chave de um ponto no cache por par: coordenadas arredondadas, p. ex. '38.72230,-9.13934'. """
+    return f"{round(float(point['lat']), PAIR_KEY_DECIMALS):.{PAIR_KEY_DECIMALS}f}," \
+           f"{round(float(point['lng']), PAIR_KEY_DECIMALS):.{PAIR_KEY_DECIMALS}f}"
+
+
+def plan_missing_blocks(missing):
+    """
+    Cobre os pares em falta (máscara booleana origens × destinos) com poucos blocos
+    retangulares, sem pedir pares já conhecidos quando a falta tem forma simples:
+      1. origens sem nenhum par (p. ex. um CD novo) -> essas linhas inteiras;
+      2. destinos em falta para todas as restantes origens (clientes novos) -> essas colunas;
+      3. o que sobrar -> a submatriz das origens × destinos ainda com falhas.
+    Devolve uma lista de (índices de origens, índices de destinos).
+    """
+    missing = np.array(missing, dtype=bool)
+    if missing.size == 0 or not missing.any():
+        return []
+    blocks = []
+    full_rows = np.flatnonzero(missing.all(axis=1))
+    if len(full_rows):
+        blocks.append((full_rows, np.arange(missing.shape[1])))
+        missing[full_rows] = False
+    rest = np.flatnonzero(missing.any(axis=1))
+    if len(rest):
+        full_cols = np.flatnonzero(missing[rest].all(axis=0))
+        if len(full_cols):
+            blocks.append((rest, full_cols))
+            missing[:, full_cols] = False
+    rows, cols = np.flatnonzero(missing.any(axis=1)), np.flatnonzero(missing.any(axis=0))
+    if len(rows):
+        blocks.append((rows, cols))
+    return [(o.tolist(), d.tolist()) for o, d in blocks]
+
+
+def _is_retriable(error):
+    if isinstance(error, googlemaps.exceptions.ApiError):
+        return error.status in RETRIABLE_API_STATUSES
+    if isinstance(error, googlemaps.exceptions.HTTPError):
+        return str(error.status_code).startswith('5') or error.status_code == 429
+    return isinstance(error, (googlemaps.exceptions.Timeout, googlemaps.exceptions.TransportError))
+
+
+def _fetch_tile(client, origins, destinations, mode, bucket, max_retries, backoff_s):
+    """ Um pedido à API, com limite de taxa e repetição com backoff exponencial + jitter. """
+    for attempt in range(max_retries + 1):
+        bucket.acquire(len(origins) * len(destinations))
+        try:
+            return client.distance_matrix(origins, destinations, mode=mode)
+        except Exception as e:
+            if attempt == max_retries or not _is_retriable(e):
+                raise
+            wait = backoff_s * (2 ** attempt) * (1 + random.random())
+            print(f"⚠️ Distance Matrix: erro transitório ({e}); nova tentativa em {wait:.2f}s.")
+            time.sleep(wait)
+
+
+def fetch_distance_matrix(client, origins, destinations, mode="driving", workers=None,
+                          elements_per_second=None, max_retries=None, backoff_s=0.5, stats=None):
+    """
+    Matriz completa origens × destinos em blocos paralelos.
+    Devolve uma resposta no formato da Distance Matrix ({'rows': [{'elements': [...]}]}),
+    com uma linha por origem e um elemento por destino.
+    'stats' (opcional) recebe o número de blocos/elementos e o tempo total.
+    """
+    tiles = plan_tiles(len(origins), len(destinations))
+    bucket = TokenBucket(elements_per_second or DISTANCE_ELEMENTS_PER_SECOND)
+    max_retries = DISTANCE_MAX_RETRIES if max_retries is None else max_retries
+    rows = [[None] * len(destinations) for _ in origins]
+
+    def run(tile):
+        o0, o1, d0, d1 = tile
+        response = _fetch_tile(client, origins[o0:o1], destinations[d0:d1], mode, bucket, max_retries, backoff_s)
+        for i, row in enumerate(response.get('rows', [])):
+            rows[o0 + i][d0:d0 + len(row.get('elements', []))] = row.get('elements', [])
+
+    t0 = time.perf_counter()
+    n_workers = max(1, min(workers or DISTANCE_WORKERS, len(tiles)))
+    print(f"ℹ️ Distance Matrix: {len(origins)}×{len(destinations)} em {len(tiles)} blocos, {n_workers} em paralelo.")
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for future in [pool.submit(run, tile) for tile in tiles]:
+            future.result()
+    if stats is not None:
+        stats.update({'tiles': len(tiles), 'elements': len(origins) * len(destinations),
+                      'time_s': time.perf_counter() - t0})
+    missing = {'status': 'NOT_FOUND'}
+    return {'status': 'OK', 'rows': [{'elements': [e if e is not None else missing for e in row]} for row in rows]}
+
+
+class StubDistanceClient:
+    """
+    Cliente local com a mesma interface de gmaps.distance_matrix, para correr sem
+    rede nem quota: distâncias Haversine × road_factor, latência simulada e uma
+    fração de erros transitórios (OVER_QUERY_LIMIT) para exercitar as repetições.
+    """
+
+    def __init__(self, latency_s=0.05, failure_rate=0.0, road_factor=1.3, speed_kmh=80.0, seed=0):
+        self.latency_s = latency_s
+        self.failure_rate = failure_rate
+        self.road_factor = road_factor
+        self.speed_kmh = speed_kmh
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def distance_matrix(self, origins, destinations, mode="driving"):
+        if len(origins) > MAX_ORIGINS or len(destinations) > MAX_DESTINATIONS \
+                or len(origins) * len(destinations) > MAX_ELEMENTS:
+            raise googlemaps.exceptions.ApiError('MAX_ELEMENTS_EXCEEDED')
+        with self.lock:
+            self.requests += 1
+            fail = self.random.random() < self.failure_rate
+        time.sleep(self.latency_s)
+        if fail:
+            raise googlemaps.exceptions.ApiError('OVER_QUERY_LIMIT')
+        rows = []
+        for o in origins:
+            elements = []
+            for d in destinations:
+                km = logic.haversine_distance(o, d) * self.road_factor
+                minutes = km / self.speed_kmh * 60
+                elements.append({
+                    'status': 'OK',
+                    'distance': {'text': format_distance_text(km), 'value': int(km * 1000)},
+                    'duration': {'text': format_duration_text(minutes), 'value': int(round(minutes)) * 60}
+                })
+            rows.append({'elements': elements})
+        return {'status': 'OK', 'rows': rows}
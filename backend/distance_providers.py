@@ -0,0 +1,155 @@
+# backend/distance_providers.py
+# Fornecedores de matrizes de distâncias CD × destinos.
+#
+# Todos implementam build_tables(origins, origin_names, groups), em que 'groups'
+# é uma lista de (pontos, nomes) de destinos (p. ex. fábricas e clientes), e
+# devolvem por grupo o par (tabela_full, tabela_solver) no formato de sempre:
+# [['Destino'] + nomes das origens, [nome do destino, valor por origem...], ...].
+#   - GoogleDistanceProvider: Distance Matrix da Google (uma só matriz para todos
+#     os grupos, em blocos paralelos).
+#   - HaversineDistanceProvider: local e vetorizado, distância ortodrómica ×
+#     fator de desvio (calibrável a partir de pares já pedidos à Google).
+
+import re
+
+import numpy as np
+
+import distance_fetcher
+import logic
+
+DEFAULT_DETOUR_FACTOR = 1.3   # km de estrada por km em linha reta
+DEFAULT_SPEED_KMH = 80.0      # velocidade média para a duração estimada
+
+
+def parse_google_response(response, origin_names, dest_names):
+    temp_matrix_full = []
+    temp_matrix_solver = []
+    km_regex = re.compile(r"([\d\.,]+)")
+    google_rows = response.get('rows', [])
+    for i in range(len(google_rows)):
+        new_row_full = []
+        new_row_solver = []
+        elements = google_rows[i].get('elements', [])
+        for j in range(len(elements)):
+            try:
+                element = elements[j]
+                if element['status'] == 'OK':
+                    distance_text = element['distance']['text']
+                    duration_text = element['duration']['text']
+                    new_row_full.append(f"{distance_text} ({duration_text})")
+                    match = km_regex.search(distance_text.replace(',', ''))
+                    if match:
+                        km_value = float(match.group(1))
+                        new_row_solver.append(km_value)
+                    else:
+                        new_row_solver.append(0.0)
+                else:
+                    new_row_full.append(f"Erro: {element['status']}")
+                    new_row_solver.append(0.0)
+            except (KeyError, TypeError):
+                new_row_full.append("Erro Parse")
+                new_row_solver.append(0.0)
+        temp_matrix_full.append(new_row_full)
+        temp_matrix_solver.append(new_row_solver)
+    def transpose_matrix(matrix, row_headers, col_headers):
+        if not matrix or not matrix[0]:
+            if col_headers:
+                return [['Destino'] + col_headers]
+            return []
+        final_table = [['Destino'] + col_headers]
+        for j in range(len(row_headers)):
+            new_row = [row_headers[j]]
+            for i in range(len(col_headers)):
+                try:
+                    new_row.append(matrix[i][j])
+                except IndexError:
+                    new_row.append("Erro Transp.")
+            final_table.append(new_row)
+        return final_table
+    table_full = transpose_matrix(temp_matrix_full, dest_names, origin_names)
+    table_solver = transpose_matrix(temp_matrix_solver, dest_names, origin_names)
+    return table_full, table_solver
+
+
+def calibrate_detour_factor(samples, min_km=1.0):
+    """
+    Fator de desvio a partir de pares com distância de estrada conhecida:
+    mediana de estrada / linha reta (robusta a pares anómalos).
+    'samples' é uma lista de (origem, destino, km de estrada). Devolve None sem amostras úteis.
+    """
+    if not samples:
+        return None
+    o = np.array([(s[0]['lat'], s[0]['lng']) for s in samples], dtype=np.float64)
+    d = np.array([(s[1]['lat'], s[1]['lng']) for s in samples], dtype=np.float64)
+    road = np.array([s[2] for s in samples], dtype=np.float64)
+    o_rad, d_rad = np.radians(o), np.radians(d)
+    direct = logic._haversine_rad(o_rad[:, 0], o_rad[:, 1], d_rad[:, 0], d_rad[:, 1], np.cos(d_rad[:, 0]))
+    useful = direct >= min_km
+    if not useful.any():
+        return None
+    return float(np.median(road[useful] / direct[useful]))
+
+
+class GoogleDistanceProvider:
+    """
+    Distance Matrix da Google. 'fetch' tem a assinatura de
+    distance_fetcher.fetch_distance_matrix (client, origins, destinations, mode, stats)
+    e permite servir pares de um cache antes de ir à API.
+    """
+    name = 'google'
+
+    def __init__(self, client, fetch=None, mode="driving"):
+        self.client = client
+        self.fetch = fetch or distance_fetcher.fetch_distance_matrix
+        self.mode = mode
+
+    def build_tables(self, origins, origin_names, groups, stats=None):
+        destinations = [p for points, _ in groups for p in points]
+        matrix = self.fetch(self.client, origins, destinations, mode=self.mode, stats=stats)
+        tables, start = [], 0
+        for points, names in groups:
+            end = start + len(points)
+            if points:
+                part = {'rows': [{'elements': row['elements'][start:end]} for row in matrix['rows']]}
+                tables.append(parse_google_response(part, origin_names, names))
+            else:
+                tables.append(([], []))
+            start = end
+        return tables
+
+
+class HaversineDistanceProvider:
+    """ Fornecedor local: distância ortodrómica × detour_factor, sem rede nem quota. """
+    name = 'haversine'
+
+    def __init__(self, detour_factor=DEFAULT_DETOUR_FACTOR, speed_kmh=DEFAULT_SPEED_KMH):
+        self.detour_factor = float(detour_factor)
+        self.speed_kmh = float(speed_kmh)
+
+    def distance_km(self, origins, destinations):
+        """ Matriz (origens × destinos) de km de estrada estimados. """
+        o_lat, o_lng, _ = logic.points_to_arrays(origins)
+        d_lat, d_lng, _ = logic.points_to_arrays(destinations)
+        return logic.haversine_matrix_np(o_lat, o_lng, d_lat, d_lng) * self.detour_factor
+
+    def build_tables(self, origins, origin_names, groups, stats=None):
+        header = ['Destino'] + list(origin_names)
+        km_all = np.round(self.distance_km(origins, [p for points, _ in groups for p in points]), 1)
+        tables, start = [], 0
+        for points, names in groups:
+            end = start + len(points)
+            if not points:
+                tables.append(([], []))
+                continue
+            km = km_all[:, start:end].T  # linhas = destinos, colunas = origens
+            minutes = km / self.speed_kmh * 60
+            table_solver = [header] + [[name] + row for name, row in zip(names, km.tolist())]
+            table_full = [header] + [
+                [name] + [f"{distance_fetcher.format_distance_text(v)} ({distance_fetcher.format_duration_text(m)})"
+                          for v, m in zip(row_km, row_min)]
+                for name, row_km, row_min in zip(names, km.tolist(), minutes.tolist())]
+            tables.append((table_full, table_solver))
+            start = end
+        if stats is not None:
+            stats.update({'elements': km_all.size, 'detour_factor': self.detour_factor})
+        return tables
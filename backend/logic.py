@@ -4,12 +4,45 @@ import numpy as np
 import math # Precisamos da biblioteca math para as funções trigonométricas
 
 # ---------------------------------------------------------------------------
-# Função para a Página 2 (Simulador Oxy) - Permanece inalterada
+# Modos de registo das iterações (parâmetro log_mode de todas as funções)
 # ---------------------------------------------------------------------------
-def calculate_final_point(points):
+# O terceiro valor devolvido (ou a chave 'logs') depende do modo:
+#   LOG_OFF     -> [] (nenhum custo por iteração; para rotas que descartam os logs)
+#   LOG_SUMMARY -> lista curta de strings (ponto inicial, convergência, custo final)
+#   LOG_TRACE   -> array estruturado NumPy com uma linha (iter, lat, lng, step) por iteração
+LOG_OFF = 'off'
+LOG_SUMMARY = 'summary'
+LOG_TRACE = 'trace'
+
+TRACE_DTYPE = np.dtype([('iter', np.int32), ('lat', np.float64), ('lng', np.float64), ('step', np.float64)])
+TRACE_DTYPE_XY = np.dtype([('iter', np.int32), ('x', np.float64), ('y', np.float64), ('step', np.float64)])
+
+def _novo_trace(log_mode, max_iter, dtype=TRACE_DTYPE):
+    """ Pré-aloca o trace em LOG_TRACE; nos outros modos devolve None. """
+    if log_mode not in (LOG_OFF, LOG_SUMMARY, LOG_TRACE):
+        raise ValueError(f"log_mode inválido: '{log_mode}'. Use '{LOG_OFF}', '{LOG_SUMMARY}' ou '{LOG_TRACE}'.")
+    return np.zeros(max_iter, dtype=dtype) if log_mode == LOG_TRACE else None
+
+def _escolher_logs(log_mode, resumo, trace, n):
+    """ Devolve os logs no formato do modo pedido (ver acima). """
+    if log_mode == LOG_TRACE:
+        return trace[:n]
+    if log_mode == LOG_SUMMARY:
+        return resumo
+    return []
+
+def format_trace(trace):
+    """ Converte um trace estruturado nas linhas de texto antigas (só para mostrar). """
+    x, y = trace.dtype.names[1:3]
+    return [f"Iter {t['iter']}: ({x}: {t[x]:.6f}, {y}: {t[y]:.6f}), Passo: {t['step']:.6g}" for t in trace]
+
+# ---------------------------------------------------------------------------
+# Função para a Página 2 (Simulador Oxy)
+# ---------------------------------------------------------------------------
+def calculate_final_point(points, log_mode=LOG_SUMMARY):
     logs = []
     if not points:
-        return {'x': 0, 'y': 0}, 0, logs
+        return {'x': 0, 'y': 0}, 0, _escolher_logs(log_mode, logs, _novo_trace(log_mode, 0, TRACE_DTYPE_XY), 0)
 
     lista_x = [p['x'] for p in points]
     lista_y = [p['y'] for p in points]
@@ -23,6 +56,7 @@ def calculate_final_point(points):
     epsilon = 1e-6
     iteracao = 0
     max_iter = 100
+    trace = _novo_trace(log_mode, max_iter, TRACE_DTYPE_XY)
 
     while iteracao < max_iter:
         iteracao += 1
@@ -40,7 +74,8 @@ def calculate_final_point(points):
 
         x_new = soma_x / soma_div
         y_new = soma_y / soma_div
-        logs.append(f"Iter {iteracao}: ({x_new:.4f}, {y_new:.4f})")
+        if trace is not None:
+            trace[iteracao - 1] = (iteracao, x_new, y_new, math.hypot(x_new - x_old, y_new - y_old))
 
         if abs(x_new - x_old) < epsilon and abs(y_new - y_old) < epsilon:
             logs.append(f"\n✅ Convergência atingida em {iteracao} iterações!")
@@ -49,7 +84,8 @@ def calculate_final_point(points):
         x_old, y_old = x_new, y_new
     
     c = sum([lista_w[i]*distancias[i] for i in range(len(lista_x))])
-    return {'x': round(x_new,4), 'y': round(y_new,4)}, round(c,4), logs
+    logs.append(f"Ponto final: ({x_new:.4f}, {y_new:.4f}), Custo: {c:.4f}")
+    return {'x': round(x_new,4), 'y': round(y_new,4)}, round(c,4), _escolher_logs(log_mode, logs, trace, iteracao)
 
 # ---------------------------------------------------------------------------
 # NOVAS Funções para a Página 3 (Mapa com precisão geográfica)
@@ -77,13 +113,13 @@ def haversine_distance(p1, p2):
     distance = R * c
     return distance
 
-def calculate_weiszfeld_haversine(points):
+def calculate_weiszfeld_haversine(points, log_mode=LOG_SUMMARY):
     """
     Versão do método de Weiszfeld que usa a distância Haversine.
     """
     logs = ["Iniciando cálculo geográfico preciso com Haversine..."]
     if not points:
-        return {'lat': 0, 'lng': 0}, 0, logs
+        return {'lat': 0, 'lng': 0}, 0, _escolher_logs(log_mode, logs, _novo_trace(log_mode, 0), 0)
 
     lista_lat = [p['lat'] for p in points]
     lista_lng = [p['lng'] for p in points]
@@ -98,6 +134,7 @@ def calculate_weiszfeld_haversine(points):
     epsilon_km = 0.01  # 10 metros
     iteracao = 0
     max_iter = 100
+    trace = _novo_trace(log_mode, max_iter)
 
     while iteracao < max_iter:
         iteracao += 1
@@ -114,7 +151,8 @@ def calculate_weiszfeld_haversine(points):
             
             # Se o ponto de teste calhar em cima de um ponto de cliente, retornamos esse ponto.
             if d < 1e-9:
-                return destination_point, 0, logs + [f"Ponto ótimo encontrado em cima do cliente {i+1}."]
+                logs.append(f"Ponto ótimo encontrado em cima do cliente {i+1}.")
+                return destination_point, 0, _escolher_logs(log_mode, logs, trace, iteracao - 1)
 
             w_d = lista_w[i] / d
             soma_lat_ponderada += lista_lat[i] * w_d
@@ -128,7 +166,8 @@ def calculate_weiszfeld_haversine(points):
         
         # A condição de paragem é a distância que o ponto ótimo se moveu
         distancia_movimento = haversine_distance({'lat': lat_old, 'lng': lng_old}, {'lat': lat_new, 'lng': lng_new})
-        logs.append(f"Iter {iteracao}: (Lat: {lat_new:.6f}, Lng: {lng_new:.6f}), Deslocamento: {distancia_movimento*1000:.2f}m")
+        if trace is not None:
+            trace[iteracao - 1] = (iteracao, lat_new, lng_new, distancia_movimento)
 
         if distancia_movimento < epsilon_km:
             logs.append(f"\n✅ Convergência atingida em {iteracao} iterações!")
@@ -145,12 +184,429 @@ def calculate_weiszfeld_haversine(points):
     
     logs.append(f"Custo total final: {c:.2f} (unidade ponderada em km)")
         
-    return final_point, round(c, 2), logs
+    return final_point, round(c, 2), _escolher_logs(log_mode, logs, trace, iteracao)
+
+# ---------------------------------------------------------------------------
+# Motor vetorizado (NumPy) do Weiszfeld geográfico
+# ---------------------------------------------------------------------------
+# Em vez de criar um dicionário por cliente e chamar haversine_distance um a um,
+# guardamos lat/lng/pesos em arrays float64 contíguos e calculamos todas as
+# distâncias e somas ponderadas de uma iteração numa só passagem.
+
+R_TERRA_KM = 6371.0  # Raio médio da Terra em km (o mesmo de haversine_distance)
+
+def points_to_arrays(points):
+    """
+    Converte a lista de pontos {'lat', 'lng', 'w'} em três arrays float64.
+    Os pesos nulos/ausentes passam a 1 (mesma regra de calculate_weiszfeld_haversine).
+    """
+    n = len(points)
+    lista_lat = np.fromiter((p['lat'] for p in points), dtype=np.float64, count=n)
+    lista_lng = np.fromiter((p['lng'] for p in points), dtype=np.float64, count=n)
+    lista_w = np.fromiter((p.get('w', 1) or 1 for p in points), dtype=np.float64, count=n)
+    return lista_lat, lista_lng, lista_w
+
+def _haversine_rad(lat_rad, lng_rad, lats_rad, lngs_rad, cos_lats):
+    """
+    Distância (km) entre pontos já em radianos. lat_rad/lng_rad podem ser
+    escalares (um ponto contra todos) ou arrays alinhados (par a par).
+    """
+    sin_dlat = np.sin((lats_rad - lat_rad) / 2)
+    sin_dlng = np.sin((lngs_rad - lng_rad) / 2)
+    a = sin_dlat * sin_dlat + np.cos(lat_rad) * cos_lats * sin_dlng * sin_dlng
+    return 2 * R_TERRA_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def haversine_distance_np(point, lista_lat, lista_lng):
+    """
+    Versão vetorizada de haversine_distance.
+    Devolve um array com a distância (km) de 'point' a cada (lat, lng) dos arrays.
+    """
+    lats_rad = np.radians(lista_lat)
+    return _haversine_rad(math.radians(point['lat']), math.radians(point['lng']),
+                          lats_rad, np.radians(lista_lng), np.cos(lats_rad))
+
+def haversine_matrix_np(lat_a, lng_a, lat_b, lng_b):
+    """
+    Matriz (len(a) × len(b)) de distâncias Haversine (km) entre dois conjuntos de
+    pontos dados como arrays de graus, calculada por broadcasting.
+    """
+    lat_a, lat_b = np.radians(lat_a)[:, None], np.radians(lat_b)[None, :]
+    return _haversine_rad(lat_a, np.radians(lng_a)[:, None], lat_b, np.radians(lng_b)[None, :], np.cos(lat_b))
+
+def calculate_weiszfeld_haversine_np(points, log_mode=LOG_SUMMARY):
+    """
+    Weiszfeld com distância Haversine, vetorizado com NumPy.
+    Mesmo contrato (ponto, custo, logs) e mesmos critérios de paragem de
+    calculate_weiszfeld_haversine, mas O(iterações) operações em arrays.
+    """
+    logs = ["Iniciando cálculo geográfico preciso com Haversine (NumPy)..."]
+    if not points:
+        return {'lat': 0, 'lng': 0}, 0, _escolher_logs(log_mode, logs, _novo_trace(log_mode, 0), 0)
+
+    lista_lat, lista_lng, lista_w = points_to_arrays(points)
+    lats_rad = np.radians(lista_lat)
+    lngs_rad = np.radians(lista_lng)
+    cos_lats = np.cos(lats_rad)
+
+    # Ponto inicial: média ponderada
+    soma_w = lista_w.sum()
+    lat_old = float(lista_lat @ lista_w / soma_w)
+    lng_old = float(lista_lng @ lista_w / soma_w)
+    lat_new, lng_new = lat_old, lng_old
+    logs.append(f"Ponto inicial: (Lat: {lat_old:.6f}, Lng: {lng_old:.6f})")
+
+    epsilon_km = 0.01  # 10 metros
+    iteracao = 0
+    max_iter = 100
+    trace = _novo_trace(log_mode, max_iter)
+
+    while iteracao < max_iter:
+        iteracao += 1
+        d = _haversine_rad(math.radians(lat_old), math.radians(lng_old), lats_rad, lngs_rad, cos_lats)
+
+        # Ponto de teste em cima de um cliente: devolvemos esse cliente (o primeiro, como no ciclo)
+        em_cima = d < 1e-9
+        if em_cima.any():
+            i = int(np.argmax(em_cima))
+            destination_point = {'lat': float(lista_lat[i]), 'lng': float(lista_lng[i])}
+            logs.append(f"Ponto ótimo encontrado em cima do cliente {i+1}.")
+            return destination_point, 0, _escolher_logs(log_mode, logs, trace, iteracao - 1)
+
+        w_d = lista_w / d
+        soma_pesos_inversos = w_d.sum()
+        if soma_pesos_inversos == 0: break
+
+        lat_new = float(lista_lat @ w_d / soma_pesos_inversos)
+        lng_new = float(lista_lng @ w_d / soma_pesos_inversos)
+
+        distancia_movimento = haversine_distance({'lat': lat_old, 'lng': lng_old}, {'lat': lat_new, 'lng': lng_new})
+        if trace is not None:
+            trace[iteracao - 1] = (iteracao, lat_new, lng_new, distancia_movimento)
+
+        if distancia_movimento < epsilon_km:
+            logs.append(f"\n✅ Convergência atingida em {iteracao} iterações!")
+            break
+
+        lat_old, lng_old = lat_new, lng_new
+
+    final_point = {'lat': lat_new, 'lng': lng_new}
+    d = _haversine_rad(math.radians(lat_new), math.radians(lng_new), lats_rad, lngs_rad, cos_lats)
+    c = float(lista_w @ d)
+
+    logs.append(f"Custo total final: {c:.2f} (unidade ponderada em km)")
+
+    return final_point, round(c, 2), _escolher_logs(log_mode, logs, trace, iteracao)
+
+# ---------------------------------------------------------------------------
+# Weiszfeld em lote: vários grupos (países, regiões...) resolvidos em conjunto
+# ---------------------------------------------------------------------------
+# O Weiszfeld simples converge linearmente e pára em silêncio no max_iter.
+# Aqui damos o passo y + λ·(T(y) - y) (Ostresh: converge para λ em [1, 2]),
+# com salvaguarda de descida: cada grupo fica com o melhor de T(y) e do passo relaxado.
+# Quando o ponto atual coincide com um ponto de procura usa-se a regra de
+# Vardi–Zhang em vez de parar nesse ponto ou dividir por zero.
+
+KM_POR_GRAU = math.pi * R_TERRA_KM / 180
+
+def calculate_weiszfeld_haversine_grouped(lista_lat, lista_lng, lista_w, grupos, n_grupos, lat_inicial=None, lng_inicial=None,
+                                          relaxation=1.8, epsilon_km=0.01, max_iter=100, trace=None):
+    """
+    Resolve o Weiszfeld Haversine acelerado para n_grupos conjuntos de pontos de uma só vez.
+    'grupos' é um array de inteiros (0..n_grupos-1) com o grupo de cada ponto.
+    Cada iteração é uma computação segmentada (np.bincount) sobre todos os grupos
+    ainda ativos; os grupos que convergem ficam congelados, como no ciclo individual.
+    lat_inicial/lng_inicial (opcionais, NaN = sem arranque a quente) substituem
+    a média ponderada como ponto inicial de cada grupo.
+    Se 'trace' (array pré-alocado) for dado, regista (iter, lat, lng, passo) do grupo 0.
+
+    Devolve (lat, lng, custo, iteracoes, convergido, passo), arrays com n_grupos posições
+    (passo = último deslocamento em km).
+    """
+    lats_rad = np.radians(lista_lat)
+    lngs_rad = np.radians(lista_lng)
+    cos_lats = np.cos(lats_rad)
+
+    def distancias(lat, lng, sel, g):
+        return _haversine_rad(np.radians(lat[g]), np.radians(lng[g]), lats_rad[sel], lngs_rad[sel], cos_lats[sel])
+
+    soma_w = np.bincount(grupos, weights=lista_w, minlength=n_grupos)
+    lat_c = np.bincount(grupos, weights=lista_lat * lista_w, minlength=n_grupos) / soma_w
+    lng_c = np.bincount(grupos, weights=lista_lng * lista_w, minlength=n_grupos) / soma_w
+    if lat_inicial is not None and lng_inicial is not None:
+        quente = ~(np.isnan(lat_inicial) | np.isnan(lng_inicial))
+        lat_c[quente] = lat_inicial[quente]
+        lng_c[quente] = lng_inicial[quente]
+
+    ativo = np.ones(n_grupos, dtype=bool)
+    convergido = np.zeros(n_grupos, dtype=bool)
+    iteracoes = np.zeros(n_grupos, dtype=np.int64)
+    passo = np.full(n_grupos, np.inf)
+    # Pontos dos grupos ativos e as suas distâncias ao ponto atual (passam de uma iteração para a seguinte)
+    sel = np.arange(len(grupos))
+    g = grupos
+    d = distancias(lat_c, lng_c, sel, g)
+
+    for _ in range(max_iter):
+        if not ativo.any(): break
+        registar = trace is not None and ativo[0]
+        manter = ativo[g]
+        sel, g, d = sel[manter], g[manter], d[manter]
+        iteracoes[ativo] += 1
+
+        custo = np.bincount(g, weights=lista_w[sel] * d, minlength=n_grupos)
+        zero = d < 1e-9
+        w_d = np.divide(lista_w[sel], d, out=np.zeros_like(d), where=~zero)
+        soma = np.bincount(g, weights=w_d, minlength=n_grupos)
+        lat_t = np.divide(np.bincount(g, weights=lista_lat[sel] * w_d, minlength=n_grupos), soma, out=lat_c.copy(), where=soma > 0)
+        lng_t = np.divide(np.bincount(g, weights=lista_lng[sel] * w_d, minlength=n_grupos), soma, out=lng_c.copy(), where=soma > 0)
+
+        # Todos os pontos do grupo coincidem com o ponto atual
+        parados = ativo & (soma == 0)
+
+        peso_zero = np.bincount(g[zero], weights=lista_w[sel][zero], minlength=n_grupos)
+        em_cima = ativo & ~parados & (peso_zero > 0)
+        if em_cima.any():
+            # Vardi–Zhang: o ponto de procura é ótimo se a "força" dos restantes não vencer o seu peso
+            r = np.hypot(np.bincount(g, weights=w_d * (lista_lat[sel] - lat_c[g]), minlength=n_grupos) * KM_POR_GRAU,
+                         np.bincount(g, weights=w_d * (lista_lng[sel] - lng_c[g]), minlength=n_grupos)
+                         * KM_POR_GRAU * np.cos(np.radians(lat_c)))
+            parados |= em_cima & (r <= peso_zero)
+            beta = np.divide(peso_zero, r, out=np.zeros(n_grupos), where=em_cima & (r > peso_zero))
+            lat_t = (1 - beta) * lat_t + beta * lat_c
+            lng_t = (1 - beta) * lng_t + beta * lng_c
+
+        passo[parados] = 0.0
+        convergido[parados] = True
+        ativo &= ~parados
+
+        idx = np.flatnonzero(ativo)
+        passo[idx] = _haversine_rad(np.radians(lat_c[idx]), np.radians(lng_c[idx]),
+                                    np.radians(lat_t[idx]), np.radians(lng_t[idx]), np.cos(np.radians(lat_t[idx])))
+        fim = idx[passo[idx] < epsilon_km]
+        lat_c[fim], lng_c[fim] = lat_t[fim], lng_t[fim]
+        convergido[fim] = True
+        ativo[fim] = False
+
+        idx = np.flatnonzero(ativo)
+        manter = ativo[g]
+        sel, g = sel[manter], g[manter]
+        d = distancias(lat_t, lng_t, sel, g)
+        if relaxation != 1 and idx.size:
+            # Passo sobre-relaxado; fica o melhor dos dois, pelo que o custo nunca sobe
+            lat_n = lat_c + relaxation * (lat_t - lat_c)
+            lng_n = lng_c + relaxation * (lng_t - lng_c)
+            d_n = distancias(lat_n, lng_n, sel, g)
+            melhor = (np.bincount(g, weights=lista_w[sel] * d_n, minlength=n_grupos)
+                      <= np.bincount(g, weights=lista_w[sel] * d, minlength=n_grupos))
+            lat_t = np.where(melhor, lat_n, lat_t)
+            lng_t = np.where(melhor, lng_n, lng_t)
+            d = np.where(melhor[g], d_n, d)
+        lat_c[idx], lng_c[idx] = lat_t[idx], lng_t[idx]
+
+        if registar:
+            trace[iteracoes[0] - 1] = (iteracoes[0], lat_c[0], lng_c[0], passo[0])
+
+    d = _haversine_rad(np.radians(lat_c[grupos]), np.radians(lng_c[grupos]), lats_rad, lngs_rad, cos_lats)
+    custo = np.bincount(grupos, weights=lista_w * d, minlength=n_grupos)
+    return lat_c, lng_c, custo, iteracoes, convergido, passo
+
+def solve_weiszfeld_haversine(points, start=None, relaxation=1.8, epsilon_km=0.01, max_iter=100, log_mode=LOG_SUMMARY):
+    """
+    Weiszfeld Haversine acelerado para um só conjunto de pontos (um grupo do motor em lote).
+    'start' ({'lat', 'lng'}) permite arrancar a quente; o passo final vem em km.
+    """
+    trace = _novo_trace(log_mode, max_iter)
+    if not points:
+        return {'point': {'lat': 0, 'lng': 0}, 'cost': 0, 'iterations': 0, 'step': 0.0, 'converged': True,
+                'logs': _escolher_logs(log_mode, [], trace, 0)}
+
+    lista_lat, lista_lng, lista_w = points_to_arrays(points)
+    if start:
+        lat0, lng0 = float(start['lat']), float(start['lng'])
+    else:
+        lat0 = float(lista_lat @ lista_w / lista_w.sum())
+        lng0 = float(lista_lng @ lista_w / lista_w.sum())
+    logs = [f"Ponto inicial: (Lat: {lat0:.6f}, Lng: {lng0:.6f})" + (" [arranque a quente]" if start else "")]
+
+    lat, lng, custo, iteracoes, convergido, passo = calculate_weiszfeld_haversine_grouped(
+        lista_lat, lista_lng, lista_w, np.zeros(len(lista_lat), dtype=np.int64), 1,
+        np.array([lat0]), np.array([lng0]), relaxation, epsilon_km, max_iter, trace)
+    iteracao, passo, converged = int(iteracoes[0]), float(passo[0]), bool(convergido[0])
+    if converged and passo == 0:
+        logs.append(f"Iter {iteracao}: ponto ótimo em cima de um ponto de procura (Vardi–Zhang).")
+    logs.append(f"\n✅ Convergência atingida em {iteracao} iterações!" if converged
+                else f"\n⚠️ Limite de {max_iter} iterações atingido sem convergência (passo: {passo*1000:.2f}m).")
+    logs.append(f"Custo total final: {custo[0]:.2f} (unidade ponderada em km)")
+
+    return {'point': {'lat': float(lat[0]), 'lng': float(lng[0])}, 'cost': round(float(custo[0]), 2), 'iterations': iteracao,
+            'step': passo, 'converged': converged, 'logs': _escolher_logs(log_mode, logs, trace, iteracao)}
+
+def calculate_gravity_by_group(rows, warm_start=None):
+    """
+    Centro de gravidade por grupo a partir de uma única leitura da base de dados.
+    'rows' é uma sequência de (grupo, lat, lng, w); os grupos vazios/None são ignorados.
+    'warm_start' opcional: { grupo: {'lat', 'lng'} }, p. ex. o resultado anterior.
+    Devolve { grupo: {'final_point', 'total_cost', 'client_count', 'iterations', 'converged'} }.
+    """
+    rows = [r for r in rows if r[0]]
+    if not rows:
+        return {}
+
+    chaves, grupos = np.unique(np.array([str(r[0]) for r in rows]), return_inverse=True)
+    lista_lat, lista_lng, lista_w = points_to_arrays([{'lat': r[1], 'lng': r[2], 'w': r[3]} for r in rows])
+
+    lat_inicial = lng_inicial = None
+    if warm_start:
+        lat_inicial = np.full(len(chaves), np.nan)
+        lng_inicial = np.full(len(chaves), np.nan)
+        for k, chave in enumerate(chaves):
+            ponto = warm_start.get(str(chave))
+            if ponto:
+                lat_inicial[k], lng_inicial[k] = float(ponto['lat']), float(ponto['lng'])
+
+    lat_c, lng_c, custo, iteracoes, convergido, _ = calculate_weiszfeld_haversine_grouped(
+        lista_lat, lista_lng, lista_w, grupos, len(chaves), lat_inicial, lng_inicial)
+    contagem = np.bincount(grupos, minlength=len(chaves))
+
+    return {
+        str(chave): {
+            'final_point': {'lat': float(lat_c[k]), 'lng': float(lng_c[k])},
+            'total_cost': round(float(custo[k]), 2),
+            'client_count': int(contagem[k]),
+            'iterations': int(iteracoes[k]),
+            'converged': bool(convergido[k])
+        }
+        for k, chave in enumerate(chaves)
+    }
+
+# ---------------------------------------------------------------------------
+# Localização-afetação com vários centros (Cooper): p centros para os clientes
+# ---------------------------------------------------------------------------
+# Alterna (1) afetar cada cliente ao centro mais próximo e (2) mover cada centro
+# para o ponto de Weiszfeld dos seus clientes, até as afetações não mudarem.
+# O custo nunca sobe, mas o resultado depende do arranque: correm-se 'restarts'
+# arranques aleatórios (k-means++ ponderado) EM LOTE — os clientes são replicados
+# por arranque e o grupo r*p + c é o centro c do arranque r, de modo que cada
+# passo de localização é uma única chamada a calculate_weiszfeld_haversine_grouped.
+COOPER_RESTARTS = 8
+COOPER_MAX_ITER = 50
+COOPER_TOLERANCE = 1e-6  # melhoria relativa do custo abaixo da qual um arranque para
+
+def _cooper_seeds(lista_lat, lista_lng, lista_w, p, restarts, rng):
+    """ Centros iniciais (restarts × p) por k-means++ ponderado com distâncias Haversine. """
+    n = len(lista_lat)
+    lat_c = np.empty((restarts, p))
+    lng_c = np.empty((restarts, p))
+    prob = lista_w / lista_w.sum()
+    for r in range(restarts):
+        k = rng.choice(n, p=prob)
+        lat_c[r, 0], lng_c[r, 0] = lista_lat[k], lista_lng[k]
+        d = haversine_distance_np({'lat': lat_c[r, 0], 'lng': lng_c[r, 0]}, lista_lat, lista_lng)
+        for c in range(1, p):
+            peso = lista_w * d * d
+            k = rng.choice(n, p=peso / peso.sum()) if peso.sum() > 0 else rng.integers(n)
+            lat_c[r, c], lng_c[r, c] = lista_lat[k], lista_lng[k]
+            d = np.minimum(d, haversine_distance_np({'lat': lat_c[r, c], 'lng': lng_c[r, c]}, lista_lat, lista_lng))
+    return lat_c, lng_c
+
+def _unit_vectors(lista_lat, lista_lng):
+    """ Pontos na esfera unitária (n × 3): o centro mais próximo é o de maior produto interno. """
+    lat, lng = np.radians(lista_lat), np.radians(lista_lng)
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+def _cooper_assign(lista_lat, lista_lng, lat_c, lng_c):
+    """ Centro mais próximo de cada cliente em cada arranque: (afetações, distâncias), ambos arranques × n. """
+    restarts, p = lat_c.shape
+    # argmin da distância Haversine = argmax do produto interno (uma multiplicação de matrizes);
+    # a distância em km só se calcula para o centro escolhido
+    dot = (_unit_vectors(lista_lat, lista_lng) @ _unit_vectors(lat_c.reshape(-1), lng_c.reshape(-1)).T).reshape(-1, restarts, p)
+    labels = dot.argmax(axis=2).T
+    lat_sel = np.take_along_axis(lat_c, labels, axis=1)
+    lng_sel = np.take_along_axis(lng_c, labels, axis=1)
+    lats_rad = np.radians(lista_lat)
+    d = _haversine_rad(np.radians(lat_sel), np.radians(lng_sel), lats_rad, np.radians(lista_lng), np.cos(lats_rad))
+    return labels, d
+
+def solve_cooper_haversine(points, p, restarts=COOPER_RESTARTS, seed=0, max_iter=COOPER_MAX_ITER):
+    """
+    Localização-afetação de Cooper com distância Haversine: p centros que minimizam
+    Σ w × distância ao centro mais próximo, com 'restarts' arranques aleatórios em lote.
+    Devolve {'centers', 'assignments', 'cost', 'iterations', 'converged', 'restart_costs'}
+    do melhor arranque; cada centro traz o peso e o número de clientes afetados.
+    """
+    if not points:
+        return {'centers': [], 'assignments': [], 'cost': 0, 'iterations': 0, 'converged': True, 'restart_costs': []}
+    p = int(p)
+    if p < 1:
+        raise ValueError(f"Número de centros inválido: {p}. Tem de ser pelo menos 1.")
+    restarts = max(1, int(restarts))
+    lista_lat, lista_lng, lista_w = points_to_arrays(points)
+    n = len(lista_lat)
+    p = min(p, n)
+    lat_c, lng_c = _cooper_seeds(lista_lat, lista_lng, lista_w, p, restarts, np.random.default_rng(seed))
+
+    labels = np.full((restarts, n), -1, dtype=np.int64)
+    custos = np.full(restarts, np.inf)
+    iteracoes = np.zeros(restarts, dtype=np.int64)
+    convergido = np.zeros(restarts, dtype=bool)
+    # Centros em cima de um cliente (sementes e centros recolocados) arrancam da média
+    # ponderada do grupo: em cima do cliente o primeiro passo seria o de Vardi–Zhang
+    em_cliente = np.ones((restarts, p), dtype=bool)
+    ativo = np.ones(restarts, dtype=bool)
+
+    for _ in range(max_iter):
+        idx = np.flatnonzero(ativo)
+        iteracoes[idx] += 1
+        new_labels, d = _cooper_assign(lista_lat, lista_lng, lat_c[idx], lng_c[idx])
+        # Centro sem clientes: passa para o cliente que mais pesa no custo desse arranque
+        contagem = np.zeros((len(idx), p), dtype=np.int64)
+        np.add.at(contagem, (np.repeat(np.arange(len(idx)), n), new_labels.reshape(-1)), 1)
+        vazios = contagem == 0
+        for r, c in zip(*np.nonzero(vazios)):
+            k = int(np.argmax(lista_w * d[r]))
+            lat_c[idx[r], c], lng_c[idx[r], c] = lista_lat[k], lista_lng[k]
+            new_labels[r, k], d[r, k] = c, 0.0
+            em_cliente[idx[r], c] = True
+        novo_custo = d @ lista_w
+        # Para quando as afetações não mudam ou o custo já quase não desce
+        parar = ~vazios.any(axis=1) & ((new_labels == labels[idx]).all(axis=1)
+                                       | (custos[idx] - novo_custo <= COOPER_TOLERANCE * novo_custo))
+        labels[idx], custos[idx] = new_labels, novo_custo
+        convergido[idx[parar]] = True
+        ativo[idx[parar]] = False
+        if not ativo.any():
+            break
+
+        # Passo de localização só para os arranques ativos (grupo r*p + c = centro c do arranque r)
+        idx = np.flatnonzero(ativo)
+        grupos = (labels[idx] + (np.arange(len(idx)) * p)[:, None]).reshape(-1)
+        lat_g, lng_g, _, _, _, _ = calculate_weiszfeld_haversine_grouped(
+            np.tile(lista_lat, len(idx)), np.tile(lista_lng, len(idx)), np.tile(lista_w, len(idx)), grupos, len(idx) * p,
+            np.where(em_cliente[idx], np.nan, lat_c[idx]).reshape(-1), np.where(em_cliente[idx], np.nan, lng_c[idx]).reshape(-1))
+        lat_c[idx], lng_c[idx] = lat_g.reshape(-1, p), lng_g.reshape(-1, p)
+        em_cliente[idx] = False
+
+    # Afetação final aos centros finais (nos arranques que esgotaram max_iter os centros já se moveram)
+    labels, d = _cooper_assign(lista_lat, lista_lng, lat_c, lng_c)
+    custos = d @ lista_w
+    melhor = int(custos.argmin())
+    afetacao = labels[melhor]
+    peso = np.bincount(afetacao, weights=lista_w, minlength=p)
+    contagem = np.bincount(afetacao, minlength=p)
+    return {
+        'centers': [{'lat': float(lat_c[melhor, c]), 'lng': float(lng_c[melhor, c]),
+                     'weight': float(peso[c]), 'client_count': int(contagem[c])} for c in range(p)],
+        'assignments': afetacao.tolist(),
+        'cost': round(float(custos[melhor]), 2),
+        'iterations': int(iteracoes[melhor]),
+        'converged': bool(convergido[melhor]),
+        'restart_costs': [round(float(c), 2) for c in custos],
+    }
 
 # ---------------------------------------------------------------------------
 # Função antiga da Página 3, agora ATUALIZADA para chamar a nova lógica
 # ---------------------------------------------------------------------------
-def calculate_from_geo_as_cartesian(points):
-    # Esta função agora simplesmente chama a nova função Haversine.
+def calculate_from_geo_as_cartesian(points, log_mode=LOG_SUMMARY):
+    # Esta função agora chama o motor Haversine vetorizado (NumPy).
     # Mantemos o nome para não ter que mudar nada no app.py.
-    return calculate_weiszfeld_haversine(points)
\ No newline at end of file
+    return calculate_weiszfeld_haversine_np(points, log_mode)
\ No newline at end of file
@@ -0,0 +1,57 @@
+# backend/matrix_store.py
+# Armazenamento binário das matrizes de custos do solver.
+#
+# Em vez de um json.dumps da tabela ([['Destino'] + origens, [destino, km...], ...])
+# guarda-se um .npz (sem pickle) com três colunas: os valores como array float
+# (linhas = destinos, colunas = origens) e os dois vetores de cabeçalhos.
+# A leitura devolve logo o array NumPy, que o solver aceita sem passar por texto.
+
+import io
+import os
+
+import numpy as np
+
+from solver_algorithm import cost_matrix
+
+# 'float32' reduz o tamanho a metade, mas arredonda os km (e muda o hash dos resultados)
+MATRIX_CACHE_DTYPE = os.environ.get('MATRIX_CACHE_DTYPE', 'float64')
+MATRIX_CACHE_COMPRESS = os.environ.get('MATRIX_CACHE_COMPRESS', '1').lower() in ('1', 'true', 'yes')
+
+
+def table_to_arrays(table):
+    """ Tabela do solver -> (valores [destinos × origens], nomes dos destinos, nomes das origens). """
+    if not table:
+        return np.zeros((0, 0)), [], []
+    col_headers = [str(h) for h in table[0][1:]]
+    row_headers = [str(row[0]) for row in table[1:]]
+    return cost_matrix(table), row_headers, col_headers
+
+
+def arrays_to_table(values, row_headers, col_headers):
+    """ Inverso de table_to_arrays: volta ao formato de tabela do frontend. """
+    if not col_headers and not row_headers:
+        return []
+    return [['Destino'] + list(col_headers)] + [[name] + row for name, row in zip(row_headers, np.asarray(values).tolist())]
+
+
+def pack_matrix(values, row_headers, col_headers, dtype=None, compress=None):
+    """ Serializa a matriz e os cabeçalhos num blob .npz. """
+    buffer = io.BytesIO()
+    save = np.savez_compressed if (MATRIX_CACHE_COMPRESS if compress is None else compress) else np.savez
+    save(buffer,
+         values=np.asarray(values, dtype=dtype or MATRIX_CACHE_DTYPE),
+         row_headers=np.array(row_headers, dtype=np.str_),
+         col_headers=np.array(col_headers, dtype=np.str_))
+    return buffer.getvalue()
+
+
+def unpack_matrix(blob):
+    """ Blob .npz -> (valores float64, nomes dos destinos, nomes das origens). """
+    with np.load(io.BytesIO(blob), allow_pickle=False) as npz:
+        return (npz['values'].astype(np.float64, copy=False),
+                npz['row_headers'].tolist(), npz['col_headers'].tolist())
+
+
+def pack_table(table, dtype=None, compress=None):
+    """ Atalho: tabela do solver -> blob. """
+    return pack_matrix(*table_to_arrays(table), dtype=dtype, compress=compress)
@@ -0,0 +1,212 @@
+# backend/solver_aggregation.py
+# Agregação de clientes antes do solver (redes com milhares de clientes).
+#
+# Clientes muito próximos (p. ex. na mesma cidade) são juntados num cliente
+# agregado: a procura é somada e a linha de custos CD->Cliente é a média
+# ponderada pela procura. O modelo reduzido é resolvido normalmente e os fluxos
+# de cada cliente agregado são depois repartidos pelos clientes originais, pelo
+# CD mais barato de cada um (os totais por CD não mudam, por isso a solução é
+# admissível no modelo original).
+#
+# Erro: se nenhum cliente se afasta mais de e[k] €/unidade da linha do seu grupo,
+# E = Σ procura[k] × e[k] limita a diferença de custo de QUALQUER solução entre os
+# dois modelos; logo ótimo original >= limite do modelo agregado - E, e o custo
+# real da solução desagregada dá um gap garantido ao ótimo original.
+#
+# Métodos de agrupamento:
+#   - 'threshold': raio em km medido nas linhas de custos (cada cliente junta-se a
+#     um líder cujos km a TODOS os CDs diferem no máximo 'aggregation_km');
+#     não precisa de coordenadas e limita diretamente o erro;
+#   - 'grid': quadrícula de 'aggregation_km' km sobre as coordenadas dos clientes;
+#   - 'kmeans': k-means ponderado pela procura com 'aggregation_clusters' grupos.
+# 'grid' e 'kmeans' precisam de 'client_points' (lat/lng pela ordem dos clientes).
+
+import time
+
+import numpy as np
+
+import logic
+from solver_matrix import relative_gap
+
+AGGREGATION_METHODS = ('threshold', 'grid', 'kmeans')
+DEFAULT_AGGREGATION_KM = 5.0
+KMEANS_MAX_ITER = 50
+
+
+def _projected(points):
+    """ lat/lng -> coordenadas planas em km (equirretangular na latitude média). """
+    lat, lng, _ = logic.points_to_arrays(points)
+    cos_lat = np.cos(np.radians(lat.mean())) if len(lat) else 1.0
+    return np.column_stack([lng * logic.KM_POR_GRAU * cos_lat, lat * logic.KM_POR_GRAU])
+
+
+def cluster_threshold(costs, radius_km):
+    """
+    Agrupamento "líder" nas linhas de custos: um cliente junta-se ao primeiro líder do
+    mesmo CD mais próximo cujas distâncias a todos os CDs difiram no máximo radius_km.
+    """
+    labels = np.empty(len(costs), dtype=np.int64)
+    leaders = {}  # CD mais próximo -> (linhas dos líderes, ids dos grupos)
+    n_groups = 0
+    for k, row in enumerate(costs):
+        key = int(row.argmin())
+        rows, ids = leaders.get(key, (None, None))
+        if rows is not None:
+            match = np.flatnonzero(np.abs(rows - row).max(axis=1) <= radius_km)
+            if len(match):
+                labels[k] = ids[match[0]]
+                continue
+            leaders[key] = (np.vstack([rows, row]), ids + [n_groups])
+        else:
+            leaders[key] = (row[None, :], [n_groups])
+        labels[k] = n_groups
+        n_groups += 1
+    return labels
+
+
+def cluster_grid(points, cell_km):
+    """ Quadrícula de cell_km × cell_km sobre as coordenadas projetadas. """
+    cells = np.floor(_projected(points) / cell_km).astype(np.int64)
+    return np.unique(cells, axis=0, return_inverse=True)[1].reshape(-1)
+
+
+def cluster_kmeans(points, weights, n_clusters, seed=0, max_iter=KMEANS_MAX_ITER):
+    """ k-means ponderado (Lloyd, início k-means++) sobre as coordenadas projetadas. """
+    xy = _projected(points)
+    n_clusters = max(1, min(int(n_clusters), len(xy)))
+    w = np.maximum(np.asarray(weights, dtype=np.float64), 1e-9)
+    rng = np.random.default_rng(seed)
+    centers = np.empty((n_clusters, 2))
+    centers[0] = xy[rng.choice(len(xy), p=w / w.sum())]
+    d2 = ((xy - centers[0]) ** 2).sum(axis=1)
+    for c in range(1, n_clusters):
+        p = w * d2
+        centers[c] = xy[rng.choice(len(xy), p=p / p.sum())] if p.sum() > 0 else xy[rng.integers(len(xy))]
+        d2 = np.minimum(d2, ((xy - centers[c]) ** 2).sum(axis=1))
+    labels = None
+    for _ in range(max_iter):
+        dist = (xy ** 2).sum(axis=1)[:, None] - 2 * xy @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+        new_labels = dist.argmin(axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        total = np.bincount(labels, weights=w, minlength=n_clusters)
+        cheio = total > 0
+        for axis in range(2):
+            centers[cheio, axis] = np.bincount(labels, weights=w * xy[:, axis], minlength=n_clusters)[cheio] / total[cheio]
+    return np.unique(labels, return_inverse=True)[1].reshape(-1)  # grupos vazios fora
+
+
+def cluster_clients(inp, options):
+    """
+    Grupo de cada cliente (array de inteiros 0..C-1) segundo options['client_aggregation'].
+    Lança ValueError para um método inválido ou sem 'client_points' quando são precisas.
+    """
+    method = options.get('client_aggregation')
+    if method not in AGGREGATION_METHODS:
+        raise ValueError(f"Agregação de clientes inválida: '{method}'. Opções: {list(AGGREGATION_METHODS)}")
+    km = float(options.get('aggregation_km') or DEFAULT_AGGREGATION_KM)
+    if method == 'threshold':
+        return cluster_threshold(np.asarray(inp['costs_dc_client'], dtype=np.float64), km)
+    points = options.get('client_points')
+    if not points or len(points) != len(inp['demand_client']):
+        raise ValueError(f"A agregação '{method}' precisa de 'client_points' (um ponto por cliente).")
+    if method == 'grid':
+        return cluster_grid(points, km)
+    n_clusters = options.get('aggregation_clusters') or max(1, len(points) // 10)
+    return cluster_kmeans(points, inp['demand_client'], n_clusters, options.get('aggregation_seed', 0))
+
+
+def aggregate_inputs(inp, labels):
+    """
+    Inputs do modelo reduzido: procura somada e linha de custos média (ponderada pela
+    procura; média simples num grupo sem procura) por grupo. Devolve (inputs, custos
+    unitários de agregação e[k] em €/unidade).
+    """
+    costs = np.asarray(inp['costs_dc_client'], dtype=np.float64)
+    demand = np.asarray(inp['demand_client'], dtype=np.float64)
+    n_groups = int(labels.max()) + 1 if len(labels) else 0
+    total = np.bincount(labels, weights=demand, minlength=n_groups)
+    count = np.bincount(labels, minlength=n_groups)
+    peso = np.where(total[labels] > 0, demand, 1.0)
+    soma = np.zeros((n_groups, costs.shape[1]))
+    np.add.at(soma, labels, costs * peso[:, None])
+    agg_costs = soma / np.where(total > 0, total, count)[:, None]
+    erro = np.abs(costs - agg_costs[labels]).max(axis=1) * inp['transport_cost_per_km'] if costs.size else np.zeros(len(labels))
+    return {**inp, 'costs_dc_client': agg_costs, 'demand_client': total.tolist()}, erro
+
+
+def disaggregate_flows(agg_alloc_kj, labels, inp):
+    """
+    Reparte os fluxos CD->grupo pelos clientes de cada grupo: cada cliente é servido pelos
+    CDs do grupo por ordem de custo (guloso), sem mudar os totais por CD. Devolve um array K × J.
+    """
+    costs = np.asarray(inp['costs_dc_client'], dtype=np.float64)
+    demand = np.asarray(inp['demand_client'], dtype=np.float64)
+    agg = np.asarray(agg_alloc_kj, dtype=np.float64).reshape(-1, costs.shape[1])
+    alloc = np.zeros_like(costs)
+    usados = (agg > 0).sum(axis=1)
+    # Grupos servidos por um só CD (o caso comum): todos os clientes vão a esse CD
+    um = usados[labels] == 1
+    alloc[np.flatnonzero(um), agg[labels[um]].argmax(axis=1)] = demand[um]
+    for g in np.flatnonzero(usados > 1):
+        membros = np.flatnonzero(labels == g)
+        cds = np.flatnonzero(agg[g] > 0)
+        resto_k, resto_j = demand[membros].copy(), agg[g, cds].copy()
+        sub = costs[np.ix_(membros, cds)]
+        for pos in np.argsort(sub, axis=None, kind='stable'):
+            a, b = divmod(int(pos), len(cds))
+            q = min(resto_k[a], resto_j[b])
+            if q > 0:
+                alloc[membros[a], cds[b]] += q
+                resto_k[a] -= q
+                resto_j[b] -= q
+    return alloc
+
+
+def solve_aggregated(inp, options, solve, stats):
+    """
+    Agrega os clientes, resolve o modelo reduzido com solve(inputs, opções, stats) e
+    desagrega. Devolve o tuplo do solver no tamanho original, com o custo real da
+    solução desagregada; stats['aggregation'] recebe grupos, erro E, limite e gap garantidos.
+    """
+    t0 = time.perf_counter()
+    labels = cluster_clients(inp, options)
+    agg_inp, erro = aggregate_inputs(inp, labels)
+    demand = np.asarray(inp['demand_client'], dtype=np.float64)
+    error_bound = float(demand @ erro)
+    aggregation_time = time.perf_counter() - t0
+    n_groups = len(agg_inp['demand_client'])
+    print(f"ℹ️ Agregação '{options['client_aggregation']}': {len(labels)} clientes -> {n_groups} grupos "
+          f"(erro máximo €{error_bound:,.2f}).")
+
+    t0 = time.perf_counter()
+    status, agg_cost, alloc_ij, agg_alloc_kj, dc_decisions = solve(
+        agg_inp, {**options, 'client_aggregation': None, 'warm_start': None}, stats)
+    solve_time = time.perf_counter() - t0
+    resumo = {'method': options['client_aggregation'], 'clients': len(labels), 'groups': n_groups,
+              'error_bound': error_bound, 'aggregation_time_s': aggregation_time, 'solve_time_s': solve_time}
+    if status not in ('Optimal', 'Feasible'):
+        stats['aggregation'] = resumo
+        return status, agg_cost, alloc_ij, agg_alloc_kj, dc_decisions
+
+    t0 = time.perf_counter()
+    alloc_kj = disaggregate_flows(agg_alloc_kj, labels, inp)
+    t = inp['transport_cost_per_km']
+    agg_costs = np.asarray(agg_inp['costs_dc_client'], dtype=np.float64)
+    total_cost = (agg_cost - t * float((np.asarray(agg_alloc_kj, dtype=np.float64) * agg_costs).sum())
+                  + t * float((alloc_kj * np.asarray(inp['costs_dc_client'], dtype=np.float64)).sum()))
+    # Limite do modelo reduzido (o do CBC/heurística, ou o próprio ótimo) menos o erro de agregação
+    agg_bound = stats.get('objective_bound')
+    if agg_bound is None and status == 'Optimal':
+        agg_bound = agg_cost
+    bound = agg_bound - error_bound if agg_bound is not None else None
+    gap = relative_gap(total_cost, bound)
+    stats['aggregation'] = {**resumo, 'aggregated_cost': agg_cost, 'cost': total_cost,
+                            'lower_bound': bound, 'gap': gap,
+                            'disaggregation_time_s': time.perf_counter() - t0}
+    stats.update(objective_bound=bound, mip_gap=gap)
+    print(f"ℹ️ Desagregação: custo real €{total_cost:,.2f}"
+          + (f", gap garantido ao ótimo original {gap:.2%}." if gap is not None else "."))
+    status = 'Optimal' if status == 'Optimal' and error_bound <= 1e-9 else 'Feasible'
+    return status, total_cost, alloc_ij, alloc_kj.tolist(), dc_decisions
@@ -1,8 +1,31 @@
 # backend/solver_algorithm.py
-# (Versão 2.2: Modelo com restrições de cenário)
+# (Versão 2.3: Modelo com restrições de cenário e presolve de rotas)
 
-from pulp import LpProblem, LpMinimize, LpVariable, lpSum, LpStatus, value
+from pulp import LpProblem, LpMinimize, LpVariable, lpSum, LpStatus, value, PULP_CBC_CMD, LpSolutionIntegerFeasible
+from collections import defaultdict
+from contextlib import nullcontext
+import hashlib
+import itertools
+import json
+import numpy as np
+import os
 import re
+import tempfile
+import threading
+import time
+
+import logic
+from solver_aggregation import solve_aggregated
+from solver_heuristic import SOLVER_MODES, solve_heuristic
+from solver_matrix import cbc_limits, follow_cbc_log, parse_cbc_log, solve_matrix_model, status_from_gap
+from spatial_index import PointIndex
+
+# Último modelo PuLP construído neste processo, para re-resoluções que só mudam limites/RHS
+# (partilhado pelas threads dos pedidos; ver _pulp_model_lock em _solve_pulp)
+_pulp_model_cache = {'key': None, 'model': None}
+_pulp_model_lock = threading.Lock()
+# Operações vetorizadas sobre arrays de texto (numpy.strings no NumPy 2, numpy.char antes)
+_np_strings = getattr(np, 'strings', np.char)
 
 def clean_number(val):
     """ Rotina de limpeza de números (trata '1.000,50') """
@@ -17,132 +40,571 @@ def clean_number(val):
     except ValueError:
         return 0.0
 
-def solve_network_design_problem(data):
+def _clean_strings(strings):
     """
-    Resolve o problema unificado de Localização (CDs) e Transbordo (Fábrica->CD->Cliente).
-    
-    :param data: Um dicionário contendo todos os inputs, incluindo
-                 listas de custos/capacidades e mapas de restrições.
+    clean_number para um array de str. As que, depois de trocar '.'/',' , só têm
+    dígitos ASCII e no máximo um ponto são tratadas em bloco; as restantes (sinais,
+    espaços, unidades, outros alfabetos...) passam pela versão escalar.
     """
-    
-    print("ℹ️ A iniciar o solver PuLP (Modelo de Network Design)...")
+    out = np.zeros(len(strings), dtype=np.float64)
+    if not len(strings):
+        return out
+    u = strings.astype(str)
+    u = _np_strings.replace(_np_strings.replace(u, '.', ''), ',', '.')
+    digits = _np_strings.replace(u, '.', '')
+    n_digits, n_dots = _np_strings.str_len(digits), _np_strings.count(u, '.')
+    ascii_only = (u.view(np.uint32).reshape(len(u), -1) < 128).all(axis=1)
+    # O NumPy ignora '\0' finais: a soma dos comprimentos apanha '\0' antes de um ponto
+    pure = ascii_only & ((n_digits == 0) | _np_strings.isdigit(digits)) & (n_digits + n_dots == _np_strings.str_len(u))
+    # '' -> 0.0; '.' e '1.2.3' dariam ValueError -> 0.0 (já é o valor de 'out')
+    ok = pure & (n_digits > 0) & (n_dots <= 1)
+    out[ok] = np.fromiter(map(float, u[ok].tolist()), dtype=np.float64, count=int(ok.sum()))
+    rest = np.flatnonzero(~pure)
+    out[rest] = [clean_number(v) for v in strings[rest]]
+    return out
 
-    try:
-        # --- 1. Extrair e Limpar Dados ---
-        
+def clean_number_array(values):
+    """
+    Versão em massa de clean_number: devolve um array float64 com exatamente os
+    mesmos valores. Números (int/float e subclasses) seguem pelo NumPy sem texto,
+    None dá 0.0, str usa _clean_strings e qualquer outro tipo a versão escalar.
+    """
+    cells = values if isinstance(values, list) else list(values)
+    types = set(map(type, cells))
+    if all(issubclass(t, (int, float)) for t in types):
+        return np.array(cells, dtype=np.float64) if cells else np.zeros(0)
+    obj = np.empty(len(cells), dtype=object)
+    obj[:] = cells
+    out = np.zeros(len(cells), dtype=np.float64)
+    code_of = {t: n for n, t in enumerate(types)}
+    codes = np.fromiter(map(code_of.__getitem__, map(type, cells)), dtype=np.intp, count=len(cells))
+    for t, code in code_of.items():
+        mask = codes == code
+        if issubclass(t, (int, float)):
+            out[mask] = obj[mask].astype(np.float64)
+        elif t is str:
+            out[mask] = _clean_strings(obj[mask])
+        elif t is not type(None):
+            out[mask] = [clean_number(v) for v in obj[mask]]
+    return out
+
+def cost_matrix(costs):
+    """
+    Matriz de custos limpa (float64, linhas × CDs). Aceita a tabela com cabeçalhos
+    ([['Destino'] + CDs, [nome, custo...], ...]) ou um array NumPy já numérico
+    (p. ex. lido do cache binário, ver matrix_store), que não passa por texto.
+    """
+    if isinstance(costs, np.ndarray):
+        return np.asarray(costs, dtype=np.float64)
+    body = costs[1:]
+    n_cols = len(costs[0]) - 1 if costs else 0
+    if any(len(row) != n_cols + 1 for row in body):
+        raise ValueError("Matriz de custos com linhas de comprimento diferente do cabeçalho.")
+    return clean_number_array(itertools.chain.from_iterable(row[1:] for row in body)).reshape(len(body), n_cols)
+
+def hash_json_default(obj):
+    """ 'default' de json.dumps para hashes: arrays pelo conteúdo binário, o resto como texto. """
+    if isinstance(obj, np.ndarray):
+        arr = np.ascontiguousarray(obj, dtype=np.float64)
+        return {'shape': list(arr.shape), 'sha256': hashlib.sha256(arr.tobytes()).hexdigest()}
+    return str(obj)
+
+def dense_network(n_factories, n_dcs, n_clients, dc_names, dc_force_map):
+    """ Modelo completo (sem presolve): todas as rotas Fábrica×CD e Cliente×CD. """
+    return {
+        'lanes_ij': [(i, j) for i in range(n_factories) for j in range(n_dcs)],
+        'lanes_kj': [(k, j) for k in range(n_clients) for j in range(n_dcs)],
+        'y_candidates': list(range(n_dcs)),
+        'closed_dcs': [],
+        'forced_count': sum(1 for n in dc_names if dc_force_map.get(n) in (0, 1))
+    }
+
+# Critério da regra dos K CDs por cliente: os K mais baratos na matriz ('cost')
+# ou os K mais próximos pelas coordenadas, via índice espacial ('location')
+NEAREST_BY = ('cost', 'location')
+
+def presolve_network(costs_dc_client, supply_factory, demand_client, capacity_dc,
+                     dc_names, dc_force_map, k_nearest=None, keep_forced_closed=False,
+                     client_points=None, dc_points=None):
+    """
+    Presolve do modelo de Network Design: decide que variáveis chegam ao CBC.
+
+    Cortes exatos (não alteram o ótimo):
+      - CDs forçados a fechar (dc_force_map) ou sem capacidade: sem rotas;
+        a variável Y só existe se o CD estiver forçado a abrir;
+      - fábricas sem oferta e clientes sem procura: sem rotas.
+    Corte heurístico (opcional):
+      - k_nearest: cada cliente só pode ser servido pelos K CDs mais baratos.
+        Com client_points/dc_points (lat/lng pela ordem das linhas/colunas), os K CDs
+        são os K mais próximos em linha reta, numa consulta ao índice espacial
+        (spatial_index.PointIndex) em vez de ordenar a linha de custos de cada cliente.
+    Com keep_forced_closed=True os CDs forçados a fechar ficam no modelo (Y fixo a 0),
+    para que a estrutura não mude quando só o dc_force_map muda (reutilização do modelo).
+    """
+    J = range(len(capacity_dc))
+    forced = {j: dc_force_map[name] for j, name in enumerate(dc_names) if name in dc_force_map}
+
+    closed = [j for j in J if (forced.get(j) == 0 and not keep_forced_closed)
+              or (capacity_dc[j] <= 0 and forced.get(j) != 1)]
+    closed_set = set(closed)
+    y_candidates = [j for j in J if j not in closed_set]
+    dcs_com_fluxo = np.array([j for j in y_candidates if capacity_dc[j] > 0], dtype=np.int64)
+
+    lanes_ij = [(i, int(j)) for i in range(len(supply_factory)) if supply_factory[i] > 0 for j in dcs_com_fluxo]
+
+    lanes_kj = []
+    usar_k = bool(k_nearest) and 0 < k_nearest < len(dcs_com_fluxo)
+    vizinhos = None
+    if usar_k and client_points is not None and dc_points is not None:
+        if len(client_points) == len(demand_client) and len(dc_points) == len(capacity_dc):
+            index = PointIndex([dc_points[j] for j in dcs_com_fluxo])
+            c_lat, c_lng, _ = logic.points_to_arrays(client_points)
+            vizinhos = dcs_com_fluxo[np.sort(index.nearest(c_lat, c_lng, k_nearest)[1], axis=1)]
+        else:
+            print("⚠️ Coordenadas dos clientes/CDs não correspondem às matrizes; K CDs escolhidos pelo custo.")
+    for k in range(len(demand_client)):
+        if demand_client[k] <= 0:
+            continue
+        if vizinhos is not None:
+            candidatos = vizinhos[k]
+        elif usar_k:
+            custos = np.asarray(costs_dc_client[k], dtype=np.float64)[dcs_com_fluxo]
+            candidatos = dcs_com_fluxo[np.sort(np.argpartition(custos, k_nearest - 1)[:k_nearest])]
+        else:
+            candidatos = dcs_com_fluxo
+        lanes_kj.extend((k, int(j)) for j in candidatos)
+
+    return {
+        'lanes_ij': lanes_ij,
+        'lanes_kj': lanes_kj,
+        'y_candidates': y_candidates,
+        'closed_dcs': [dc_names[j] if j < len(dc_names) else j for j in closed],
+        'forced_count': sum(1 for v in forced.values() if v in (0, 1))
+    }
+
+def prepare_network_inputs(data):
+    """
+    Extrai e limpa os inputs do solver (custos, capacidades, procuras, mapas).
+    Devolve um dicionário com os custos em arrays float64 e as restantes listas de
+    floats, partilhado pelos dois backends.
+    """
+    inp = {
         # Custos de Transporte
-        costs_factory_dc = [[clean_number(c) for c in row[1:]] for row in data['costs_factory_dc'][1:]]
-        costs_dc_client = [[clean_number(c) for c in row[1:]] for row in data['costs_dc_client'][1:]]
-        
+        'costs_factory_dc': cost_matrix(data['costs_factory_dc']),
+        'costs_dc_client': cost_matrix(data['costs_dc_client']),
         # Capacidades e Procuras (já vêm modificadas do frontend)
-        supply_factory = [clean_number(s) for s in data['supply_factory']]
-        demand_client = [clean_number(d) for d in data['demand_client']]
-        capacity_dc = [clean_number(c) for c in data['capacity_dc']]
-        
+        'supply_factory': clean_number_array(data['supply_factory']).tolist(),
+        'demand_client': clean_number_array(data['demand_client']).tolist(),
+        'capacity_dc': clean_number_array(data['capacity_dc']).tolist(),
         # Custo fixo (lista)
-        clean_dc_fixed_costs = [clean_number(c) for c in data['dc_fixed_cost_list']]
-
+        'dc_fixed_costs': clean_number_array(data['dc_fixed_cost_list']).tolist(),
         # Parâmetros Económicos
-        transport_cost_per_km = clean_number(data['transport_cost_per_km'])
-        
+        'transport_cost_per_km': clean_number(data['transport_cost_per_km']),
         # Nomes (para os mapas de restrições)
-        factory_names = data.get('factory_names', [])
-        dc_names = data.get('dc_names', [])
-        
-        # Índices
-        I = range(len(supply_factory))  # Fábricas (i)
-        J = range(len(capacity_dc))     # CDs (j)
-        K = range(len(demand_client))     # Clientes (k)
+        'factory_names': data.get('factory_names', []),
+        'dc_names': data.get('dc_names', []),
+        # Mapas de restrições de cenário
+        'dc_force_map': data.get('dc_force_map', {}),
+        'factory_min_util_map': data.get('factory_min_util_map', {})
+    }
+
+    # Validar consistência dos dados
+    if len(inp['dc_names']) != len(inp['capacity_dc']) or len(inp['factory_names']) != len(inp['supply_factory']):
+        print("⚠️ Aviso: Inconsistência nos nomes e contagens de fábricas/CDs.")
+    return inp
 
-        # --- NOVOS MAPAS DE RESTRIÇÕES ---
-        dc_force_map = data.get('dc_force_map', {})
-        factory_min_util_map = data.get('factory_min_util_map', {})
+def solver_input_hash(data, inp=None):
+    """
+    Hash canónico (sha256) do input do solver, calculado sobre os valores já limpos:
+    '1.000,50' e 1000.5 dão a mesma chave, e a ordem das chaves dos mapas não conta.
+    Cobre custos, oferta/procura/capacidades, custos fixos, custo por km, nomes,
+    mapas de cenário, a regra heurística dos K CDs (e o seu critério), a agregação de clientes e as
+    tolerâncias de gap (que podem mudar o resultado).
+    """
+    inp = inp or prepare_network_inputs(data)
+    canonical = dict(inp)
+    canonical['k_nearest_dcs'] = data.get('k_nearest_dcs') if data.get('presolve', True) else None
+    if canonical['k_nearest_dcs'] and data.get('nearest_by') == 'location':
+        canonical['nearest_by'] = [data.get(k) for k in ('nearest_by', 'client_points', 'dc_points')]
+    canonical['mip_gap'] = data.get('mip_gap')
+    canonical['mip_gap_abs'] = data.get('mip_gap_abs')
+    if data.get('client_aggregation'):
+        canonical['aggregation'] = [data.get(k) for k in ('client_aggregation', 'aggregation_km', 'aggregation_clusters',
+                                                          'aggregation_seed', 'client_points')]
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=hash_json_default)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-        # Validar consistência dos dados
-        if len(dc_names) != len(J) or len(factory_names) != len(I):
-            print("⚠️ Aviso: Inconsistência nos nomes e contagens de fábricas/CDs.")
+def warm_start_arrays(inp, warm_start):
+    """
+    Converte uma solução anterior (o corpo de resposta de /run-scenario: 'dc_decisions',
+    'factory_allocation' e 'client_allocation') em arrays (y[J], x[I][J], z[K][J]).
+    Os CDs forçados no cenário atual prevalecem sobre a decisão anterior.
+    Devolve None se a solução não corresponder às dimensões do problema.
+    """
+    n_I, n_J, n_K = len(inp['supply_factory']), len(inp['capacity_dc']), len(inp['demand_client'])
+    try:
+        def matriz(alloc):
+            return np.asarray(alloc['matrix'] if isinstance(alloc, dict) else alloc, dtype=np.float64)
+        x = matriz(warm_start['factory_allocation'])
+        z = matriz(warm_start['client_allocation'])
+        decisions = warm_start['dc_decisions']
+    except (KeyError, TypeError, ValueError):
+        return None
+    if x.shape != (n_I, n_J) or z.shape != (n_K, n_J) or len(inp['dc_names']) != n_J:
+        return None
+    y = np.array([1.0 if decisions.get(name) == "Aberto" else 0.0 for name in inp['dc_names']])
+    for j, name in enumerate(inp['dc_names']):
+        if inp['dc_force_map'].get(name) in (0, 1):
+            y[j] = float(inp['dc_force_map'][name])
+    return y, x, z
 
-    except Exception as e:
-        print(f"❌ Erro na limpeza ou extração de dados: {e}")
-        return "Erro de Dados", 0.0, [[]], [[]], {}
+def model_structure_key(inp, pre):
+    """
+    Chave da estrutura do modelo (matriz A e objetivo). Dois cenários com a mesma
+    chave só diferem em limites e lados direitos: oferta, procura, utilização
+    mínima e CDs forçados (com o presolve em keep_forced_closed).
+    """
+    h = hashlib.sha256()
+    for arr in (inp['costs_factory_dc'], inp['costs_dc_client'], inp['capacity_dc'], inp['dc_fixed_costs'],
+                [inp['transport_cost_per_km']], np.sign(np.asarray(inp['demand_client'], dtype=np.float64))):
+        h.update(np.asarray(arr, dtype=np.float64).tobytes())
+    fab_min = [i for i, name in enumerate(inp['factory_names']) if inp['factory_min_util_map'].get(name, 0) > 0]
+    h.update(json.dumps([pre['lanes_ij'], pre['lanes_kj'], pre['y_candidates'], fab_min,
+                         inp['dc_names'], inp['factory_names']]).encode('utf-8'))
+    return h.hexdigest()
+
+def build_pulp_model(inp, pre):
+    """
+    Constrói o modelo PuLP só com as variáveis que sobreviveram ao presolve.
+    Devolve (prob, Y, X, Z), com X/Z indexados por (i, j) / (k, j).
+    """
+    # Listas de floats: indexar arrays NumPy elemento a elemento é mais lento
+    costs_factory_dc = np.asarray(inp['costs_factory_dc']).tolist()
+    costs_dc_client = np.asarray(inp['costs_dc_client']).tolist()
+    supply_factory, demand_client, capacity_dc = inp['supply_factory'], inp['demand_client'], inp['capacity_dc']
+    dc_names, factory_names = inp['dc_names'], inp['factory_names']
+    dc_force_map, factory_min_util_map = inp['dc_force_map'], inp['factory_min_util_map']
 
-    # --- 2. Definição do Problema ---
+    # --- Definição do Problema ---
     prob = LpProblem("BrewSEP_Network_Design_Scenario", LpMinimize)
 
-    # --- 3. Variáveis de Decisão ---
-    Y = LpVariable.dicts("CD_Aberto", J, cat='Binary')
-    X = LpVariable.dicts("Fluxo_Fabrica_CD", (I, J), lowBound=0, cat='Integer')
-    Z = LpVariable.dicts("Fluxo_CD_Cliente", (K, J), lowBound=0, cat='Integer')
+    # --- Variáveis de Decisão ---
+    Y = {j: LpVariable(f"CD_Aberto_{j}", cat='Binary') for j in pre['y_candidates']}
+    X = {(i, j): LpVariable(f"Fluxo_Fabrica_CD_{i}_{j}", lowBound=0, cat='Integer') for (i, j) in pre['lanes_ij']}
+    Z = {(k, j): LpVariable(f"Fluxo_CD_Cliente_{k}_{j}", lowBound=0, cat='Integer') for (k, j) in pre['lanes_kj']}
+
+    x_por_fabrica, x_por_cd = defaultdict(list), defaultdict(list)
+    for (i, j), var in X.items():
+        x_por_fabrica[i].append(var)
+        x_por_cd[j].append(var)
+    z_por_cliente, z_por_cd = defaultdict(list), defaultdict(list)
+    for (k, j), var in Z.items():
+        z_por_cliente[k].append(var)
+        z_por_cd[j].append(var)
 
-    # --- 4. Função Objetivo ---
+    # --- Função Objetivo ---
     var_cost = lpSum(
-        X[i][j] * costs_factory_dc[i][j] for i in I for j in J
+        var * costs_factory_dc[i][j] for (i, j), var in X.items()
     ) + lpSum(
-        Z[k][j] * costs_dc_client[k][j] for k in K for j in J
+        var * costs_dc_client[k][j] for (k, j), var in Z.items()
     )
-    fixed_cost = lpSum(Y[j] * clean_dc_fixed_costs[j] for j in J)
-    prob += (var_cost * transport_cost_per_km) + fixed_cost, "Custo_Total_Rede"
+    fixed_cost = lpSum(Y[j] * inp['dc_fixed_costs'][j] for j in Y)
+    prob += (var_cost * inp['transport_cost_per_km']) + fixed_cost, "Custo_Total_Rede"
 
-    # --- 5. Restrições ---
+    # --- Restrições ---
 
     # C1. Capacidade da Fábrica i (Oferta)
-    for i in I:
-        prob += lpSum(X[i][j] for j in J) <= supply_factory[i], f"Restricao_Fabrica_{i}"
+    for i in x_por_fabrica:
+        prob += lpSum(x_por_fabrica[i]) <= supply_factory[i], f"Restricao_Fabrica_{i}"
 
     # C2. Procura do Cliente k (Procura 100% Satisfeita)
-    for k in K:
-        prob += lpSum(Z[k][j] for j in J) == demand_client[k], f"Restricao_Cliente_{k}"
+    for k in range(len(demand_client)):
+        if demand_client[k] != 0 or k in z_por_cliente:
+            prob += lpSum(z_por_cliente[k]) == demand_client[k], f"Restricao_Cliente_{k}"
         
     # C3. Balanço de Fluxo no CD j (Transbordo)
-    for j in J:
-        prob += lpSum(X[i][j] for i in I) == lpSum(Z[k][j] for k in K), f"Restricao_Balanco_CD_{j}"
+    for j in set(x_por_cd) | set(z_por_cd):
+        prob += lpSum(x_por_cd[j]) == lpSum(z_por_cd[j]), f"Restricao_Balanco_CD_{j}"
 
     # C4. Capacidade do CD j (A Restrição 'Link' Crucial)
-    for j in J:
-        prob += lpSum(X[i][j] for i in I) <= capacity_dc[j] * Y[j], f"Restricao_Capacidade_CD_{j}"
+    for j in x_por_cd:
+        prob += lpSum(x_por_cd[j]) <= capacity_dc[j] * Y[j], f"Restricao_Capacidade_CD_{j}"
         
-    # --- 6. NOVAS RESTRIÇÕES DE CENÁRIO ---
+    # --- Restrições de cenário ---
     
-    # C5. Forçar Abertura/Fecho de CDs (do dc_force_map)
-    for j_idx, dc_name in enumerate(dc_names):
-        if dc_name in dc_force_map:
-            force_value = dc_force_map[dc_name]
-            if force_value == 1: # Forçar Abertura
-                prob += Y[j_idx] == 1, f"Restricao_Forcar_Aberto_CD_{j_idx}"
-                print(f"ℹ️ A adicionar restrição: FORÇAR ABERTURA de {dc_name}")
-            elif force_value == 0: # Forçar Fecho
-                prob += Y[j_idx] == 0, f"Restricao_Forcar_Fechado_CD_{j_idx}"
-                print(f"ℹ️ A adicionar restrição: FORÇAR FECHO de {dc_name}")
+    # C5. Forçar Abertura/Fecho de CDs (do dc_force_map) - fixado nos limites da variável Y
+    _set_forced_dc_bounds(Y, dc_names, dc_force_map)
     
     # C6. Utilização Mínima da Fábrica (do factory_min_util_map)
     for i_idx, factory_name in enumerate(factory_names):
-        if factory_name in factory_min_util_map:
-            min_util_percent = factory_min_util_map[factory_name]
-            if min_util_percent > 0:
-                min_production = supply_factory[i_idx] * min_util_percent
-                prob += lpSum(X[i_idx][j] for j in J) >= min_production, f"Restricao_Utilizacao_Min_Fabrica_{i_idx}"
-                print(f"ℹ️ A adicionar restrição: Utilização Mínima de {min_production} ({min_util_percent*100}%) para {factory_name}")
-
-    # --- 7. Resolver o Problema ---
+        if factory_min_util_map.get(factory_name, 0) > 0:
+            min_production = supply_factory[i_idx] * factory_min_util_map[factory_name]
+            prob += lpSum(x_por_fabrica[i_idx]) >= min_production, f"Restricao_Utilizacao_Min_Fabrica_{i_idx}"
+
+    return prob, Y, X, Z
+
+def _set_forced_dc_bounds(Y, dc_names, dc_force_map):
+    for j_idx, dc_name in enumerate(dc_names):
+        if j_idx in Y:
+            Y[j_idx].lowBound = 1 if dc_force_map.get(dc_name) == 1 else 0
+            Y[j_idx].upBound = 0 if dc_force_map.get(dc_name) == 0 else 1
+
+def update_pulp_scenario(prob, Y, inp):
+    """ Atualiza um modelo PuLP reutilizado: RHS de C1, C2 e C6 e limites de Y (C5). """
+    min_util = inp['factory_min_util_map']
+    for name, constraint in prob.constraints.items():
+        idx = name.rsplit('_', 1)[-1]
+        if name.startswith("Restricao_Fabrica_"):
+            constraint.constant = -inp['supply_factory'][int(idx)]
+        elif name.startswith("Restricao_Cliente_"):
+            constraint.constant = -inp['demand_client'][int(idx)]
+        elif name.startswith("Restricao_Utilizacao_Min_Fabrica_"):
+            i = int(idx)
+            constraint.constant = -inp['supply_factory'][i] * min_util[inp['factory_names'][i]]
+    _set_forced_dc_bounds(Y, inp['dc_names'], inp['dc_force_map'])
+
+def _log_scenario_constraints(inp):
+    """ Mensagens das restrições de cenário (iguais para os dois backends). """
+    for dc_name in inp['dc_names']:
+        if inp['dc_force_map'].get(dc_name) == 1:
+            print(f"ℹ️ A adicionar restrição: FORÇAR ABERTURA de {dc_name}")
+        elif inp['dc_force_map'].get(dc_name) == 0:
+            print(f"ℹ️ A adicionar restrição: FORÇAR FECHO de {dc_name}")
+    for i_idx, factory_name in enumerate(inp['factory_names']):
+        min_util_percent = inp['factory_min_util_map'].get(factory_name, 0)
+        if min_util_percent > 0:
+            min_production = inp['supply_factory'][i_idx] * min_util_percent
+            print(f"ℹ️ A adicionar restrição: Utilização Mínima de {min_production} ({min_util_percent*100}%) para {factory_name}")
+
+def _solve_pulp(inp, pre, stats, start=None, structure_key=None, limits=None, on_progress=None):
+    """
+    Backend PuLP: constrói o modelo termo a termo e resolve com o CBC.
+    'start' (y, x, z) é passado ao CBC como MIP start se ainda for admissível;
+    com 'structure_key', um modelo anterior com a mesma estrutura é reutilizado, com
+    o lock do cache seguro desde a alteração do cenário até à leitura dos valores.
+    'limits' vem de cbc_limits(); on_progress recebe as melhorias da incumbente.
+    """
+    with _pulp_model_lock if structure_key is not None else nullcontext():
+        return _solve_pulp_model(inp, pre, stats, start, structure_key, limits, on_progress)
+
+def _solve_pulp_model(inp, pre, stats, start, structure_key, limits, on_progress):
+    I = range(len(inp['supply_factory']))
+    J = range(len(inp['capacity_dc']))
+    K = range(len(inp['demand_client']))
+
+    t0 = time.perf_counter()
+    reused = structure_key is not None and _pulp_model_cache['key'] == structure_key
+    if reused:
+        prob, Y, X, Z = _pulp_model_cache['model']
+        update_pulp_scenario(prob, Y, inp)
+    else:
+        prob, Y, X, Z = build_pulp_model(inp, pre)
+        if structure_key is not None:
+            _pulp_model_cache.update(key=structure_key, model=(prob, Y, X, Z))
+
+    start_mode = None
+    if start is not None:
+        y, x, z = start
+        ok = all([var.setInitialValue(y[j], check=False) for j, var in Y.items()]
+                 + [var.setInitialValue(x[i, j], check=False) for (i, j), var in X.items()]
+                 + [var.setInitialValue(z[k, j], check=False) for (k, j), var in Z.items()])
+        if ok and all(c.valid(1e-6) for c in prob.constraints.values()):
+            start_mode = 'full'
+        else:
+            print("⚠️ A solução anterior já não é admissível neste cenário; a resolver sem MIP start.")
+    build_time = time.perf_counter() - t0
+    if stats is not None:
+        stats['build_time_s'] = build_time
+        stats['model_reused'] = reused
+        stats['presolve']['constraints'] = len(prob.constraints)
+
+    # --- Resolver o Problema ---
     try:
-        prob.solve()
+        t0 = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp:
+            log_path = os.path.join(tmp, "cbc.log")
+            with follow_cbc_log(log_path, on_progress):
+                prob.solve(PULP_CBC_CMD(msg=False, logPath=log_path, warmStart=start_mode is not None, **(limits or {})))
+            with open(log_path) as f:
+                log_text = f.read()
+        solve_time = time.perf_counter() - t0
+        print(log_text)
     except Exception as e:
         print(f"❌ Erro durante a resolução do PuLP: {e}")
         return "Erro no Solver", 0.0, [[]], [[]], {}
+    log = parse_cbc_log(log_text)
+    if stats is not None:
+        stats['solve_time_s'] = solve_time
+        accepted = log.pop('mip_start_accepted')
+        stats.update(log)
+        if start is not None:
+            stats['warm_start'] = {'mode': start_mode, 'accepted': accepted}
 
-    # --- 8. Extrair Resultados ---
+    # --- Extrair Resultados ---
+    t0 = time.perf_counter()
     status = LpStatus[prob.status]
+    if status == 'Optimal' and prob.sol_status == LpSolutionIntegerFeasible:
+        status = 'Feasible'  # parado no limite de tempo com uma solução inteira
+    status = status_from_gap(status, log['mip_gap'])  # parado no mip_gap antes de provar o ótimo
+    if status not in ('Optimal', 'Feasible'):
+        return status, 0.0, [[]], [[]], {}
+
+    dc_names = inp['dc_names']
+    total_cost = value(prob.objective)
+    alloc_ij = [[(X[(i, j)].varValue if (i, j) in X else 0.0) for j in J] for i in I]
+    alloc_kj = [[(Z[(k, j)].varValue if (k, j) in Z else 0.0) for j in J] for k in K]
+    dc_decisions = { dc_names[j]: ("Aberto" if j in Y and Y[j].varValue > 0.9 else "Fechado") for j in J }
+    if stats is not None:
+        stats['extract_time_s'] = time.perf_counter() - t0
+    return status, total_cost, alloc_ij, alloc_kj, dc_decisions
+
+def solve_network_design_problem(data, stats=None, on_progress=None):
+    """
+    Resolve o problema unificado de Localização (CDs) e Transbordo (Fábrica->CD->Cliente).
     
+    :param data: Um dicionário contendo todos os inputs, incluindo
+                 listas de custos/capacidades e mapas de restrições.
+                 Opcionais: 'presolve' (True por omissão), 'k_nearest_dcs' (K),
+                 'nearest_by' ('cost' por omissão, ou 'location': os K CDs mais
+                 próximos pelo índice espacial, com 'client_points' e 'dc_points'),
+                 'solver_backend' ('pulp' por omissão, ou 'matrix'), 'warm_start'
+                 (resposta de uma resolução anterior, usada como MIP start),
+                 'reuse_model' (True por omissão quando há warm_start) e
+                 'solver_mode': 'exact' (por omissão), 'heuristic' (procura local,
+                 ver solver_heuristic) ou 'heuristic_start' (a solução heurística
+                 é o MIP start do CBC).
+                 Agregação de clientes (ver solver_aggregation): 'client_aggregation'
+                 ('threshold', 'grid' ou 'kmeans'), 'aggregation_km',
+                 'aggregation_clusters' e 'client_points' (lat/lng dos clientes).
+                 Limites do CBC: 'time_limit_s', 'mip_gap' (relativo), 'mip_gap_abs'
+                 e 'threads'. Parado no limite com uma solução inteira, devolve
+                 o status 'Feasible' com essa solução.
+    :param stats: Dicionário opcional onde são escritas as métricas do presolve,
+                  os tempos de construção/resolução/extração do modelo
+                  ('build_time_s', 'solve_time_s', 'extract_time_s') e o tempo até à
+                  primeira solução inteira ('first_incumbent_s'), o limite
+                  ('objective_bound') e o gap ('mip_gap') finais.
+    :param on_progress: Callback opcional chamado durante a resolução a cada melhoria
+                        da incumbente ou do limite: {time_s, objective, bound, gap}.
+    """
+    print(f"ℹ️ A iniciar o solver ({data.get('solver_backend', 'pulp')}) (Modelo de Network Design)...")
+
+    # --- 1. Extrair e Limpar Dados ---
+    try:
+        inp = prepare_network_inputs(data)
+    except Exception as e:
+        print(f"❌ Erro na limpeza ou extração de dados: {e}")
+        return "Erro de Dados", 0.0, [[]], [[]], {}
+
+    return solve_prepared_network(inp, data, stats, on_progress)
+
+def solve_prepared_network(inp, options, stats=None, on_progress=None):
+    """
+    Passos 2-4 de solve_network_design_problem sobre inputs já limpos
+    (saída de prepare_network_inputs). 'options' pode conter 'presolve',
+    'k_nearest_dcs', 'solver_backend', 'solver_mode', 'warm_start', 'reuse_model' e os limites do CBC. Usado diretamente pelo varrimento
+    de cenários, que limpa as matrizes partilhadas uma única vez.
+    """
+    backend = options.get('solver_backend', 'pulp')
+    mode = options.get('solver_mode') or 'exact'
+    if mode not in SOLVER_MODES:
+        print(f"❌ Modo do solver inválido: '{mode}'. Opções: {list(SOLVER_MODES)}")
+        return "Erro de Dados", 0.0, [[]], [[]], {}
+    if stats is None:
+        stats = {}
+    if options.get('client_aggregation'):
+        # Resolve o modelo com os clientes agregados e volta a repartir os fluxos
+        try:
+            return solve_aggregated(inp, options, lambda i, o, s: solve_prepared_network(i, o, s, on_progress), stats)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return "Erro de Dados", 0.0, [[]], [[]], {}
+    n_I, n_J, n_K = len(inp['supply_factory']), len(inp['capacity_dc']), len(inp['demand_client'])
+    _log_scenario_constraints(inp)
+
+    # --- 2. Presolve (eliminar rotas que nunca podem ser ótimas) ---
+    # Com reutilização, os CDs forçados a fechar ficam no modelo para a estrutura não mudar
+    warm_start = options.get('warm_start')
+    reuse = options.get('reuse_model', warm_start is not None)
+    k_nearest = options.get('k_nearest_dcs') if options.get('presolve', True) else None
+    nearest_by = options.get('nearest_by') or 'cost'
+    if nearest_by not in NEAREST_BY:
+        print(f"❌ Critério dos K CDs inválido: '{nearest_by}'. Opções: {list(NEAREST_BY)}")
+        return "Erro de Dados", 0.0, [[]], [[]], {}
+    t0 = time.perf_counter()
+    if options.get('presolve', True):
+        por_local = nearest_by == 'location'
+        pre = presolve_network(inp['costs_dc_client'], inp['supply_factory'], inp['demand_client'],
+                               inp['capacity_dc'], inp['dc_names'], inp['dc_force_map'], k_nearest,
+                               keep_forced_closed=reuse,
+                               client_points=options.get('client_points') if por_local else None,
+                               dc_points=options.get('dc_points') if por_local else None)
+    else:
+        pre = dense_network(n_I, n_J, n_K, inp['dc_names'], inp['dc_force_map'])
+    presolve_time = time.perf_counter() - t0
+    start = warm_start_arrays(inp, warm_start) if warm_start else None
+    if warm_start and start is None:
+        print("⚠️ warm_start ignorado: a solução anterior não corresponde às dimensões do problema.")
+    structure_key = model_structure_key(inp, pre) if reuse else None
+    limits = cbc_limits(options)
+
+    n_vars = len(pre['y_candidates']) + len(pre['lanes_ij']) + len(pre['lanes_kj'])
+    dense_vars = n_J + n_I * n_J + n_K * n_J
+    dense_cons = n_I + n_K + 2 * n_J + pre['forced_count'] + sum(
+        1 for n in inp['factory_names'] if inp['factory_min_util_map'].get(n, 0) > 0)
+    stats['backend'] = backend
+    stats['solver_mode'] = mode
+    stats['presolve'] = {
+        'enabled': bool(options.get('presolve', True)),
+        'k_nearest_dcs': k_nearest,
+        'nearest_by': nearest_by if k_nearest else None,
+        'closed_dcs': pre['closed_dcs'],
+        'variables_dense': dense_vars,
+        'variables': n_vars,
+        'variables_eliminated': dense_vars - n_vars,
+        'constraints_dense': dense_cons,
+        'time_s': presolve_time
+    }
+
+    # --- 3. Construir e resolver (heurística e/ou backend escolhido) ---
+    if mode != 'exact':
+        heuristic_result, heuristic_start = solve_heuristic(inp, pre, stats)
+        if mode == 'heuristic_start' and heuristic_start is not None:
+            start = heuristic_start
+    if mode == 'heuristic':
+        status, total_cost, alloc_ij, alloc_kj, dc_decisions = heuristic_result
+        h = stats['heuristic']
+        stats.update(objective_bound=h['lower_bound'], mip_gap=h['gap'])
+    elif backend == 'matrix':
+        status, total_cost, alloc_ij, alloc_kj, dc_decisions = solve_matrix_model(inp, pre, stats, start, structure_key,
+                                                                                   limits, on_progress)
+    else:
+        status, total_cost, alloc_ij, alloc_kj, dc_decisions = _solve_pulp(inp, pre, stats, start, structure_key,
+                                                                            limits, on_progress)
+    if warm_start and start is None:
+        stats['warm_start'] = {'mode': None, 'accepted': False}
+
+    p = stats['presolve']
+    if 'constraints' in p:
+        p['constraints_eliminated'] = dense_cons - p['constraints']
+        print(f"ℹ️ Presolve: {n_vars}/{dense_vars} variáveis, {p['constraints']}/{dense_cons} restrições. "
+              f"Modelo construído em {stats.get('build_time_s', 0):.3f}s.")
+
+    # --- 4. Resultados ---
     if status == 'Optimal':
-        total_cost = value(prob.objective)
-        alloc_ij = [[X[i][j].varValue for j in J] for i in I]
-        alloc_kj = [[Z[k][j].varValue for j in J] for k in K]
-        dc_decisions = { dc_names[j]: ("Aberto" if Y[j].varValue > 0.9 else "Fechado") for j in J }
-        
         print(f"✅ Solução Ótima encontrada! Custo Total: €{total_cost:,.2f}")
         print(f"Decisões dos CDs: {dc_decisions}")
-        
         return status, total_cost, alloc_ij, alloc_kj, dc_decisions
+    elif status == 'Feasible':
+        gap = stats.get('mip_gap')
+        origem = "Solução heurística" if mode == 'heuristic' else "Limite atingido: melhor solução encontrada"
+        print(f"⚠️ {origem} €{total_cost:,.2f}"
+              f"{f' (gap {gap:.2%})' if gap is not None else ''}.")
+        return status, total_cost, alloc_ij, alloc_kj, dc_decisions
+    elif k_nearest and status not in ("Erro no Solver", "Erro de Dados"):
+        # A regra dos K CDs mais próximos é heurística: se cortou demasiado, repetir sem ela
+        print(f"⚠️ Status {status} com K={k_nearest} CDs por cliente. A repetir sem a regra dos K mais próximos...")
+        return solve_prepared_network(inp, {**options, 'k_nearest_dcs': None}, stats, on_progress)
     else:
         print(f"⚠️ Solução não encontrada. Status: {status}")
-        return status, 0.0, [[]], [[]], {}
\ No newline at end of file
+        return status, 0.0, [[]], [[]], {}
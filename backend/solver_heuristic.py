@@ -0,0 +1,443 @@
+# backend/solver_heuristic.py
+# Modo heurístico do solver de Network Design (instâncias com centenas de CDs).
+#
+# Procura local sobre o vetor Y (CDs abertos): parte de todos os candidatos
+# abertos e fecha (DROP), abre (ADD) ou troca (swap) CDs enquanto o custo
+# estimado descer. A estimativa serve cada cliente pelo CD aberto mais barato
+# (custo CD->Cliente + chegada ao CD pela fábrica mais barata), toda vetorizada.
+# Cada conjunto de CDs é depois avaliado exatamente pelo LP de transbordo com Y
+# fixo (HiGHS, via SciPy): com Y fixo o problema é um fluxo em rede e o LP já
+# tem solução inteira (se vier fracionária, os fluxos são arredondados por uma
+# reparação gulosa ou o conjunto é descartado). Os preços duais das capacidades dos CDs e das fábricas
+# voltam à estimativa como custos unitários (relaxação lagrangiana da restrição
+# 'link'), e a procura repete até o conjunto de CDs estabilizar.
+# O limite inferior é a relaxação linear do modelo completo, reforçada com
+# Z[k,j] <= procura[k]·Y[j]; em modelos grandes, a relaxação lagrangiana da
+# procura (uma mochila contínua por CD, por subgradiente), que converge para o
+# mesmo valor sem resolver o LP. O gap da solução heurística é medido contra ele.
+
+import os
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+
+from solver_matrix import build_network_matrices, extract_matrix_solution, is_feasible, relative_gap
+
+# 'exact': só o CBC; 'heuristic': só a heurística; 'heuristic_start': heurística como MIP start do CBC
+SOLVER_MODES = ('exact', 'heuristic', 'heuristic_start')
+HEURISTIC_MAX_ROUNDS = int(os.environ.get('HEURISTIC_MAX_ROUNDS', 8))
+HEURISTIC_LAGRANGIAN_ITERATIONS = int(os.environ.get('HEURISTIC_LAGRANGIAN_ITERATIONS', 150))
+# Acima deste número de rotas CD->Cliente o limite vem da relaxação lagrangiana (subgradiente)
+HEURISTIC_STRONG_BOUND_MAX_LANES = int(os.environ.get('HEURISTIC_STRONG_BOUND_MAX_LANES', 20000))
+# Nas rondas da procura, cada cliente só pode ir aos N CDs abertos mais baratos (0 = todos);
+# o melhor conjunto de CDs é sempre reavaliado no fim com todas as rotas
+HEURISTIC_EVAL_NEAREST = int(os.environ.get('HEURISTIC_EVAL_NEAREST', 8))
+# Gap abaixo do qual a solução heurística é dada como ótima
+HEURISTIC_OPTIMAL_GAP = 1e-6
+
+
+def _lp_rows(model):
+    """ Linhas do modelo no formato do linprog: (A_ub, b_ub, A_eq, b_eq, linhas originais de A_ub). """
+    A = model['A'].tocsr()
+    sense, rhs = np.asarray(model['sense']), model['rhs']
+    le, ge, eq = np.flatnonzero(sense == 'L'), np.flatnonzero(sense == 'G'), np.flatnonzero(sense == 'E')
+    A_ub = sp.vstack([A[le], -A[ge]]).tocsr()
+    b_ub = np.concatenate([rhs[le], -rhs[ge]])
+    return A_ub.tocsc(), b_ub, A[eq].tocsc(), rhs[eq], np.concatenate([le, ge])
+
+
+def _linprog(c, A_ub, b_ub, A_eq, b_eq, lower, upper):
+    return linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq,
+                   bounds=np.column_stack([lower, upper]), method='highs')
+
+
+def lp_lower_bound(model, demand, strong=True):
+    """
+    Limite inferior: relaxação linear do modelo (Y contínuo em [0, 1]).
+    Com 'strong', junta as desigualdades válidas Z[k,j] <= procura[k]·Y[j], que
+    cobram o custo fixo de forma muito mais justa. Devolve None se o LP for impossível.
+    """
+    A_ub, b_ub, A_eq, b_eq, _ = _lp_rows(model)
+    if strong and model['nz']:
+        ny, nx, nz = model['ny'], model['nx'], model['nz']
+        y_col = np.full(model['shape'][1], -1, dtype=np.int64)
+        y_col[model['y_candidates']] = np.arange(ny)
+        linhas = np.arange(nz)
+        link = sp.coo_matrix((np.concatenate([np.ones(nz), -np.asarray(demand, dtype=np.float64)[model['lk']]]),
+                              (np.concatenate([linhas, linhas]),
+                               np.concatenate([ny + nx + linhas, y_col[model['lj2']]]))),
+                             shape=(nz, A_ub.shape[1]))
+        A_ub = sp.vstack([A_ub, link]).tocsr()
+        b_ub = np.concatenate([b_ub, np.zeros(nz)])
+    res = _linprog(model['c'], A_ub, b_ub, A_eq, b_eq, model['lower'], model['upper'])
+    return float(res.fun) if res.status == 0 else None
+
+
+def _nearest_lanes(model, lanes, nearest):
+    """ Das rotas CD->Cliente em 'lanes' (máscara), só as 'nearest' mais baratas de cada cliente. """
+    pos = np.flatnonzero(lanes)
+    clientes = model['lk'][pos]
+    ordem = np.lexsort((model['c'][model['ny'] + model['nx'] + pos], clientes))
+    inicio = np.searchsorted(clientes[ordem], clientes[ordem], side='left')
+    keep = np.zeros_like(lanes)
+    keep[pos[ordem[np.arange(len(ordem)) - inicio < nearest]]] = True
+    return keep
+
+
+def lagrangian_lower_bound(cost, demand, fixed, capacity, can_open, must_open, upper, iterations=None):
+    """
+    Limite inferior pela relaxação lagrangiana da procura (multiplicador λ por cliente).
+    Sem a procura, cada CD é uma mochila contínua: enche a capacidade com os clientes de
+    custo reduzido custo[k,j] - λ[k] negativo e abre se isso pagar o custo fixo.
+    'cost' são os custos unitários (unit_costs) sem preços nos CDs; a oferta e a utilização
+    mínima das fábricas ficam relaxadas, com os preços somados à chegada ao CD e a constante
+    correspondente (solve_fixed_dcs, 'offset') somada pelo chamador.
+    λ é ajustado por subgradiente com o passo de Polyak em direção a 'upper'. Devolve o melhor limite.
+    """
+    K, J = cost.shape
+    finito = np.isfinite(cost)
+    lam = np.where(finito, cost, np.inf).min(axis=1)
+    best, theta, sem_melhoria = -np.inf, 2.0, 0
+    for _ in range(iterations or HEURISTIC_LAGRANGIAN_ITERATIONS):
+        reduzido = np.where(finito, cost - lam[:, None], 0.0)
+        ordem = np.argsort(reduzido, axis=0)
+        r = np.take_along_axis(reduzido, ordem, axis=0)
+        d = demand[ordem]
+        livre = np.maximum(capacity[None, :] - (np.cumsum(d, axis=0) - d), 0.0)
+        z = np.where(r < 0, np.minimum(d, livre), 0.0)
+        valor = fixed + (r * z).sum(axis=0)
+        abre = can_open & ((valor < 0) | must_open)
+        limite = float(lam @ demand + valor[abre].sum())
+        if limite > best + 1e-9 * max(1.0, abs(best) if np.isfinite(best) else 1.0):
+            best, sem_melhoria = limite, 0
+        else:
+            sem_melhoria += 1
+            if sem_melhoria >= 10:
+                theta, sem_melhoria = theta / 2, 0
+        servido = np.zeros((K, J))
+        np.put_along_axis(servido, ordem, z, axis=0)
+        g = demand - servido[:, abre].sum(axis=1)
+        norma = float(g @ g)
+        if norma <= 1e-12 or theta < 1e-4 or (upper is not None and upper - best <= 1e-6 * abs(upper)):
+            break
+        lam = lam + theta * max(upper - limite, 1e-9 * abs(upper)) / norma * g
+    return best
+
+
+def _distribute(falta, livre, v, dest, src, frac, cost, allowed):
+    """
+    Junta a 'v' as unidades em falta em cada destino: primeiro uma unidade nas rotas com
+    maior parte fracionária (o arredondamento para cima), depois o que faltar pelas rotas
+    mais baratas, sem passar o 'livre' da origem. Devolve True se nada ficar em falta.
+    """
+    rotas = np.flatnonzero(allowed & (falta[dest] > 0))
+    fracionarias = rotas[frac[rotas] > 1e-6]
+    fracionarias = fracionarias[np.argsort(-frac[fracionarias], kind='stable')]
+    baratas = rotas[np.argsort(cost[rotas], kind='stable')]
+    passos = [(l, 1.0) for l in fracionarias.tolist()] + [(l, np.inf) for l in baratas.tolist()]
+    for l, limite in passos:
+        d, o = dest[l], src[l]
+        n = min(falta[d], livre[o], limite)
+        if n > 0:
+            v[l] += n
+            falta[d] -= n
+            livre[o] -= n
+    return not np.any(falta > 0)
+
+
+def _meet_minimum(xi, li, lj, cost, allowed, minimo, supply):
+    """
+    Utilização mínima das fábricas com fluxos inteiros: cada fábrica abaixo do mínimo
+    (já arredondado para cima) passa a abastecer, pelas suas rotas mais baratas, unidades
+    que outras fábricas com folga enviavam para o mesmo CD (as mais caras primeiro).
+    O que cada CD recebe não muda. Devolve True se todos os mínimos ficarem cumpridos.
+    """
+    I = len(minimo)
+    saida = np.bincount(li, xi, I)
+    for i in np.flatnonzero(saida < minimo).tolist():
+        proprias = np.flatnonzero(allowed & (li == i))
+        for l in proprias[np.argsort(cost[proprias], kind='stable')].tolist():
+            outras = np.flatnonzero((lj == lj[l]) & (li != i) & (xi > 0))
+            for m in outras[np.argsort(-cost[outras], kind='stable')].tolist():
+                n = min(minimo[i] - saida[i], supply[i] - saida[i], xi[m], saida[li[m]] - minimo[li[m]])
+                if n > 0:
+                    xi[m] -= n
+                    xi[l] += n
+                    saida[li[m]] -= n
+                    saida[i] += n
+                if saida[i] >= minimo[i]:
+                    break
+            if saida[i] >= minimo[i]:
+                break
+    return not np.any(saida < minimo)
+
+
+def _round_flows(model, x, cols):
+    """
+    Reparação gulosa de fluxos fracionários do LP (dados não inteiros ou solução fora de
+    um vértice): arredonda para baixo e reparte as unidades em falta (ver _distribute),
+    primeiro CD->Cliente dentro da capacidade dos CDs abertos, depois Fábrica->CD dentro
+    da oferta, com a utilização mínima arredondada para cima (ver _meet_minimum).
+    Devolve o vetor com fluxos inteiros ou None se não for admissível.
+    """
+    ny, nx = model['ny'], model['nx']
+    I, J, K = model['shape']
+    kind, ref, rhs, c = model['row_kind'], model['row_ref'], model['rhs'], model['c']
+    li, lj, lk, lj2 = model['li'], model['lj'], model['lk'], model['lj2']
+    allowed = np.zeros(len(c), dtype=bool)
+    allowed[cols] = True
+    allowed &= model['upper'] > 0
+
+    demand = np.zeros(K)
+    demand[ref[kind == 'K']] = rhs[kind == 'K']
+    if np.any(np.abs(demand - np.round(demand)) > 1e-6):
+        return None  # procura fracionária: não há fluxos inteiros que a satisfaçam
+    supply = np.zeros(I)
+    supply[ref[kind == 'F']] = np.floor(rhs[kind == 'F'] + 1e-6)
+    linhas_c = np.flatnonzero(kind == 'C')
+    capacity = np.zeros(J)
+    capacity[ref[linhas_c]] = np.floor(-(model['A'][linhas_c][:, :ny] @ x[:ny]) + 1e-6)  # capacidade × Y
+    minimo = np.zeros(I)
+    minimo[ref[kind == 'M']] = np.ceil(rhs[kind == 'M'] - 1e-6)
+
+    fx, fz = x[ny:ny + nx], x[ny + nx:]
+    xi, zi = np.floor(fx + 1e-6), np.floor(fz + 1e-6)
+    falta = np.round(demand) - np.bincount(lk, zi, K)
+    livre = capacity - np.bincount(lj2, zi, J)
+    if not _distribute(falta, livre, zi, lk, lj2, fz - zi, c[ny + nx:], allowed[ny + nx:]):
+        return None
+
+    # Cada CD recebe exatamente o que envia: tira o excesso pelas rotas mais caras e junta o que falta
+    falta = np.bincount(lj2, zi, J) - np.bincount(lj, xi, J)
+    for l in np.argsort(-c[ny:ny + nx]).tolist():
+        if falta[lj[l]] < 0 and xi[l] > 0:
+            n = min(-falta[lj[l]], xi[l])
+            xi[l] -= n
+            falta[lj[l]] += n
+    livre = supply - np.bincount(li, xi, I)
+    if not _distribute(falta, livre, xi, lj, li, fx - xi, c[ny:ny + nx], allowed[ny:ny + nx]):
+        return None
+    if not _meet_minimum(xi, li, lj, c[ny:ny + nx], allowed[ny:ny + nx], minimo, supply):
+        return None
+
+    v = np.concatenate([np.round(x[:ny]), xi, zi])
+    return v if is_feasible(model, v) else None
+
+
+def solve_fixed_dcs(model, open_dc, lp_rows=None, nearest=None):
+    """
+    LP de transbordo com os CDs abertos fixos ('open_dc': máscara booleana sobre os J CDs).
+    Com 'nearest', cada cliente só usa os seus 'nearest' CDs abertos mais baratos (LP mais
+    pequeno; a solução continua admissível no modelo completo, mas pode não ser a melhor).
+    Devolve (vetor solução nas colunas do modelo, com fluxos inteiros, preços duais) ou
+    (None, None) se o conjunto não servir a procura ou os fluxos do LP não puderem ser
+    reparados para inteiros (ver _round_flows). Os preços são {'dc': capacidade dos CDs [J], 'factory': oferta menos
+    utilização mínima [I], 'offset': -Σ preço × lado direito dessas linhas}.
+    """
+    A_ub, b_ub, A_eq, b_eq, ub_rows = lp_rows or _lp_rows(model)
+    ny = model['ny']
+    I, J, _ = model['shape']
+    y = open_dc[model['y_candidates']].astype(np.float64)
+    if np.any(y < model['lower'][:ny]) or np.any(y > model['upper'][:ny]):
+        return None, None
+    # Só as colunas dos CDs abertos (Y fixos incluídos): o LP fica do tamanho da solução
+    lanes_z = open_dc[model['lj2']]
+    if nearest:
+        lanes_z = _nearest_lanes(model, lanes_z, nearest)
+    cols = np.flatnonzero(np.concatenate([y > 0, open_dc[model['lj']], lanes_z]))
+    lower, upper = model['lower'][cols].copy(), model['upper'][cols].copy()
+    n_y = int((y > 0).sum())
+    lower[:n_y] = upper[:n_y] = 1.0
+    res = _linprog(model['c'][cols], A_ub[:, cols], b_ub, A_eq[:, cols], b_eq, lower, upper)
+    if res.status != 0:
+        return None, None
+    x = np.zeros(len(model['c']))
+    x[cols] = res.x
+    inteiro = np.round(x)
+    if np.all(np.abs(x - inteiro) <= 1e-6):
+        x = inteiro
+    else:
+        x = _round_flows(model, x, cols)
+        if x is None:
+            return None, None
+
+    # Duais das linhas <= (não positivos): capacidade dos CDs ('C') e oferta/utilização mínima das fábricas
+    duais = -np.asarray(res.ineqlin.marginals)
+    kind, ref = model['row_kind'][ub_rows], model['row_ref'][ub_rows]
+    dc_price, factory_price = np.zeros(J), np.zeros(I)
+    np.add.at(dc_price, ref[kind == 'C'], duais[kind == 'C'])
+    np.add.at(factory_price, ref[kind == 'F'], duais[kind == 'F'])
+    np.subtract.at(factory_price, ref[kind == 'M'], duais[kind == 'M'])  # a utilização mínima premeia o uso
+    fab = (kind == 'F') | (kind == 'M')
+    return x, {'dc': dc_price, 'factory': factory_price, 'offset': -float(duais[fab] @ b_ub[fab])}
+
+
+def unit_costs(model, dc_price, factory_price):
+    """
+    Custo por unidade de servir cada cliente por cada CD (clientes × J, inf sem rota):
+    CD->Cliente + chegada ao CD pela fábrica mais barata, com os preços duais somados.
+    """
+    I, J, K = model['shape']
+    ny, nx = model['ny'], model['nx']
+    chegada = np.full(J, np.inf)
+    if nx:
+        np.minimum.at(chegada, model['lj'], model['c'][ny:ny + nx] + factory_price[model['li']])
+    custo = np.full((K, J), np.inf)
+    custo[model['lk'], model['lj2']] = model['c'][ny + nx:] + (chegada + dc_price)[model['lj2']]
+    return custo
+
+
+def local_search(cost, demand, fixed, capacity, open_dc, can_open, must_open, max_moves=None):
+    """
+    Procura local DROP/ADD/swap sobre a máscara de CDs abertos, com o custo estimado
+    Σ custo fixo + Σ procura × custo unitário do CD aberto mais barato. Aceita o
+    melhor movimento ADD/DROP que desça o custo; sem nenhum, a melhor troca.
+    Nunca deixa a capacidade aberta abaixo da procura total. Devolve (máscara, nº de movimentos).
+    """
+    open_dc = open_dc.copy()
+    total_demand = demand.sum()
+    max_moves = max_moves or 10 * len(fixed)
+    moves = 0
+    while moves < max_moves:
+        custos_abertos = np.where(open_dc, cost, np.inf)
+        b1 = custos_abertos.argmin(axis=1)
+        b1c = custos_abertos[np.arange(len(b1)), b1]
+        if not np.all(np.isfinite(b1c)):
+            break  # há clientes sem CD aberto: só a avaliação exata decide
+        if open_dc.sum() >= 2:
+            b2c = np.partition(custos_abertos, 1, axis=1)[:, 1]
+        else:
+            b2c = np.full(len(b1c), np.inf)
+        atual = demand @ b1c + fixed[open_dc].sum()
+        tol = 1e-9 * max(1.0, abs(atual))
+        cap_aberta = capacity[open_dc].sum()
+        pode_fechar = open_dc & ~must_open & (cap_aberta - capacity >= total_demand)
+        pode_abrir = ~open_dc & can_open
+
+        # DROP: os clientes do CD passam para o segundo melhor
+        perda = np.bincount(b1, weights=demand * (b2c - b1c), minlength=len(fixed))
+        ganho_drop = np.where(pode_fechar, fixed - perda, -np.inf)
+        # ADD: os clientes mais perto do novo CD mudam-se para ele
+        with np.errstate(invalid='ignore'):
+            ganho_add = np.where(pode_abrir, demand @ np.maximum(b1c[:, None] - cost, 0.0) - fixed, -np.inf)
+        j_drop, j_add = int(ganho_drop.argmax()), int(ganho_add.argmax())
+        if max(ganho_drop[j_drop], ganho_add[j_add]) > tol:
+            if ganho_drop[j_drop] >= ganho_add[j_add]:
+                open_dc[j_drop] = False
+            else:
+                open_dc[j_add] = True
+            moves += 1
+            continue
+
+        # Swap: fechar i e abrir j ao mesmo tempo
+        fechados = np.flatnonzero(pode_abrir)
+        melhor = (tol, None, None)
+        if len(fechados):
+            custo_fechados = cost[:, fechados]
+            for i in np.flatnonzero(open_dc & ~must_open):
+                ok = cap_aberta - capacity[i] + capacity[fechados] >= total_demand
+                if not ok.any():
+                    continue
+                sem_i = np.where(b1 == i, b2c, b1c)
+                novo = np.minimum(custo_fechados, sem_i[:, None])
+                with np.errstate(invalid='ignore'):
+                    ganho = fixed[i] - fixed[fechados] + demand @ (b1c[:, None] - novo)
+                ganho = np.where(ok, np.nan_to_num(ganho, nan=-np.inf), -np.inf)
+                pos = int(ganho.argmax())
+                if ganho[pos] > melhor[0]:
+                    melhor = (ganho[pos], int(i), int(fechados[pos]))
+        if melhor[1] is None:
+            break
+        open_dc[melhor[1]], open_dc[melhor[2]] = False, True
+        moves += 1
+    return open_dc, moves
+
+
+def solve_heuristic(inp, pre, stats=None):
+    """
+    Resolve o problema com a heurística, sobre as mesmas rotas que o presolve deixou ao CBC.
+    Devolve (tuplo (status, total_cost, alloc_ij, alloc_kj, dc_decisions), MIP start (y, x, z) ou None).
+    O status é 'Optimal' se o gap ao limite inferior for nulo, senão 'Feasible'.
+    Em 'stats' escreve {'heuristic': {...}} com o custo, o limite, o gap, as rondas e os tempos.
+    """
+    t0 = time.perf_counter()
+    model = build_network_matrices(inp, pre)
+    I, J, K = model['shape']
+    ny = model['ny']
+    demand = np.asarray(inp['demand_client'], dtype=np.float64)
+    capacity = np.asarray(inp['capacity_dc'], dtype=np.float64)
+    fixed = np.zeros(J)
+    fixed[model['y_candidates']] = model['c'][:ny]
+    can_open, must_open = np.zeros(J, dtype=bool), np.zeros(J, dtype=bool)
+    can_open[model['y_candidates']] = model['upper'][:ny] > 0
+    must_open[model['y_candidates']] = model['lower'][:ny] > 0
+    servidos = np.unique(model['lk'])  # clientes com procura (e rotas)
+    lp_rows = _lp_rows(model)
+
+    open_dc = can_open.copy()
+    precos = {'dc': np.zeros(J), 'factory': np.zeros(I)}
+    best, vistos, rounds, moves, evaluations = None, set(), 0, 0, 0
+    for rounds in range(1, HEURISTIC_MAX_ROUNDS + 1):
+        cost = unit_costs(model, precos['dc'], precos['factory'])[servidos]
+        open_dc, n = local_search(cost, demand[servidos], fixed, capacity, open_dc, can_open, must_open)
+        moves += n
+        if open_dc.tobytes() in vistos:
+            break
+        vistos.add(open_dc.tobytes())
+        x, avaliacao = solve_fixed_dcs(model, open_dc, lp_rows, HEURISTIC_EVAL_NEAREST)
+        if x is None and HEURISTIC_EVAL_NEAREST:
+            x, avaliacao = solve_fixed_dcs(model, open_dc, lp_rows)
+        evaluations += 1
+        # Conjunto sem capacidade/rotas suficientes: abrir o candidato fechado de maior capacidade
+        while x is None and (can_open & ~open_dc).any():
+            fechados = np.flatnonzero(can_open & ~open_dc)
+            open_dc[fechados[capacity[fechados].argmax()]] = True
+            x, avaliacao = solve_fixed_dcs(model, open_dc, lp_rows)
+            evaluations += 1
+        if x is None:
+            break
+        custo = float(model['c'] @ x)
+        if best is None or custo < best[0] - 1e-9 * max(1.0, abs(custo)):
+            best = (custo, x, open_dc.copy(), avaliacao)
+        precos = avaliacao
+    if best is not None and HEURISTIC_EVAL_NEAREST:
+        # Fluxos ótimos para o melhor conjunto de CDs, já sem o limite de CDs por cliente
+        x, avaliacao = solve_fixed_dcs(model, best[2], lp_rows)
+        evaluations += 1
+        if x is not None and model['c'] @ x < best[0]:
+            best = (float(model['c'] @ x), x, best[2], avaliacao)
+    search_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    if best is None or model['nz'] <= HEURISTIC_STRONG_BOUND_MAX_LANES:
+        bound_type, bound = 'lp_strong', lp_lower_bound(model, demand)
+    else:
+        # Preços das fábricas da melhor solução: qualquer preço não negativo dá um limite válido
+        bound_type, precos = 'lagrangian', best[3]
+        bound = precos['offset'] + lagrangian_lower_bound(
+            unit_costs(model, np.zeros(J), precos['factory'])[servidos], demand[servidos],
+            fixed, capacity, can_open, must_open, best[0] - precos['offset'])
+    bound_time = time.perf_counter() - t0
+
+    resumo = {'rounds': rounds, 'moves': moves, 'lp_evaluations': evaluations,
+              'bound_type': bound_type, 'lower_bound': bound,
+              'search_time_s': search_time, 'bound_time_s': bound_time}
+    if best is None:
+        if stats is not None:
+            stats['heuristic'] = {**resumo, 'cost': None, 'gap': None}
+        return ('Infeasible' if bound is None else 'Not Solved', 0.0, [[]], [[]], {}), None
+
+    custo, x = best[:2]
+    gap = relative_gap(custo, bound)
+    status = 'Optimal' if gap is not None and gap <= HEURISTIC_OPTIMAL_GAP else 'Feasible'
+    if stats is not None:
+        stats['heuristic'] = {**resumo, 'cost': custo, 'gap': gap}
+    result = extract_matrix_solution(inp, model, x, status)
+    decisions = result[4]
+    y = np.array([1.0 if decisions[name] == "Aberto" else 0.0 for name in inp['dc_names']])
+    print(f"ℹ️ Heurística: €{custo:,.2f} em {rounds} rondas ({moves} movimentos, {evaluations} LPs)"
+          + (f", limite inferior €{bound:,.2f}, gap {gap:.2%}" if gap is not None else "")
+          + f", {search_time + bound_time:.2f}s.")
+    return result, (y, np.asarray(result[2]), np.asarray(result[3]))
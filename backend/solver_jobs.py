@@ -0,0 +1,168 @@
+# backend/solver_jobs.py
+# Fila de trabalhos assíncronos para o solver de Network Design.
+#
+# O pedido HTTP só submete o trabalho e devolve logo um job_id; a resolução
+# corre num pool limitado de processos (um CBC por processo) e o frontend
+# consulta o estado até o resultado estar pronto.
+#
+# As melhorias da incumbente (tempo, custo, limite, gap) chegam dos processos do
+# pool por uma fila partilhada e ficam em job['incumbents'] enquanto o CBC corre.
+#
+# Nota: o registo de trabalhos vive na memória de cada processo web. Com vários
+# workers gunicorn, o polling tem de chegar ao mesmo worker (p. ex. um worker
+# com várias threads), ou cada worker só conhece os seus próprios trabalhos.
+
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from solver_algorithm import hash_json_default, solve_network_design_problem
+
+SOLVER_WORKERS = int(os.environ.get('SOLVER_WORKERS', os.cpu_count() or 1))
+SOLVER_MAX_PENDING = int(os.environ.get('SOLVER_MAX_PENDING', 32))  # trabalhos em fila/execução
+SOLVER_JOBS_KEEP = int(os.environ.get('SOLVER_JOBS_KEEP', 200))     # trabalhos terminados guardados
+
+_executor = None
+_manager = None
+_progress_queue = None
+_jobs = {}       # job_id -> estado do trabalho
+_in_flight = {}  # chave do input -> job_id (para de-duplicar submissões idênticas)
+_lock = threading.Lock()
+
+def _get_executor():
+    """ Pool criado só quando é preciso ('spawn': os filhos não herdam ligações à BD). """
+    global _executor, _manager, _progress_queue
+    if _executor is None:
+        ctx = multiprocessing.get_context('spawn')
+        _manager = ctx.Manager()
+        _progress_queue = _manager.Queue()
+        threading.Thread(target=_drain_progress, daemon=True).start()
+        _executor = ProcessPoolExecutor(max_workers=SOLVER_WORKERS, mp_context=ctx)
+    return _executor
+
+def _drain_progress():
+    """ Thread do processo web: passa os eventos de progresso dos filhos para os trabalhos. """
+    while True:
+        try:
+            job_id, event = _progress_queue.get()
+        except (EOFError, OSError):
+            return
+        with _lock:
+            job = _jobs.get(job_id)
+            if job is not None:
+                job['incumbents'].append(event)
+
+def input_key(kind, solver_input):
+    """ Hash estável do input (mesmo cenário -> mesma chave, independentemente da ordem das chaves). """
+    payload = json.dumps([kind, solver_input], sort_keys=True, separators=(',', ':'), default=hash_json_default)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _run_solver(solver_input, job_id=None, progress_queue=None):
+    """ Executado no processo do pool. """
+    stats = {}
+    on_progress = (lambda event: progress_queue.put((job_id, event))) if progress_queue is not None else None
+    result = solve_network_design_problem(solver_input, stats, on_progress)
+    return result, stats
+
+def _prune_finished():
+    """ Mantém apenas os SOLVER_JOBS_KEEP trabalhos terminados mais recentes (chamar com _lock). """
+    finished = [j for j in _jobs.values() if j['status'] in ('done', 'failed')]
+    if len(finished) > SOLVER_JOBS_KEEP:
+        finished.sort(key=lambda j: j['finished_at'])
+        for job in finished[:len(finished) - SOLVER_JOBS_KEEP]:
+            del _jobs[job['id']]
+
+def _on_done(job_id, key, future):
+    with _lock:
+        job = _jobs.get(job_id)
+        _in_flight.pop(key, None)
+        if job is None:
+            return
+        job['finished_at'] = time.time()
+        try:
+            job['result'], job['stats'] = future.result()
+            job['status'] = 'done'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            print(f"❌ Trabalho do solver {job_id} falhou: {e}")
+        job['future'] = None
+        _prune_finished()
+
+def submit_job(kind, solver_input, input_hash=None):
+    """
+    Submete um trabalho ao pool. Devolve (job_id, deduplicated): se um input idêntico
+    já estiver em fila/execução, devolve o job_id existente em vez de resolver de novo.
+    'input_hash' (opcional) é a chave do cache de resultados, guardada com o trabalho.
+    Lança RuntimeError se a fila estiver cheia.
+    """
+    key = input_key(kind, solver_input)
+    with _lock:
+        if key in _in_flight:
+            return _in_flight[key], True
+        pending = sum(1 for j in _jobs.values() if j['status'] in ('queued', 'running'))
+        if pending >= SOLVER_MAX_PENDING:
+            raise RuntimeError(f"Fila do solver cheia ({pending} trabalhos pendentes). Tente mais tarde.")
+
+        job_id = uuid.uuid4().hex
+        _jobs[job_id] = {
+            'id': job_id, 'kind': kind, 'key': key, 'input_hash': input_hash, 'status': 'queued',
+            'submitted_at': time.time(), 'finished_at': None,
+            'result': None, 'stats': None, 'error': None, 'future': None, 'incumbents': []
+        }
+        _in_flight[key] = job_id
+        future = _get_executor().submit(_run_solver, solver_input, job_id, _progress_queue)
+        _jobs[job_id]['future'] = future
+    print(f"ℹ️ Trabalho do solver {job_id} ({kind}) submetido.")
+    future.add_done_callback(lambda f: _on_done(job_id, key, f))
+    return job_id, False
+
+def _progress(status, incumbents):
+    """
+    Progresso a partir do último gap comunicado pelo CBC: 1 - gap (a fração do custo da
+    incumbente já coberta pelo limite inferior). None enquanto não houver gap (ainda sem
+    incumbente, ou modo heurístico) e num trabalho falhado; 1.0 quando termina.
+    """
+    if status == 'queued':
+        return 0.0
+    if status == 'done':
+        return 1.0
+    gaps = [e['gap'] for e in incumbents if e.get('gap') is not None]
+    if status == 'running' and gaps:
+        return round(1.0 - min(max(gaps[-1], 0.0), 1.0), 6)
+    return None
+
+def get_job(job_id):
+    """ Estado público do trabalho (ou None se não existir). """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        status = job['status']
+        if status == 'queued' and job['future'] is not None and job['future'].running():
+            status = job['status'] = 'running'
+        end = job['finished_at'] or time.time()
+        return {
+            'job_id': job['id'],
+            'kind': job['kind'],
+            'input_hash': job['input_hash'],
+            'status': status,
+            'progress': _progress(status, job['incumbents']),
+            'elapsed_s': round(end - job['submitted_at'], 3),
+            'incumbents': list(job['incumbents']),
+            'result': job['result'],
+            'stats': job['stats'],
+            'error': job['error']
+        }
+
+def list_jobs():
+    """ Resumo de todos os trabalhos conhecidos por este processo. """
+    with _lock:
+        ids = list(_jobs)
+    jobs = [get_job(job_id) for job_id in ids]
+    return [{k: v for k, v in job.items() if k not in ('result', 'stats', 'input_hash', 'incumbents')} for job in jobs if job]
@@ -0,0 +1,474 @@
+# backend/solver_matrix.py
+# Backend "matriz" do solver de Network Design.
+#
+# Em vez de construir LpAffineExpression termo a termo com o PuLP, monta a
+# matriz de restrições diretamente em arrays esparsos (COO -> CSC) a partir das
+# matrizes de custos já limpas, escreve um ficheiro MPS de uma vez e chama o
+# mesmo CBC que o PuLP usa. O resultado volta no formato de sempre:
+# (status, total_cost, alloc_ij, alloc_kj, dc_decisions).
+
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import scipy.sparse as sp
+from pulp import PULP_CBC_CMD
+
+# Estados do ficheiro de solução do CBC -> nomes do LpStatus do PuLP
+CBC_STATUS = {
+    'Optimal': 'Optimal',
+    'Infeasible': 'Infeasible',
+    'Integer': 'Infeasible',
+    'Unbounded': 'Unbounded',
+    'Stopped': 'Not Solved',
+}
+
+# Linhas do log do CBC: nova solução inteira (incumbente), progresso da árvore
+# (melhor solução / melhor limite) e o limite inicial da relaxação linear
+_INCUMBENT_RE = re.compile(r"Integer solution of (\S+) found .*?\(([\d.]+) seconds\)")
+_PROGRESS_RE = re.compile(r"best solution, best possible (\S+) \(([\d.]+) seconds\)")
+_CONTINUOUS_RE = re.compile(r"Continuous objective value is (\S+) - ([\d.]+) seconds")
+_SUMMARY_RE = {
+    'objective': re.compile(r"^Objective value:\s+(\S+)", re.M),
+    'bound': re.compile(r"^Lower bound:\s+(\S+)", re.M),
+}
+
+# Opções de paragem por pedido -> argumentos do PULP_CBC_CMD
+CBC_LIMIT_OPTIONS = {'time_limit_s': 'timeLimit', 'mip_gap': 'gapRel', 'mip_gap_abs': 'gapAbs', 'threads': 'threads'}
+# ... e as flags equivalentes da linha de comandos do CBC
+_CBC_LIMIT_FLAGS = {'timeLimit': '-sec', 'gapRel': '-ratioGap', 'gapAbs': '-allowableGap', 'threads': '-threads'}
+
+def cbc_limits(options):
+    """ Limite de tempo, gaps e threads pedidos (só os definidos), com os nomes do PuLP. """
+    return {arg: options[key] for key, arg in CBC_LIMIT_OPTIONS.items() if options.get(key) is not None}
+
+def relative_gap(objective, bound):
+    if objective is None or bound is None:
+        return None
+    return abs(objective - bound) / max(abs(objective), 1e-9)
+
+# Gap final acima do qual um 'Optimal' do CBC parou no mip_gap/limite sem provar o ótimo
+OPTIMAL_GAP_TOL = 1e-9
+
+def status_from_gap(status, gap):
+    """ 'Optimal' com gap final > OPTIMAL_GAP_TOL passa a 'Feasible' (o CBC também chama ótimo a uma paragem no mip_gap). """
+    if status == 'Optimal' and gap is not None and gap > OPTIMAL_GAP_TOL:
+        return 'Feasible'
+    return status
+
+def _progress_event(line, state):
+    """
+    Atualiza 'state' (objective, bound) com uma linha do log. Devolve um evento
+    {time_s, objective, bound, gap} quando a melhor solução ou o limite melhoram.
+    """
+    m = _INCUMBENT_RE.search(line)
+    if m:
+        objective, t = float(m.group(1)), float(m.group(2))
+        bound = state['bound']
+    else:
+        m = _PROGRESS_RE.search(line) or _CONTINUOUS_RE.search(line)
+        if not m:
+            return None
+        objective, bound, t = state['objective'], float(m.group(1)), float(m.group(2))
+    if objective is not None and bound is not None:
+        bound = min(bound, objective)
+    if (objective, bound) == (state['objective'], state['bound']):
+        return None
+    state['objective'], state['bound'] = objective, bound
+    if objective is None:
+        return None
+    return {'time_s': t, 'objective': objective, 'bound': bound, 'gap': relative_gap(objective, bound)}
+
+def parse_cbc_log(text):
+    """
+    Extrai do log do CBC as melhorias da incumbente (tempo, custo, limite, gap),
+    o tempo até à primeira solução inteira, o limite/gap finais e se o MIP start
+    fornecido foi aceite.
+    """
+    state = {'objective': None, 'bound': None}
+    incumbents = [ev for ev in (_progress_event(line, state) for line in text.split("\n")) if ev]
+    summary = {k: float(m.group(1)) for k, rx in _SUMMARY_RE.items() for m in [rx.search(text)] if m}
+    objective = summary.get('objective', state['objective'])
+    bound = summary.get('bound', objective if 'Optimal solution found' in text else state['bound'])
+    return {
+        'incumbents': incumbents,
+        'first_incumbent_s': incumbents[0]['time_s'] if incumbents else None,
+        'first_incumbent_cost': incumbents[0]['objective'] if incumbents else None,
+        'objective_bound': bound,
+        'mip_gap': relative_gap(objective, bound),
+        'mip_start_accepted': 'MIPStart provided solution' in text
+    }
+
+def _follow_log(path, on_event, done):
+    """ Lê o log à medida que o CBC o escreve e chama on_event a cada melhoria. """
+    state = {'objective': None, 'bound': None}
+    pos, buffer = 0, ''
+    while True:
+        finished = done.is_set()
+        try:
+            with open(path, 'rb') as f:
+                f.seek(pos)
+                chunk = f.read()
+                pos = f.tell()
+        except FileNotFoundError:
+            chunk = b''
+        *lines, buffer = (buffer + chunk.decode('utf-8', 'replace')).split("\n")
+        for line in lines:
+            event = _progress_event(line, state)
+            if event:
+                try:
+                    on_event(event)
+                except Exception as e:
+                    print(f"⚠️ Erro no callback de progresso do solver: {e}")
+        if finished:
+            return
+        done.wait(0.2)
+
+@contextmanager
+def follow_cbc_log(path, on_event):
+    """ Enquanto o bloco corre, segue o log do CBC em 'path' numa thread (se houver on_event). """
+    if on_event is None:
+        yield
+        return
+    done = threading.Event()
+    thread = threading.Thread(target=_follow_log, args=(path, on_event, done), daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+def _lanes_to_arrays(lanes):
+    """ Lista de pares (a, j) -> dois arrays int64 (vazios se não houver rotas). """
+    if not lanes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    arr = np.asarray(lanes, dtype=np.int64)
+    return arr[:, 0], arr[:, 1]
+
+def build_network_matrices(inp, pre):
+    """
+    Monta o modelo em forma matricial: min c·x  s.a.  A x (<=, =, >=) b, limites e integralidade.
+    Ordem das colunas: Y (CDs candidatos), X (rotas Fábrica->CD), Z (rotas CD->Cliente).
+    """
+    I, J, K = len(inp['supply_factory']), len(inp['capacity_dc']), len(inp['demand_client'])
+    li, lj = _lanes_to_arrays(pre['lanes_ij'])
+    lk, lj2 = _lanes_to_arrays(pre['lanes_kj'])
+    yc = np.asarray(pre['y_candidates'], dtype=np.int64)
+    ny, nx, nz = len(yc), len(li), len(lk)
+    col_x = ny + np.arange(nx)
+    col_z = ny + nx + np.arange(nz)
+    y_col = np.full(J, -1, dtype=np.int64)
+    y_col[yc] = np.arange(ny)
+
+    supply = np.asarray(inp['supply_factory'], dtype=np.float64)
+    demand = np.asarray(inp['demand_client'], dtype=np.float64)
+    capacity = np.asarray(inp['capacity_dc'], dtype=np.float64)
+    t = inp['transport_cost_per_km']
+
+    # --- Função objetivo ---
+    c = np.zeros(ny + nx + nz)
+    c[:ny] = np.asarray(inp['dc_fixed_costs'], dtype=np.float64)[yc]
+    if nx:
+        c[col_x] = np.asarray(inp['costs_factory_dc'], dtype=np.float64)[li, lj] * t
+    if nz:
+        c[col_z] = np.asarray(inp['costs_dc_client'], dtype=np.float64)[lk, lj2] * t
+
+    rows, cols, vals = [], [], []
+    sense, names, kinds, refs = [], [], [], []
+
+    def add_block(row_ids, col_ids, coefs):
+        rows.append(row_ids)
+        cols.append(col_ids)
+        vals.append(np.broadcast_to(np.asarray(coefs, dtype=np.float64), row_ids.shape))
+
+    def new_rows(keys, prefix, row_sense):
+        """ Cria uma linha por chave e devolve o mapa chave -> índice da linha. """
+        start = len(sense)
+        sense.extend([row_sense] * len(keys))
+        kinds.extend([prefix] * len(keys))
+        refs.extend(np.asarray(keys).tolist())
+        names.extend(f"{prefix}{k}" for k in keys)
+        mapa = np.full(max(I, J, K) + 1, -1, dtype=np.int64)
+        mapa[keys] = start + np.arange(len(keys))
+        return mapa
+
+    # C1. Capacidade da Fábrica i (Oferta)
+    fabricas = np.unique(li)
+    r1 = new_rows(fabricas, "F", 'L')
+    add_block(r1[li], col_x, 1.0)
+
+    # C2. Procura do Cliente k (Procura 100% Satisfeita)
+    clientes = np.union1d(np.flatnonzero(demand != 0), lk)
+    r2 = new_rows(clientes, "K", 'E')
+    add_block(r2[lk], col_z, 1.0)
+
+    # C3. Balanço de Fluxo no CD j (Transbordo)
+    cds_fluxo = np.union1d(lj, lj2)
+    r3 = new_rows(cds_fluxo, "B", 'E')
+    add_block(r3[lj], col_x, 1.0)
+    add_block(r3[lj2], col_z, -1.0)
+
+    # C4. Capacidade do CD j (Restrição 'Link')
+    cds_x = np.unique(lj)
+    r4 = new_rows(cds_x, "C", 'L')
+    add_block(r4[lj], col_x, 1.0)
+    add_block(r4[cds_x], y_col[cds_x], -capacity[cds_x])
+
+    # C6. Utilização Mínima da Fábrica
+    fab_min = np.array([i for i, name in enumerate(inp['factory_names'])
+                        if inp['factory_min_util_map'].get(name, 0) > 0], dtype=np.int64)
+    if len(fab_min):
+        r6 = new_rows(fab_min, "M", 'G')
+        sel = np.isin(li, fab_min)
+        add_block(r6[li[sel]], col_x[sel], 1.0)
+
+    A = sp.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                      shape=(len(sense), ny + nx + nz)).tocsc()
+
+    col_names = ([f"Y{j}" for j in yc] + [f"X{i}_{j}" for i, j in zip(li.tolist(), lj.tolist())]
+                 + [f"Z{k}_{j}" for k, j in zip(lk.tolist(), lj2.tolist())])
+
+    model = {
+        'c': c, 'A': A, 'sense': sense, 'row_names': names, 'col_names': col_names,
+        'row_kind': np.asarray(kinds), 'row_ref': np.asarray(refs, dtype=np.int64),
+        'ny': ny, 'nx': nx, 'nz': nz, 'y_candidates': yc,
+        'li': li, 'lj': lj, 'lk': lk, 'lj2': lj2, 'shape': (I, J, K)
+    }
+    set_scenario_bounds(model, inp)
+    return model
+
+def set_scenario_bounds(model, inp):
+    """
+    Lados direitos e limites que dependem do cenário: oferta (C1), procura (C2),
+    utilização mínima (C6) e CDs forçados (C5, limites de Y). A matriz A e o
+    objetivo não mudam, por isso um modelo já construído pode ser reutilizado.
+    """
+    supply = np.asarray(inp['supply_factory'], dtype=np.float64)
+    demand = np.asarray(inp['demand_client'], dtype=np.float64)
+    min_util = np.array([inp['factory_min_util_map'].get(name, 0) for name in inp['factory_names']]
+                        + [0] * (len(supply) - len(inp['factory_names'])), dtype=np.float64)
+    kind, ref = model['row_kind'], model['row_ref']
+    rhs = np.zeros(len(kind))
+    for prefix, values in (("F", supply), ("K", demand), ("M", supply * min_util)):
+        sel = kind == prefix
+        rhs[sel] = values[ref[sel]]
+    model['rhs'] = rhs
+
+    ny, n = model['ny'], len(model['c'])
+    lower = np.zeros(n)
+    upper = np.full(n, np.inf)
+    upper[:ny] = 1.0
+    for pos, j in enumerate(model['y_candidates'].tolist()):
+        force = inp['dc_force_map'].get(inp['dc_names'][j]) if j < len(inp['dc_names']) else None
+        if force == 1:
+            lower[pos] = 1.0
+        elif force == 0:
+            upper[pos] = 0.0
+    model['lower'], model['upper'] = lower, upper
+
+def _mps_columns(model):
+    """
+    Cabeçalho, ROWS e COLUMNS do MPS (só dependem de A, c e das linhas). Ficam
+    guardados no modelo para que um modelo reutilizado só reescreva RHS e BOUNDS.
+    As entradas de cada coluna saem contíguas a partir da matriz CSC.
+    """
+    if 'mps_columns' in model:
+        return model['mps_columns']
+    A, c = model['A'], model['c']
+    n = A.shape[1]
+    row_names = ['OBJ'] + model['row_names']
+    col_names = model['col_names']
+
+    # Objetivo (sempre presente, para que nenhuma coluna fique por declarar) + entradas da matriz
+    nz_cols = np.repeat(np.arange(n), np.diff(A.indptr))
+    all_cols = np.concatenate([np.arange(n), nz_cols])
+    all_rows = np.concatenate([np.zeros(n, dtype=np.int64), A.indices + 1])
+    all_vals = np.concatenate([c, A.data])
+    ordem = np.argsort(all_cols, kind='stable')
+
+    lines = ["NAME          BrewSEP_Network_Design_Scenario", "ROWS", " N  OBJ"]
+    lines += [f" {s}  {r}" for s, r in zip(model['sense'], model['row_names'])]
+    lines.append("COLUMNS")
+    lines.append("    MARK      'MARKER'                 'INTORG'")
+    lines += [f"    {col_names[ci]:<8}  {row_names[ri]:<8}  {v: .12e}"
+              for ci, ri, v in zip(all_cols[ordem].tolist(), all_rows[ordem].tolist(), all_vals[ordem].tolist())]
+    lines.append("    MARK      'MARKER'                 'INTEND'")
+    model['mps_columns'] = "\n".join(lines)
+    return model['mps_columns']
+
+def write_mps(path, model):
+    """
+    Escreve o modelo em MPS com o mesmo alinhamento de campos do writeMPS do PuLP
+    (todas as colunas inteiras, Y binárias).
+    """
+    col_names = model['col_names']
+    lines = [_mps_columns(model)]
+    lines.append("RHS")
+    lines += [f"    RHS       {model['row_names'][r]:<8}  {v: .12e}" for r, v in enumerate(model['rhs'].tolist()) if v != 0]
+    lines.append("BOUNDS")
+    ny = model['ny']
+    for pos in range(ny):
+        lo, up = model['lower'][pos], model['upper'][pos]
+        if lo == up:
+            lines.append(f" FX BND       {col_names[pos]:<8}  {lo: .12e}")
+        else:
+            lines.append(f" BV BND       {col_names[pos]:<8}")
+    # Sem limite superior explícito o CBC trata inteiros de um bloco MARKER como binários
+    lines += [f" PL BND       {name:<8}" for name in col_names[ny:]]
+    lines.append("ENDATA")
+
+    with open(path, 'w') as f:
+        f.write("\n".join(lines))
+        f.write("\n")
+
+def start_vector(model, start):
+    """ Solução anterior (y[J], x[I][J], z[K][J]) -> vetor nas colunas do modelo. """
+    y, x, z = start
+    return np.concatenate([y[model['y_candidates']], x[model['li'], model['lj']], z[model['lk'], model['lj2']]])
+
+def is_feasible(model, v, tol=1e-6):
+    """ Verifica limites e restrições A v (<=, =, >=) rhs para um vetor de colunas. """
+    if np.any(v < model['lower'] - tol) or np.any(v > model['upper'] + tol):
+        return False
+    act = model['A'] @ v
+    sense = np.asarray(model['sense'])
+    rhs = model['rhs']
+    return bool(np.all(act[sense == 'L'] <= rhs[sense == 'L'] + tol)
+                and np.all(np.abs(act[sense == 'E'] - rhs[sense == 'E']) <= tol)
+                and np.all(act[sense == 'G'] >= rhs[sense == 'G'] - tol))
+
+def write_mip_start(path, names, values):
+    """ Ficheiro -mips do CBC (mesmo formato que o writesol do PuLP). """
+    lines = ["Stopped on time - objective value 0"]
+    lines += ["{:>7} {} {:>15} {:>23}".format(n, name, v, 0) for n, (name, v) in enumerate(zip(names, values))]
+    with open(path, 'w') as f:
+        f.write("\n".join(lines))
+        f.write("\n")
+
+def read_cbc_solution(path, n_cols):
+    """
+    Lê o ficheiro -solution do CBC: devolve (status, valores das colunas).
+    Parado por limite de tempo com uma solução inteira -> 'Feasible'; sem solução inteira
+    (valores da relaxação linear) fica 'Not Solved'. A paragem no mip_gap sai 'Optimal'
+    no ficheiro (ver status_from_gap).
+    """
+    with open(path) as f:
+        first = f.readline()
+        body = f.read().split("\n")
+    tokens = first.split()
+    status = CBC_STATUS.get(tokens[0] if tokens else '', 'Undefined')
+    # Como o get_status do PuLP: 'Stopped on time - objective value ...' traz uma incumbente;
+    # 'Stopped on time (no integer solution - continuous used) - ...' só traz a relaxação linear
+    if status == 'Not Solved' and len(tokens) >= 5 and tokens[4] == 'objective':
+        status = 'Feasible'
+    # Com printingOptions all saem todas as linhas e depois todas as colunas, por ordem
+    values = np.zeros(n_cols)
+    cols = [l for l in body if l.strip()][-n_cols:] if n_cols else []
+    for pos, line in enumerate(cols):
+        parts = line.replace("**", "").split()
+        values[pos] = float(parts[2])
+    return status, values
+
+# Último modelo construído neste processo, para re-resoluções que só mudam limites/RHS.
+# Partilhado pelas threads dos pedidos: quem o usa segura o lock desde a alteração dos
+# limites até à extração da solução.
+_model_cache = {'key': None, 'model': None}
+_model_cache_lock = threading.Lock()
+
+def solve_matrix_model(inp, pre, stats=None, start=None, structure_key=None, limits=None, on_progress=None):
+    """
+    Backend matricial: constrói A/c/b em NumPy, escreve o MPS e chama o CBC.
+    'start' é uma solução anterior (y, x, z), passada ao CBC como MIP start se ainda
+    for admissível (o CBC 2.10 não completa starts parciais, só com os Y).
+    Com 'structure_key', um modelo anterior com a mesma estrutura é reutilizado
+    (com o lock do cache: as re-resoluções com modelo partilhado são feitas uma de cada vez).
+    'limits' vem de cbc_limits(); on_progress recebe as melhorias da incumbente.
+    """
+    with _model_cache_lock if structure_key is not None else nullcontext():
+        return _solve_matrix_model(inp, pre, stats, start, structure_key, limits, on_progress)
+
+def _solve_matrix_model(inp, pre, stats, start, structure_key, limits, on_progress):
+    t0 = time.perf_counter()
+    reused = structure_key is not None and _model_cache['key'] == structure_key
+    if reused:
+        model = _model_cache['model']
+        set_scenario_bounds(model, inp)
+    else:
+        model = build_network_matrices(inp, pre)
+        if structure_key is not None:
+            _model_cache.update(key=structure_key, model=model)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mps_path = os.path.join(tmp, "model.mps")
+        sol_path = os.path.join(tmp, "model.sol")
+        mst_path = os.path.join(tmp, "model.mst")
+        log_path = os.path.join(tmp, "cbc.log")
+        write_mps(mps_path, model)
+        cmd = [PULP_CBC_CMD().path, mps_path]
+        for arg, v in (limits or {}).items():
+            cmd += [_CBC_LIMIT_FLAGS[arg], str(v)]
+        start_mode = None
+        if start is not None:
+            v = start_vector(model, start)
+            if is_feasible(model, v):
+                start_mode = 'full'
+                write_mip_start(mst_path, model['col_names'], v.tolist())
+                cmd += ["-mips", mst_path]
+            else:
+                print("⚠️ A solução anterior já não é admissível neste cenário; a resolver sem MIP start.")
+        build_time = time.perf_counter() - t0
+        if stats is not None:
+            stats['build_time_s'] = build_time
+            stats['model_reused'] = reused
+            stats.setdefault('presolve', {})['constraints'] = len(model['sense'])
+
+        try:
+            t0 = time.perf_counter()
+            with open(log_path, 'w') as log_file, follow_cbc_log(log_path, on_progress):
+                subprocess.run(cmd + ["-timeMode", "elapsed", "-branch", "-printingOptions", "all",
+                                      "-solution", sol_path], check=True, stdout=log_file, stderr=subprocess.STDOUT)
+            solve_time = time.perf_counter() - t0
+            with open(log_path) as f:
+                log_text = f.read()
+            print(log_text)
+            status, x = read_cbc_solution(sol_path, len(model['c']))
+        except Exception as e:
+            print(f"❌ Erro durante a resolução com o CBC (backend matriz): {e}")
+            return "Erro no Solver", 0.0, [[]], [[]], {}
+    log = parse_cbc_log(log_text)
+    status = status_from_gap(status, log['mip_gap'])
+    if stats is not None:
+        stats['solve_time_s'] = solve_time
+        accepted = log.pop('mip_start_accepted')
+        stats.update(log)
+        if start is not None:
+            stats['warm_start'] = {'mode': start_mode, 'accepted': accepted}
+
+    if status not in ('Optimal', 'Feasible'):
+        return status, 0.0, [[]], [[]], {}
+
+    t0 = time.perf_counter()
+    result = extract_matrix_solution(inp, model, x, status)
+    if stats is not None:
+        stats['extract_time_s'] = time.perf_counter() - t0
+    return result
+
+def extract_matrix_solution(inp, model, x, status='Optimal'):
+    """ Converte o vetor solução no formato (status, custo, alloc_ij, alloc_kj, dc_decisions). """
+    I, J, K = model['shape']
+    ny, nx = model['ny'], model['nx']
+    alloc_ij = np.zeros((I, J))
+    alloc_kj = np.zeros((K, J))
+    alloc_ij[model['li'], model['lj']] = x[ny:ny + nx]
+    alloc_kj[model['lk'], model['lj2']] = x[ny + nx:]
+
+    abertos = set(model['y_candidates'][x[:ny] > 0.9].tolist())
+    dc_decisions = {inp['dc_names'][j]: ("Aberto" if j in abertos else "Fechado") for j in range(J)}
+    total_cost = float(model['c'] @ x)
+    return status, total_cost, alloc_ij.tolist(), alloc_kj.tolist(), dc_decisions
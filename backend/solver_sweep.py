@@ -0,0 +1,126 @@
+# backend/solver_sweep.py
+# Varrimento de cenários ("what-if") para o solver de Network Design.
+#
+# Um pedido traz um conjunto base de dados e uma lista de variantes (overrides
+# explícitos ou uma grelha cartesiana de parâmetros). As matrizes de custos são
+# limpas uma única vez e enviadas a cada processo do pool no arranque; cada
+# variante só altera os parâmetros de cenário e é resolvida em paralelo.
+# O resultado é uma tabela compacta: custo e CDs abertos por variante.
+
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from solver_algorithm import clean_number, clean_number_array, prepare_network_inputs, solve_prepared_network
+
+SWEEP_WORKERS = int(os.environ.get('SWEEP_WORKERS', os.cpu_count() or 1))
+SWEEP_MAX_VARIANTS = int(os.environ.get('SWEEP_MAX_VARIANTS', 500))
+
+# Parâmetros que uma variante pode alterar, e a chave correspondente nos inputs limpos.
+# Os mapas ('dc_force_map', 'factory_min_util_map') são fundidos com os da base;
+# os restantes substituem o valor da base.
+SWEEP_PARAMETERS = {
+    'transport_cost_per_km': 'transport_cost_per_km',
+    'dc_force_map': 'dc_force_map',
+    'factory_min_util_map': 'factory_min_util_map',
+    'capacity_dc': 'capacity_dc',
+    'dc_fixed_cost_list': 'dc_fixed_costs',
+    'supply_factory': 'supply_factory',
+}
+SWEEP_OPTIONS = ('presolve', 'k_nearest_dcs', 'nearest_by', 'solver_backend', 'solver_mode', 'time_limit_s', 'mip_gap', 'mip_gap_abs', 'threads',
+                 'client_aggregation', 'aggregation_km', 'aggregation_clusters', 'aggregation_seed', 'client_points',
+                 'dc_points')
+
+_base_inp = None  # inputs limpos partilhados, definidos em cada processo do pool
+
+def expand_variants(overrides=None, grid=None):
+    """
+    Lista de variantes (dicionários de overrides).
+    'grid' é {parâmetro: [valores]} e gera o produto cartesiano; uma chave
+    'mapa.nome' (p. ex. 'dc_force_map.CD Lisboa') varia uma entrada de um mapa.
+    Com ambos, cada override explícito é combinado com cada ponto da grelha.
+    """
+    base_variants = list(overrides or [{}])
+    if not grid:
+        return base_variants
+    keys = sorted(grid)
+    pontos = [dict(zip(keys, valores)) for valores in itertools.product(*(grid[k] for k in keys))]
+    return [{**o, **p} for o in base_variants for p in pontos]
+
+def _validate_variant(variant):
+    for key in variant:
+        param = key.split('.', 1)[0]
+        if param not in SWEEP_PARAMETERS and param not in SWEEP_OPTIONS:
+            raise ValueError(f"Parâmetro '{key}' não pode ser variado num varrimento.")
+        if '.' in key and param not in ('dc_force_map', 'factory_min_util_map'):
+            raise ValueError(f"'{key}': só os mapas aceitam a notação 'mapa.nome'.")
+
+def apply_variant(inp, variant):
+    """ Devolve (inputs limpos da variante, opções do solver) sem alterar 'inp'. """
+    inp = dict(inp)
+    options = {}
+    for key, value in variant.items():
+        param, _, entry = key.partition('.')
+        if param in SWEEP_OPTIONS:
+            options[param] = value
+        elif entry:
+            inp[param] = {**inp[param], entry: value}
+        elif param in ('dc_force_map', 'factory_min_util_map'):
+            inp[param] = {**inp[param], **value}
+        elif param == 'transport_cost_per_km':
+            inp[param] = clean_number(value)
+        else:
+            inp[SWEEP_PARAMETERS[param]] = clean_number_array(value).tolist()
+    return inp, options
+
+def _init_worker(base_inp):
+    global _base_inp
+    _base_inp = base_inp
+
+def _solve_variant(index, variant, base_options):
+    """ Executado no processo do pool: resolve uma variante e devolve a linha da tabela. """
+    inp, options = apply_variant(_base_inp, variant)
+    stats = {}
+    t0 = time.perf_counter()
+    status, total_cost, _, _, dc_decisions = solve_prepared_network(inp, {**base_options, **options}, stats)
+    return {
+        'variant': index,
+        'overrides': variant,
+        'status': status,
+        'total_cost': total_cost if status in ('Optimal', 'Feasible') else None,
+        'mip_gap': stats.get('mip_gap'),
+        'open_dcs': [name for name, d in dc_decisions.items() if d == "Aberto"],
+        'time_s': round(time.perf_counter() - t0, 3)
+    }
+
+def run_sweep(base_data, variants, max_workers=None):
+    """
+    Resolve todas as variantes sobre o mesmo conjunto base.
+    Devolve a lista de linhas por ordem das variantes (ver _solve_variant).
+    'max_workers' (vem do pedido) nunca passa de SWEEP_WORKERS.
+    Lança ValueError para variantes inválidas, demasiadas variantes ou max_workers < 1.
+    """
+    if not variants:
+        raise ValueError("Nenhuma variante para resolver.")
+    if len(variants) > SWEEP_MAX_VARIANTS:
+        raise ValueError(f"Demasiadas variantes ({len(variants)} > {SWEEP_MAX_VARIANTS}).")
+    for variant in variants:
+        _validate_variant(variant)
+    if max_workers is not None and (type(max_workers) is not int or max_workers < 1):
+        raise ValueError(f"'max_workers' tem de ser um inteiro >= 1 (recebido: {max_workers!r}).")
+
+    base_inp = prepare_network_inputs(base_data)
+    base_options = {k: base_data[k] for k in SWEEP_OPTIONS if k in base_data}
+    workers = max(1, min(max_workers or SWEEP_WORKERS, SWEEP_WORKERS, len(variants)))
+    print(f"ℹ️ Varrimento de {len(variants)} cenários em {workers} processo(s)...")
+
+    if workers == 1:
+        _init_worker(base_inp)
+        return [_solve_variant(n, v, base_options) for n, v in enumerate(variants)]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(base_inp,)) as pool:
+        futures = [pool.submit(_solve_variant, n, v, base_options) for n, v in enumerate(variants)]
+        return [f.result() for f in futures]
@@ -0,0 +1,101 @@
+# backend/spatial_index.py
+# Índice espacial em memória (KD-tree) sobre fábricas, clientes e CDs.
+#
+# Os pontos são guardados como vetores na esfera unitária (x, y, z): a distância
+# euclidiana entre dois vetores (a corda) cresce com a distância ortodrómica, por isso
+# os K mais próximos pela corda são os K mais próximos em Haversine e um raio em km
+# converte-se exatamente num raio de corda. Cada consulta é O(log n) em vez de
+# percorrer a tabela toda.
+#
+# IndexCache guarda um índice por tabela e só o reconstrói quando a tabela muda:
+# as rotas que escrevem pontos chamam invalidate() e cada consulta compara também
+# uma impressão digital barata da tabela (ver table_fingerprint em app.py), para que
+# um worker gunicorn veja as escritas feitas por outro.
+
+import math
+import threading
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import logic
+
+
+def unit_vectors(lat, lng):
+    """ Graus -> vetores (n × 3) na esfera unitária. """
+    lat, lng = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lng, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+
+def km_to_chord(km):
+    """ Distância ortodrómica (km) -> corda na esfera unitária. """
+    return 2 * math.sin(min(float(km) / logic.R_TERRA_KM, math.pi) / 2)
+
+
+def chord_to_km(chord):
+    """ Corda na esfera unitária -> distância ortodrómica (km); aceita arrays. """
+    return 2 * logic.R_TERRA_KM * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2, 0, 1))
+
+
+class PointIndex:
+    """
+    KD-tree sobre uma lista de pontos {'lat', 'lng', ...}. As consultas devolvem
+    (distâncias em km, posições na lista original).
+    """
+
+    def __init__(self, points):
+        self.points = list(points)
+        lat, lng, _ = logic.points_to_arrays(self.points)
+        self.tree = cKDTree(unit_vectors(lat, lng)) if self.points else None
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, lat, lng, k=1):
+        """
+        Os k pontos mais próximos de cada ponto de consulta (lat/lng escalares ou arrays).
+        Devolve dois arrays (consultas × k), ordenados do mais próximo para o mais afastado.
+        """
+        lat, lng = np.atleast_1d(lat), np.atleast_1d(lng)
+        k = min(int(k), len(self))
+        if k < 1:
+            return np.empty((len(lat), 0)), np.empty((len(lat), 0), dtype=np.int64)
+        chord, idx = self.tree.query(unit_vectors(lat, lng), k=k)
+        return chord_to_km(chord).reshape(len(lat), k), np.asarray(idx, dtype=np.int64).reshape(len(lat), k)
+
+    def within_radius(self, lat, lng, radius_km):
+        """ Pontos a menos de radius_km de (lat, lng): (km, posições), do mais próximo para o mais afastado. """
+        if not len(self):
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        centro = unit_vectors([lat], [lng])[0]
+        idx = np.asarray(self.tree.query_ball_point(centro, km_to_chord(radius_km)), dtype=np.int64)
+        km = chord_to_km(np.linalg.norm(self.tree.data[idx] - centro, axis=1))
+        ordem = np.argsort(km, kind='stable')
+        return km[ordem], idx[ordem]
+
+
+class IndexCache:
+    """ Um PointIndex por tabela, reconstruído só quando a impressão digital da tabela muda. """
+
+    def __init__(self):
+        self._indexes = {}  # tabela -> (impressão digital, PointIndex)
+        self._lock = threading.Lock()
+
+    def invalidate(self, table=None):
+        """ Descarta o índice de uma tabela (ou de todas): a próxima consulta reconstrói-o. """
+        with self._lock:
+            if table is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(table, None)
+
+    def get(self, table, fingerprint, load):
+        """ Índice da tabela; load() devolve os pontos e só é chamado quando é preciso reconstruir. """
+        with self._lock:
+            entry = self._indexes.get(table)
+            if entry is not None and entry[0] == fingerprint:
+                return entry[1]
+            index = PointIndex(load())
+            self._indexes[table] = (fingerprint, index)
+            print(f"ℹ️ Índice espacial de '{table}' reconstruído ({len(index)} pontos).")
+            return index
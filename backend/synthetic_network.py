@@ -0,0 +1,149 @@
+# backend/synthetic_network.py
+# Gerador de redes sintéticas reprodutíveis (mesma semente -> mesmo cenário).
+#
+# Produz cenários no formato dos presets (preset_A.json / preset_B.json: listas
+# 'factories', 'clients' e 'distribution_centers', com os números em texto como nos
+# presets) em qualquer tamanho, p. ex. 10 fábricas × 200 CDs × 20 000 clientes, e as
+# matrizes de custos offline correspondentes (Haversine × fator de desvio, as mesmas
+# que /get-distance-matrix?provider=haversine guardaria no cache).
+#
+#   - clientes concentrados à volta de cidades com tamanhos de cauda longa;
+#   - CDs candidatos perto de cidades, fábricas espalhadas pela região;
+#   - oferta total = procura × SUPPLY_MARGIN e capacidades dos CDs tais que cerca de
+#     um quarto dos CDs chega para servir a procura (o MILP tem escolhas a fazer).
+#
+# Uso (escreve <nome>.json, carregável com /load-preset/<nome> se ficar em backend/,
+# e <nome>_factories.npz / <nome>_clients.npz no formato do cache do solver):
+#   python synthetic_network.py --factories 10 --dcs 200 --clients 20000 --seed 1 --name synth_large
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+import distance_providers
+import matrix_store
+
+# Região por omissão (lat mín., lat máx., lng mín., lng máx.): Península Ibérica
+IBERIA = (36.0, 43.5, -9.5, 3.0)
+SUPPLY_MARGIN = 1.3
+CITY_SPREAD_DEG = 0.05  # ~5 km à volta do centro de cada cidade
+
+
+def generate_scenario(n_factories, n_dcs, n_clients, seed=0, n_cities=None, bounds=IBERIA):
+    """ Cenário no formato dos presets, reprodutível pela semente; 'meta' regista os parâmetros. """
+    rng = np.random.default_rng(seed)
+    lat_min, lat_max, lng_min, lng_max = bounds
+    n_cities = n_cities or max(1, n_clients // 50)
+
+    def uniform(n):
+        return rng.uniform(lat_min, lat_max, n), rng.uniform(lng_min, lng_max, n)
+
+    city_lat, city_lng = uniform(n_cities)
+    city_size = rng.pareto(1.2, n_cities) + 1
+    city = rng.choice(n_cities, n_clients, p=city_size / city_size.sum())
+    c_lat = city_lat[city] + rng.normal(0, CITY_SPREAD_DEG, n_clients)
+    c_lng = city_lng[city] + rng.normal(0, CITY_SPREAD_DEG, n_clients)
+    demand = rng.integers(10, 200, n_clients)
+    total = int(demand.sum())
+
+    f_lat, f_lng = uniform(n_factories)
+    supply = np.ceil(rng.dirichlet(np.full(n_factories, 4.0)) * total * SUPPLY_MARGIN).astype(np.int64) + 1
+
+    site = rng.choice(n_cities, n_dcs, p=city_size / city_size.sum())
+    d_lat = city_lat[site] + rng.normal(0, 2 * CITY_SPREAD_DEG, n_dcs)
+    d_lng = city_lng[site] + rng.normal(0, 2 * CITY_SPREAD_DEG, n_dcs)
+    capacity = np.ceil(total / max(1, n_dcs // 4) * rng.uniform(0.5, 1.5, n_dcs)).astype(np.int64)
+    fixed = rng.integers(500, 2000, n_dcs) * 1000
+
+    def point(lat, lng, w, name, **extra):
+        return {'lat': round(float(lat), 6), 'lng': round(float(lng), 6), 'w': str(int(w)),
+                'address': name, 'country': 'Sintético', **extra}
+
+    return {
+        'factories': [point(f_lat[i], f_lng[i], supply[i], f"Fábrica {i + 1}") for i in range(n_factories)],
+        'clients': [point(c_lat[k], c_lng[k], demand[k], f"Cliente {k + 1}") for k in range(n_clients)],
+        'distribution_centers': [point(d_lat[j], d_lng[j], capacity[j], f"CD {j + 1}", custo_fixo=str(int(fixed[j])))
+                                 for j in range(n_dcs)],
+        'meta': {'generator': 'synthetic_network', 'seed': seed, 'factories': n_factories, 'dcs': n_dcs,
+                 'clients': n_clients, 'cities': n_cities, 'bounds': list(bounds)},
+    }
+
+
+def point_names(points):
+    """ Nomes como em get_points_from_db (a parte do endereço antes da vírgula). """
+    return [p['address'].split(',')[0] for p in points]
+
+
+def cost_matrices(scenario, detour_factor=distance_providers.DEFAULT_DETOUR_FACTOR):
+    """
+    Matrizes offline do cenário: (km fábrica×CD, km cliente×CD), arredondadas a 0,1 km
+    como as tabelas do fornecedor Haversine.
+    """
+    provider = distance_providers.HaversineDistanceProvider(detour_factor)
+    dcs = scenario['distribution_centers']
+    return (np.round(provider.distance_km(scenario['factories'], dcs), 1),
+            np.round(provider.distance_km(scenario['clients'], dcs), 1))
+
+
+def solver_input(scenario, matrices):
+    """
+    Input do solver com as tabelas de custos com cabeçalhos (o corpo de /run-scenario),
+    equivalente ao que build_solver_input_from_cache monta depois de carregar o cenário.
+    """
+    factories, clients, dcs = scenario['factories'], scenario['clients'], scenario['distribution_centers']
+    dc_names = point_names(dcs)
+    km_factories, km_clients = matrices
+    return {
+        'costs_factory_dc': matrix_store.arrays_to_table(km_factories, point_names(factories), dc_names),
+        'costs_dc_client': matrix_store.arrays_to_table(km_clients, point_names(clients), dc_names),
+        'supply_factory': [p['w'] for p in factories],
+        'demand_client': [p['w'] for p in clients],
+        'capacity_dc': [p['w'] for p in dcs],
+        'dc_fixed_cost_list': [p['custo_fixo'] for p in dcs],
+        'transport_cost_per_km': 0.13,
+        'factory_names': point_names(factories),
+        'dc_names': dc_names,
+        'dc_force_map': {},
+        'factory_min_util_map': {},
+        'client_points': [{'lat': p['lat'], 'lng': p['lng']} for p in clients],
+        'dc_points': [{'lat': p['lat'], 'lng': p['lng']} for p in dcs],
+    }
+
+
+def write_scenario(scenario, matrices, out_dir, name):
+    """ Escreve <nome>.json e as duas matrizes .npz (formato de matrix_store). Devolve os caminhos. """
+    os.makedirs(out_dir, exist_ok=True)
+    dc_names = point_names(scenario['distribution_centers'])
+    paths = [os.path.join(out_dir, f"{name}.json")]
+    with open(paths[0], 'w', encoding='utf-8') as f:
+        json.dump(scenario, f, ensure_ascii=False)
+    for kind, km in zip(('factories', 'clients'), matrices):
+        paths.append(os.path.join(out_dir, f"{name}_{kind}.npz"))
+        with open(paths[-1], 'wb') as f:
+            f.write(matrix_store.pack_matrix(km, point_names(scenario[kind]), dc_names))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de redes sintéticas (formato dos presets)")
+    parser.add_argument('--factories', type=int, default=10)
+    parser.add_argument('--dcs', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=20000)
+    parser.add_argument('--cities', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--detour-factor', type=float, default=distance_providers.DEFAULT_DETOUR_FACTOR)
+    parser.add_argument('--name', default=None)
+    parser.add_argument('--out-dir', default='.')
+    args = parser.parse_args()
+
+    scenario = generate_scenario(args.factories, args.dcs, args.clients, args.seed, args.cities)
+    matrices = cost_matrices(scenario, args.detour_factor)
+    name = args.name or f"synth_{args.factories}x{args.dcs}x{args.clients}_s{args.seed}"
+    for path in write_scenario(scenario, matrices, args.out_dir, name):
+        print(f"✅ {path}")
+
+
+if __name__ == '__main__':
+    main()
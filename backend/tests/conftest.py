@@ -0,0 +1,8 @@
+# backend/tests/conftest.py
+# Os módulos do backend importam-se pelo nome (import logic, import solver_algorithm...),
+# como quando a app corre a partir de backend/.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
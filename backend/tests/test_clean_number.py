@@ -0,0 +1,69 @@
+# backend/tests/test_clean_number.py
+# clean_number_array tem de devolver exatamente (bit a bit, NaN incluído) o que
+# clean_number devolve célula a célula, seja qual for o lixo que venha nas matrizes.
+
+import random
+
+import numpy as np
+import pytest
+
+from solver_algorithm import clean_number, clean_number_array
+
+ALFABETO = '0123456789' * 3 + '..,,- e€km\x00٣²'
+ESPECIAIS = [None, True, False, 0, -7, 2 ** 70, 1.5, -2.25, float('nan'), float('inf'), float('-inf'),
+             np.float64(3.5), np.float32(90.7), np.int64(-5), np.bool_(True), '', ' ', '.', ',', '..', '1.2.3',
+             '1.000,50', '1,000.50', ' 42 ', '-3', '1e5', 'nan', 'inf', '-inf', 'NaN', '9' * 400, '0' * 30 + '1',
+             '1' + '0' * 308 + ',5', '\ud800', [1]]
+
+
+def random_messy_values(n, seed):
+    """ Números, texto com separadores de milhares/decimais, espaços, lixo e tipos raros. """
+    rng = random.Random(seed)
+    valores = []
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.05:
+            valores.append(rng.choice(ESPECIAIS))
+        elif r < 0.25:
+            valores.append(rng.choice([rng.uniform(-1e6, 1e6), rng.randint(-10 ** 6, 10 ** 6)]))
+        elif r < 0.6:
+            # '1.234.567,89' (formato português)
+            valores.append(f"{rng.uniform(0, 1e6):,.{rng.randint(0, 3)}f}".replace(',', ' ').replace('.', ',').replace(' ', '.'))
+        else:
+            valores.append(''.join(rng.choice(ALFABETO) for _ in range(rng.randint(0, 12))))
+    return valores
+
+
+def assert_bit_exact(valores):
+    esperado = np.array([clean_number(v) for v in valores], dtype=np.float64)
+    obtido = clean_number_array(valores)
+    assert obtido.dtype == np.float64 and obtido.shape == esperado.shape
+    diferentes = np.flatnonzero(esperado.view(np.int64) != obtido.view(np.int64))
+    assert not len(diferentes), [(valores[i], esperado[i], obtido[i]) for i in diferentes[:10]]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_scalar_on_random_messy_values(seed):
+    assert_bit_exact(random_messy_values(20000, seed))
+
+
+@pytest.mark.parametrize('valor', ESPECIAIS, ids=repr)
+def test_matches_scalar_on_each_edge_case(valor):
+    assert_bit_exact([valor])
+    # Também misturado com texto "limpo", que segue pelo caminho em bloco
+    assert_bit_exact(['1.234,5', valor, '7'])
+
+
+def test_only_strings_and_only_numbers():
+    assert_bit_exact(['1.000,50', '12', '', '3,'])
+    assert_bit_exact([1, 2.5, float('nan'), np.float32(0.1), True])
+    assert clean_number_array([]).shape == (0,)
+
+
+def test_integer_overflow_raises_like_scalar():
+    with pytest.raises(OverflowError):
+        clean_number(10 ** 400)
+    with pytest.raises(OverflowError):
+        clean_number_array([10 ** 400])
+    with pytest.raises(OverflowError):
+        clean_number_array(['1,5', 10 ** 400])
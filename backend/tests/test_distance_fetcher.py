@@ -0,0 +1,109 @@
+# backend/tests/test_distance_fetcher.py
+# Busca da Distance Matrix em blocos, sem rede: StubDistanceClient no lugar da Google.
+
+import random
+
+import googlemaps
+import numpy as np
+import pytest
+
+import distance_fetcher
+from distance_fetcher import (MAX_DESTINATIONS, MAX_ELEMENTS, MAX_ORIGINS, StubDistanceClient,
+                              fetch_distance_matrix, plan_tiles)
+
+
+def random_points(n, seed):
+    rng = random.Random(seed)
+    return [{'lat': 37 + rng.random() * 5, 'lng': -9 + rng.random() * 5} for _ in range(n)]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """ Sem esperas reais no backoff; devolve a lista das esperas pedidas (os testes usam um débito alto). """
+    waits = []
+    # O stub também dorme a sua latência (0 nos testes): só contam as esperas reais
+    monkeypatch.setattr(distance_fetcher.time, 'sleep', lambda s: s > 0 and waits.append(s))
+    return waits
+
+
+@pytest.mark.parametrize('n_origins, n_destinations', [
+    (1, 1), (25, 4), (4, 25), (30, 30), (101, 1), (1, 101), (120, 3), (3, 120), (130, 400), (200, 7),
+])
+def test_plan_tiles_respects_api_limits_and_covers_every_pair_once(n_origins, n_destinations):
+    tiles = plan_tiles(n_origins, n_destinations)
+    covered = np.zeros((n_origins, n_destinations), dtype=np.int64)
+    for o0, o1, d0, d1 in tiles:
+        assert 0 < o1 - o0 <= MAX_ORIGINS
+        assert 0 < d1 - d0 <= MAX_DESTINATIONS
+        assert (o1 - o0) * (d1 - d0) <= MAX_ELEMENTS
+        covered[o0:o1, d0:d1] += 1
+    assert (covered == 1).all()
+
+
+def test_plan_tiles_uses_the_minimum_number_of_full_tiles():
+    # 120 CDs × 3 fábricas: blocos de 25 × 3 (75 elementos) -> 5 pedidos
+    assert len(plan_tiles(120, 3)) == 5
+    # 10 × 10 = 100 elementos cabem num só pedido
+    assert len(plan_tiles(10, 10)) == 1
+    assert plan_tiles(0, 5) == [] and plan_tiles(5, 0) == []
+
+
+class FlakyClient:
+    """ Falha as primeiras 'failures' chamadas com o erro dado e depois responde como o stub. """
+
+    def __init__(self, failures, error='OVER_QUERY_LIMIT'):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+        self.stub = StubDistanceClient(latency_s=0)
+
+    def distance_matrix(self, origins, destinations, mode="driving"):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise googlemaps.exceptions.ApiError(self.error)
+        return self.stub.distance_matrix(origins, destinations, mode)
+
+
+def test_over_query_limit_is_retried_with_exponential_backoff(sleeps):
+    client = FlakyClient(failures=3)
+    origins, destinations = random_points(2, 1), random_points(3, 2)
+    result = fetch_distance_matrix(client, origins, destinations, max_retries=5, backoff_s=0.5,
+                                   elements_per_second=1e9)
+    assert client.calls == 4
+    assert [e['status'] for row in result['rows'] for e in row['elements']] == ['OK'] * 6
+    # Espera da tentativa a: backoff × 2^a × (1 + jitter), com jitter em [0, 1)
+    assert len(sleeps) == 3
+    for attempt, wait in enumerate(sleeps):
+        assert 0.5 * 2 ** attempt <= wait < 0.5 * 2 ** (attempt + 1)
+
+
+def test_retries_give_up_after_max_retries(sleeps):
+    client = FlakyClient(failures=10)
+    with pytest.raises(googlemaps.exceptions.ApiError):
+        fetch_distance_matrix(client, random_points(1, 1), random_points(1, 2), max_retries=2, backoff_s=0.1,
+                              elements_per_second=1e9)
+    assert client.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_non_retriable_errors_are_not_retried(sleeps):
+    client = FlakyClient(failures=1, error='REQUEST_DENIED')
+    with pytest.raises(googlemaps.exceptions.ApiError):
+        fetch_distance_matrix(client, random_points(1, 1), random_points(1, 2), max_retries=5,
+                              elements_per_second=1e9)
+    assert client.calls == 1
+    assert sleeps == []
+
+
+def test_tiled_parallel_matrix_equals_serial_matrix(sleeps):
+    origins, destinations = random_points(60, 3), random_points(130, 4)
+    stub = StubDistanceClient(latency_s=0)
+    serial = [[stub.distance_matrix([o], [d])['rows'][0]['elements'][0] for d in destinations] for o in origins]
+
+    # Blocos em paralelo, com erros transitórios pelo meio
+    flaky = StubDistanceClient(latency_s=0, failure_rate=0.2, seed=7)
+    stats = {}
+    tiled = fetch_distance_matrix(flaky, origins, destinations, workers=8, elements_per_second=1e9,
+                                  max_retries=20, backoff_s=0.01, stats=stats)
+    assert stats['tiles'] == len(plan_tiles(len(origins), len(destinations)))
+    assert [row['elements'] for row in tiled['rows']] == serial
@@ -0,0 +1,57 @@
+# backend/tests/test_logic.py
+# Weiszfeld Haversine em lote (motor de /calculate-gravity-by-country): passo acelerado e arranque a quente.
+
+import numpy as np
+import pytest
+
+import logic
+
+
+def random_rows(n, n_groups, seed):
+    rng = np.random.default_rng(seed)
+    return [(f"G{rng.integers(0, n_groups)}", 37 + rng.random() * 5, -9 + rng.random() * 5, float(rng.integers(1, 100)))
+            for _ in range(n)]
+
+
+def test_grouped_matches_plain_weiszfeld_per_group():
+    rows = random_rows(3000, 6, seed=1)
+    results = logic.calculate_gravity_by_group(rows)
+    for key, result in results.items():
+        points = [{'lat': lat, 'lng': lng, 'w': w} for g, lat, lng, w in rows if g == key]
+        _, plain_cost, _ = logic.calculate_weiszfeld_haversine_np(points, logic.LOG_OFF)
+        assert result['converged']
+        assert result['total_cost'] <= plain_cost * (1 + 1e-6)
+        assert result['client_count'] == len(points)
+
+
+def test_accelerated_step_needs_fewer_iterations_than_plain():
+    rows = random_rows(20000, 40, seed=1)
+    accelerated = logic.calculate_gravity_by_group(rows)
+    lista_lat, lista_lng, lista_w = logic.points_to_arrays([{'lat': r[1], 'lng': r[2], 'w': r[3]} for r in rows])
+    chaves, grupos = np.unique(np.array([r[0] for r in rows]), return_inverse=True)
+    *_, plain_iterations, _, _ = logic.calculate_weiszfeld_haversine_grouped(
+        lista_lat, lista_lng, lista_w, grupos, len(chaves), relaxation=1)
+    assert sum(r['iterations'] for r in accelerated.values()) < plain_iterations.sum()
+
+
+def test_warm_start_from_previous_results_after_small_edits():
+    rows = random_rows(20000, 40, seed=1)
+    previous = logic.calculate_gravity_by_group(rows)
+    edited = [(g, lat + (0.05 if i % 100 == 0 else 0), lng, w) for i, (g, lat, lng, w) in enumerate(rows)]
+    cold = logic.calculate_gravity_by_group(edited)
+    warm = logic.calculate_gravity_by_group(edited, {k: v['final_point'] for k, v in previous.items()})
+    assert sum(r['iterations'] for r in warm.values()) < sum(r['iterations'] for r in cold.values()) / 2
+    for key in cold:
+        assert warm[key]['converged']
+        assert warm[key]['total_cost'] == pytest.approx(cold[key]['total_cost'], rel=1e-5)
+
+
+def test_optimum_on_a_demand_point_uses_vardi_zhang():
+    rows = [('D', 40.0, -8.0, 100.0), ('D', 41.0, -8.0, 1.0), ('D', 40.5, -7.0, 1.0), ('S', 38.0, -9.0, 5.0)]
+    results = logic.calculate_gravity_by_group(rows, {'D': {'lat': 40.0, 'lng': -8.0}})
+    assert results['D']['final_point'] == {'lat': 40.0, 'lng': -8.0}
+    assert results['D']['iterations'] == 1
+    # O custo é o dos outros clientes até ao ponto ótimo, não zero
+    assert results['D']['total_cost'] > 0
+    assert results['S'] == {'final_point': {'lat': 38.0, 'lng': -9.0}, 'total_cost': 0.0, 'client_count': 1,
+                            'iterations': 1, 'converged': True}
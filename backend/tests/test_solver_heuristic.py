@@ -0,0 +1,68 @@
+# backend/tests/test_solver_heuristic.py
+# Avaliação de um conjunto de CDs (solve_fixed_dcs): os fluxos devolvidos são sempre inteiros.
+
+import numpy as np
+
+import solver_heuristic
+from benchmarks import random_network
+from solver_algorithm import prepare_network_inputs, presolve_network, solve_prepared_network
+from solver_matrix import build_network_matrices, is_feasible
+
+
+def network_model(seed=3):
+    inp = prepare_network_inputs(random_network(3, 8, 60, seed=seed))
+    pre = presolve_network(inp['costs_dc_client'], inp['supply_factory'], inp['demand_client'],
+                           inp['capacity_dc'], inp['dc_names'], inp['dc_force_map'])
+    return build_network_matrices(inp, pre)
+
+
+def fractional_linprog(monkeypatch, model):
+    """ O LP devolve a média de dois vértices (custos diferentes): admissível mas fracionária. """
+    original = solver_heuristic._linprog
+
+    def media(c, *args):
+        rng = np.random.default_rng(0)
+        a, b = original(c, *args), original(c * rng.uniform(0.5, 1.5, len(c)), *args)
+        a.x = (a.x + b.x) / 2
+        return a
+
+    monkeypatch.setattr(solver_heuristic, '_linprog', media)
+
+
+def test_fractional_lp_flows_are_repaired_to_integers(monkeypatch):
+    model = network_model()
+    open_dc = np.ones(model['shape'][1], dtype=bool)
+    exato, _ = solver_heuristic.solve_fixed_dcs(model, open_dc)
+    fractional_linprog(monkeypatch, model)
+    x, precos = solver_heuristic.solve_fixed_dcs(model, open_dc)
+    assert x is not None and precos is not None
+    assert np.array_equal(x, np.round(x))
+    assert is_feasible(model, x)
+    assert model['c'] @ x >= model['c'] @ exato - 1e-6
+
+
+def test_unrepairable_flows_mark_the_candidate_infeasible(monkeypatch):
+    model = network_model()
+    k = model['row_kind'] == 'K'
+    model['rhs'] = model['rhs'].copy()
+    model['rhs'][np.flatnonzero(k)[0]] += 0.5  # procura fracionária: nenhum fluxo inteiro a satisfaz
+    x, precos = solver_heuristic.solve_fixed_dcs(model, np.ones(model['shape'][1], dtype=bool))
+    assert x is None and precos is None
+
+
+def test_fractional_minimum_utilisation_is_rounded_up():
+    # 90% da oferta da primeira fábrica = 3910,5 unidades: o LP sai fracionário e a
+    # reparação tem de levar a fábrica a 3911 unidades
+    data = random_network(5, 20, 150, seed=1)
+    data['factory_min_util_map'] = {data['factory_names'][0]: 0.9}
+    inp = prepare_network_inputs(data)
+    pre = presolve_network(inp['costs_dc_client'], inp['supply_factory'], inp['demand_client'],
+                           inp['capacity_dc'], inp['dc_names'], inp['dc_force_map'])
+    model = build_network_matrices(inp, pre)
+    x, _ = solver_heuristic.solve_fixed_dcs(model, np.ones(model['shape'][1], dtype=bool))
+    assert x is not None
+    assert np.array_equal(x, np.round(x)) and is_feasible(model, x)
+    assert x[model['ny']:model['ny'] + model['nx']][model['li'] == 0].sum() >= 3911
+
+    status, custo, *_ = solve_prepared_network(inp, {'solver_mode': 'heuristic'})
+    assert status == 'Feasible' and custo > 0
@@ -0,0 +1,26 @@
+# backend/tests/test_solver_matrix.py
+# Leitura do ficheiro -solution do CBC (backend matricial).
+
+import pytest
+
+from solver_matrix import read_cbc_solution
+
+COLUNAS = "      0 Y0                       1                       0\n      1 X0_0                   2.5                       0\n"
+
+
+@pytest.mark.parametrize('first, status', [
+    ("Optimal - objective value 123.00000000", 'Optimal'),
+    ("Stopped on time - objective value 123.00000000", 'Feasible'),
+    ("Stopped on iterations - objective value 123.00000000", 'Feasible'),
+    # Sem solução inteira o CBC escreve a relaxação linear: não é uma incumbente
+    ("Stopped on time (no integer solution - continuous used) - objective value 98.50000000", 'Not Solved'),
+    ("Infeasible - objective value 0.00000000", 'Infeasible'),
+    ("Integer infeasible - objective value 0.00000000", 'Infeasible'),
+    ("", 'Undefined'),
+])
+def test_status_from_first_line(tmp_path, first, status):
+    path = tmp_path / "model.sol"
+    path.write_text(first + "\n" + COLUNAS)
+    lido, values = read_cbc_solution(str(path), 2)
+    assert lido == status
+    assert values.tolist() == [1.0, 2.5]